@@ -0,0 +1,122 @@
+"""Measure concurrent throughput of a single proxy worker.
+
+Start the fake upstream and one proxy worker pointed at it, then drive
+/v1/chat/completions at a fixed concurrency:
+
+    python benchmarks/fake_upstream.py --port 9000 --latency 1.0
+    CONFIG_PATH=benchmarks/config.yaml python main.py --port 8000 --workers 1
+    python benchmarks/concurrency_bench.py --concurrency 200 --requests 1000
+
+Run it once against the current tree and once against an older checkout to
+compare; with a 1s upstream the ideal throughput is `concurrency` req/s.
+With --stream, time to first token is reported as well. benchmarks/load_test.py
+runs this across models and modes.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from collections import Counter
+
+import httpx
+
+WEATHER_TOOL = {"type": "function", "function": {
+    "name": "get_weather", "description": "Current weather for a city.",
+    "parameters": {"type": "object", "properties": {"city": {"type": "string"}}, "required": ["city"]}}}
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(p * len(values)))] if values else None
+
+
+async def run(url: str, model: str, concurrency: int, total: int, timeout: float, unique: bool = False,
+              prompt_chars: int = 0, stream: bool = False, tools: bool = False) -> dict:
+    padding = "x" * prompt_chars
+    latencies = []
+    first_tokens = []
+    statuses = Counter()
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+
+    async def send(client: httpx.AsyncClient, payload: dict, start: float):
+        if not stream:
+            response = await client.post(url, json=payload)
+            statuses[response.status_code] += 1
+            response.raise_for_status()
+            return None
+        first_token = None
+        async with client.stream("POST", url, json=payload) as response:
+            statuses[response.status_code] += 1
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if first_token is None and line.startswith("data: {"):
+                    first_token = time.perf_counter() - start
+        return first_token
+
+    async def worker(client: httpx.AsyncClient):
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            # Distinct prompts keep identical requests from being coalesced
+            payload = {"model": model, "messages": [{"role": "user", "content": (f"ping {i}" if unique else "ping") + padding}]}
+            if stream:
+                payload["stream"] = True
+            if tools:
+                payload["tools"] = [WEATHER_TOOL]
+            start = time.perf_counter()
+            try:
+                first_token = await send(client, payload, start)
+                latencies.append(time.perf_counter() - start)
+                if first_token is not None:
+                    first_tokens.append(first_token)
+            except httpx.HTTPStatusError:
+                pass
+            except httpx.HTTPError:
+                statuses["transport_error"] += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    first_tokens.sort()
+    result = {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": total - len(latencies),
+        "statuses": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "latency_mean_s": round(statistics.mean(latencies), 4) if latencies else None,
+        "latency_p50_s": percentile(latencies, 0.50),
+        "latency_p95_s": percentile(latencies, 0.95),
+        "latency_p99_s": percentile(latencies, 0.99),
+    }
+    if stream:
+        result.update(ttft_p50_s=percentile(first_tokens, 0.50), ttft_p95_s=percentile(first_tokens, 0.95),
+                      ttft_p99_s=percentile(first_tokens, 0.99))
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000/v1/chat/completions")
+    parser.add_argument("--model", default="openai/fake-model")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--unique", action="store_true", help="Send a different prompt with every request")
+    parser.add_argument("--prompt-chars", type=int, default=0, help="Pad each prompt to roughly this size")
+    parser.add_argument("--stream", action="store_true", help="Stream responses and report time to first token")
+    parser.add_argument("--tools", action="store_true", help="Send a tool definition with every request")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.url, args.model, args.concurrency, args.requests, args.timeout, args.unique,
+                             args.prompt_chars, args.stream, args.tools))
+    print(json.dumps(result, indent=2))
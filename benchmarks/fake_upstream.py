@@ -0,0 +1,558 @@
+"""Local stand-in for every upstream API the proxy talks to.
+
+Answers chat completions in the shape of each provider the proxy routes to,
+so the proxy can be measured without Vertex access or a network:
+
+- OpenAI-compatible `/v1/chat/completions` and `/v1/embeddings`
+- Gemini on Vertex: any `...:generateContent` / `...:streamGenerateContent` URL,
+  plus `cachedContents` (point `context_cache.api_base` and a deployment's
+  `api_base` at it)
+- Claude on Vertex: any `...:rawPredict` / `...:streamRawPredict` URL
+- Ollama `/api/generate` and `/api/chat`, holding one model loaded at a time;
+  switching models costs `--ollama-load-seconds`
+- An OAuth token endpoint for a fake service account (`--credentials`)
+
+Every reply, streamed or not, waits a time-to-first-token drawn from the
+latency distribution, then `--tokens` tokens spaced `--token-interval`
+apart. Requests that send tools get a call to the first tool back, unless
+the conversation already ends with a tool result. `--rate-429` and
+`--rate-500` fail that share of requests in the provider's error format.
+Settings can be changed at runtime with `POST /config`; counts are at /stats:
+
+    python benchmarks/fake_upstream.py --port 9000 --latency 0.5 --latency-dist lognormal \\
+        --tokens 50 --token-interval 0.02 --rate-429 0.05
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from collections import Counter
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI()
+app.state.settings = {
+    "latency": 1.0,  # mean seconds to the first token
+    "latency_dist": "fixed",  # fixed | uniform | exponential | lognormal
+    "latency_spread": 0.5,  # uniform: +/- this fraction of latency; lognormal: sigma
+    "tokens": 6,  # completion tokens per reply
+    "token_interval": 0.0,  # seconds between streamed tokens
+    "rate_429": 0.0,
+    "rate_500": 0.0,
+    "retry_after": 1,
+    "ollama_load_seconds": 0.0,  # time for Ollama to swap in a model that isn't loaded
+}
+app.state.requests = Counter()
+app.state.injected = Counter()
+app.state.embedding_calls = 0
+app.state.cached_contents = {}
+app.state.cache_stats = {"created": 0, "refreshed": 0, "deleted": 0, "generate_calls": 0, "cached_calls": 0}
+app.state.ollama = {"loaded": None, "in_flight": 0, "swap": asyncio.Lock()}
+
+WORDS = ("This is a fake completion from the local upstream used for proxy benchmarks and tests. " * 8).split()
+PROMPT_TOKENS = 10
+
+
+def sample_latency() -> float:
+    settings = app.state.settings
+    mean, spread = settings["latency"], settings["latency_spread"]
+    dist = settings["latency_dist"]
+    if mean <= 0:
+        return 0.0
+    if dist == "uniform":
+        return random.uniform(mean * (1 - spread), mean * (1 + spread))
+    if dist == "exponential":
+        return random.expovariate(1 / mean)
+    if dist == "lognormal":
+        return random.lognormvariate(0, spread) * mean
+    return mean
+
+
+def completion_words():
+    count = max(1, int(app.state.settings["tokens"]))
+    return [WORDS[i % len(WORDS)] for i in range(count)]
+
+
+async def generate_text():
+    """Yields (index, word) on the configured schedule."""
+    await asyncio.sleep(sample_latency())
+    interval = app.state.settings["token_interval"]
+    for i, word in enumerate(completion_words()):
+        if i and interval:
+            await asyncio.sleep(interval)
+        yield i, word if i == 0 else " " + word
+
+
+async def full_text() -> str:
+    return "".join([word async for _, word in generate_text()])
+
+
+def injected_fault():
+    """(status, message) for a request chosen to fail, else None."""
+    settings = app.state.settings
+    draw = random.random()
+    if draw < settings["rate_429"]:
+        status = 429
+    elif draw < settings["rate_429"] + settings["rate_500"]:
+        status = 500
+    else:
+        return None
+    app.state.injected[status] += 1
+    return status, "Resource exhausted, please retry later." if status == 429 else "Internal error."
+
+
+def fault_response(status: int, body: dict) -> JSONResponse:
+    headers = {"Retry-After": str(app.state.settings["retry_after"])} if status == 429 else None
+    return JSONResponse(body, status_code=status, headers=headers)
+
+
+def tool_arguments(schema: dict) -> dict:
+    """Arguments that satisfy the required properties of a JSON schema."""
+    samples = {"string": "fake", "integer": 1, "number": 1.0, "boolean": True, "array": [], "object": {}}
+    properties = (schema or {}).get("properties") or {}
+    return {name: samples.get((properties.get(name) or {}).get("type"), "fake")
+            for name in (schema or {}).get("required") or []}
+
+
+def sse(data: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+def usage_counts():
+    completion = len(completion_words())
+    return PROMPT_TOKENS, completion
+
+
+# OpenAI-compatible
+
+def openai_tool_call(body: dict):
+    tools = body.get("tools") or []
+    messages = body.get("messages") or []
+    if not tools or (messages and messages[-1].get("role") == "tool"):
+        return None
+    function = tools[0].get("function") or {}
+    return {"id": f"call_{uuid.uuid4().hex[:12]}", "type": "function",
+            "function": {"name": function.get("name", "tool"),
+                         "arguments": json.dumps(tool_arguments(function.get("parameters")))}}
+
+
+async def openai_stream(body: dict, tool_call):
+    base = {"id": f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion.chunk",
+            "created": int(time.time()), "model": body.get("model", "fake-model")}
+
+    def chunk(delta, finish_reason=None):
+        return sse({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]})
+
+    if tool_call is not None:
+        await asyncio.sleep(sample_latency())
+        yield chunk({"role": "assistant", "tool_calls": [
+            {"index": 0, **tool_call, "function": {"name": tool_call["function"]["name"], "arguments": ""}}]})
+        yield chunk({"tool_calls": [{"index": 0, "function": {"arguments": tool_call["function"]["arguments"]}}]})
+        yield chunk({}, "tool_calls")
+    else:
+        async for i, word in generate_text():
+            yield chunk({"role": "assistant", "content": word} if i == 0 else {"content": word})
+        yield chunk({}, "stop")
+    if (body.get("stream_options") or {}).get("include_usage"):
+        prompt, completion = usage_counts()
+        yield sse({**base, "choices": [], "usage": {"prompt_tokens": prompt, "completion_tokens": completion,
+                                                    "total_tokens": prompt + completion}})
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+@app.post("/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    app.state.requests["openai"] += 1
+    fault = injected_fault()
+    if fault is not None:
+        status, message = fault
+        return fault_response(status, {"error": {"message": message, "type": "server_error", "code": status}})
+
+    tool_call = openai_tool_call(body)
+    if body.get("stream"):
+        return StreamingResponse(openai_stream(body, tool_call), media_type="text/event-stream")
+
+    if tool_call is not None:
+        await asyncio.sleep(sample_latency())
+        message, finish_reason = {"role": "assistant", "content": None, "tool_calls": [tool_call]}, "tool_calls"
+    else:
+        message, finish_reason = {"role": "assistant", "content": await full_text()}, "stop"
+    prompt, completion = usage_counts()
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake-model"),
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion},
+    }
+
+
+@app.post("/v1/embeddings")
+@app.post("/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    app.state.requests["embeddings"] += 1
+    fault = injected_fault()
+    if fault is not None:
+        status, message = fault
+        return fault_response(status, {"error": {"message": message, "type": "server_error", "code": status}})
+
+    texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    await asyncio.sleep(sample_latency())
+    dimensions = body.get("dimensions") or 8
+    app.state.embedding_calls += 1
+    return {
+        "object": "list",
+        "data": [{"object": "embedding", "index": i,
+                  "embedding": [(len(text) + j) / 100 for j in range(dimensions)]}
+                 for i, text in enumerate(texts)],
+        "model": body.get("model", "fake-model"),
+        "usage": {"prompt_tokens": sum(len(t) for t in texts) // 4 + 1,
+                  "total_tokens": sum(len(t) for t in texts) // 4 + 1},
+    }
+
+
+# Gemini on Vertex
+
+@app.post("/v1beta1/projects/{project}/locations/{location}/cachedContents")
+async def create_cached_content(project: str, location: str, request: Request):
+    body = await request.json()
+    name = f"projects/{project}/locations/{location}/cachedContents/{uuid.uuid4().hex[:12]}"
+    app.state.cached_contents[name] = {**body, "name": name}
+    app.state.cache_stats["created"] += 1
+    return app.state.cached_contents[name]
+
+
+@app.patch("/v1beta1/projects/{project}/locations/{location}/cachedContents/{cache_id}")
+async def update_cached_content(project: str, location: str, cache_id: str, request: Request):
+    name = f"projects/{project}/locations/{location}/cachedContents/{cache_id}"
+    if name not in app.state.cached_contents:
+        return JSONResponse({"error": {"code": 404, "message": f"{name} not found"}}, status_code=404)
+    app.state.cached_contents[name].update(await request.json())
+    app.state.cache_stats["refreshed"] += 1
+    return app.state.cached_contents[name]
+
+
+@app.delete("/v1beta1/projects/{project}/locations/{location}/cachedContents/{cache_id}")
+async def delete_cached_content(project: str, location: str, cache_id: str):
+    app.state.cached_contents.pop(f"projects/{project}/locations/{location}/cachedContents/{cache_id}", None)
+    app.state.cache_stats["deleted"] += 1
+    return {}
+
+
+def gemini_function_call(body: dict):
+    declarations = [d for tool in body.get("tools") or []
+                    for d in tool.get("functionDeclarations") or tool.get("function_declarations") or []]
+    contents = body.get("contents") or []
+    last_parts = (contents[-1].get("parts") or []) if contents else []
+    if not declarations or any("functionResponse" in part for part in last_parts):
+        return None
+    return {"name": declarations[0]["name"], "args": tool_arguments(declarations[0].get("parameters"))}
+
+
+async def gemini(body: dict, stream: bool):
+    app.state.cache_stats["generate_calls"] += 1
+    cached_tokens = 0
+    name = body.get("cachedContent")
+    if name is not None:
+        cached = app.state.cached_contents.get(name)
+        if cached is None:
+            return JSONResponse({"error": {"code": 404, "message": f"{name} not found"}}, status_code=404)
+        app.state.cache_stats["cached_calls"] += 1
+        cached_tokens = len(json.dumps(cached)) // 4
+
+    prompt_tokens = len(json.dumps(body)) // 4 + cached_tokens
+    completion_tokens = len(completion_words())
+
+    def usage(completion: int):
+        return {"promptTokenCount": prompt_tokens, "candidatesTokenCount": completion,
+                "totalTokenCount": prompt_tokens + completion, "cachedContentTokenCount": cached_tokens}
+
+    function_call = gemini_function_call(body)
+    if not stream:
+        if function_call is not None:
+            await asyncio.sleep(sample_latency())
+            parts = [{"functionCall": function_call}]
+        else:
+            parts = [{"text": await full_text()}]
+        return {"candidates": [{"content": {"role": "model", "parts": parts}, "finishReason": "STOP"}],
+                "usageMetadata": usage(completion_tokens)}
+
+    async def chunks():
+        if function_call is not None:
+            await asyncio.sleep(sample_latency())
+            yield sse({"candidates": [{"content": {"role": "model", "parts": [{"functionCall": function_call}]},
+                                       "finishReason": "STOP"}], "usageMetadata": usage(completion_tokens)})
+            return
+        words = completion_words()
+        async for i, word in generate_text():
+            candidate = {"content": {"role": "model", "parts": [{"text": word}]}}
+            if i == len(words) - 1:
+                candidate["finishReason"] = "STOP"
+            yield sse({"candidates": [candidate], "usageMetadata": usage(i + 1)})
+
+    return StreamingResponse(chunks(), media_type="text/event-stream")
+
+
+# Claude on Vertex
+
+def claude_tool_use(body: dict):
+    tools = body.get("tools") or []
+    messages = body.get("messages") or []
+    last = messages[-1].get("content") if messages else None
+    if not tools or (isinstance(last, list) and any(block.get("type") == "tool_result" for block in last)):
+        return None
+    return {"type": "tool_use", "id": f"toolu_{uuid.uuid4().hex[:12]}", "name": tools[0]["name"],
+            "input": tool_arguments(tools[0].get("input_schema"))}
+
+
+async def claude(body: dict, stream: bool):
+    message_id = f"msg_{uuid.uuid4().hex[:12]}"
+    model = body.get("model", "claude-fake")
+    prompt, completion = usage_counts()
+    tool_use = claude_tool_use(body)
+    stop_reason = "tool_use" if tool_use is not None else "end_turn"
+    if not stream:
+        if tool_use is not None:
+            await asyncio.sleep(sample_latency())
+            content = [tool_use]
+        else:
+            content = [{"type": "text", "text": await full_text()}]
+        return {"id": message_id, "type": "message", "role": "assistant", "model": model, "content": content,
+                "stop_reason": stop_reason, "stop_sequence": None,
+                "usage": {"input_tokens": prompt, "output_tokens": completion}}
+
+    async def events():
+        yield sse({"type": "message_start", "message": {
+            "id": message_id, "type": "message", "role": "assistant", "model": model, "content": [],
+            "stop_reason": None, "stop_sequence": None, "usage": {"input_tokens": prompt, "output_tokens": 0}}},
+            "message_start")
+        if tool_use is not None:
+            await asyncio.sleep(sample_latency())
+            yield sse({"type": "content_block_start", "index": 0, "content_block": {**tool_use, "input": {}}},
+                      "content_block_start")
+            yield sse({"type": "content_block_delta", "index": 0, "delta": {
+                "type": "input_json_delta", "partial_json": json.dumps(tool_use["input"])}}, "content_block_delta")
+        else:
+            yield sse({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}},
+                      "content_block_start")
+            async for _, word in generate_text():
+                yield sse({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": word}},
+                          "content_block_delta")
+        yield sse({"type": "content_block_stop", "index": 0}, "content_block_stop")
+        yield sse({"type": "message_delta", "delta": {"stop_reason": stop_reason, "stop_sequence": None},
+                   "usage": {"output_tokens": completion}}, "message_delta")
+        yield sse({"type": "message_stop"}, "message_stop")
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# Ollama
+
+def ollama_done(model: str, text: str = "", message: dict = None) -> dict:
+    prompt, completion = usage_counts()
+    done = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "done": True,
+            "done_reason": "stop", "prompt_eval_count": prompt, "eval_count": completion}
+    if message is not None:
+        done["message"] = message
+    else:
+        done["response"] = text
+    return done
+
+
+async def ollama(body: dict, chat: bool):
+    model = body.get("model", "fake-model")
+    messages = body.get("messages") or []
+    tool_call = json_reply = None
+    if chat and body.get("tools") and not (messages and messages[-1].get("role") == "tool"):
+        function = body["tools"][0].get("function") or {}
+        tool_call = {"function": {"name": function.get("name", "tool"),
+                                  "arguments": tool_arguments(function.get("parameters"))}}
+    elif not chat and body.get("format") == "json":
+        # litellm puts the tool schemas in the prompt and expects {"name", "arguments"} back as text
+        found = re.findall(r"""["']name["']:\s*["']([^"']+)["']""", body.get("prompt") or "")
+        names = [name for name in found if name != "function_name"]
+        json_reply = json.dumps({"name": names[0] if names else "tool", "arguments": {}})
+
+    if not body.get("stream", True):
+        if tool_call is not None or json_reply is not None:
+            await asyncio.sleep(sample_latency())
+        if tool_call is not None:
+            return ollama_done(model, message={"role": "assistant", "content": "", "tool_calls": [tool_call]})
+        text = json_reply or await full_text()
+        return ollama_done(model, text, {"role": "assistant", "content": text} if chat else None)
+
+    async def lines():
+        if tool_call is not None:
+            await asyncio.sleep(sample_latency())
+            yield json.dumps(ollama_done(model, message={"role": "assistant", "content": "",
+                                                         "tool_calls": [tool_call]})) + "\n"
+            return
+        if json_reply is not None:
+            await asyncio.sleep(sample_latency())
+            yield json.dumps({"model": model, "done": False, "response": json_reply}) + "\n"
+        else:
+            async for _, word in generate_text():
+                part = {"model": model, "done": False}
+                part.update({"message": {"role": "assistant", "content": word}} if chat else {"response": word})
+                yield json.dumps(part) + "\n"
+        yield json.dumps(ollama_done(model, message={"role": "assistant", "content": ""} if chat else None)) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+async def load_ollama_model(model: str):
+    """Like Ollama with one model slot: a different model waits for the loaded one to go idle, then loads."""
+    state = app.state.ollama
+    async with state["swap"]:
+        if state["loaded"] != model:
+            while state["in_flight"]:
+                await asyncio.sleep(0.005)
+            app.state.requests["ollama_model_loads"] += 1
+            await asyncio.sleep(app.state.settings["ollama_load_seconds"])
+            state["loaded"] = model
+        state["in_flight"] += 1
+
+
+@app.post("/api/generate")
+@app.post("/api/chat")
+async def ollama_route(request: Request):
+    body = await request.json()
+    app.state.requests["ollama"] += 1
+    if "keep_alive" in body:
+        app.state.requests["ollama_keep_alive"] += 1
+    fault = injected_fault()
+    if fault is not None:
+        return fault_response(fault[0], {"error": fault[1]})
+    await load_ollama_model(body.get("model"))
+    try:
+        response = await ollama(body, chat=request.url.path.endswith("/chat"))
+    except BaseException:
+        app.state.ollama["in_flight"] -= 1
+        raise
+    if not isinstance(response, StreamingResponse):
+        app.state.ollama["in_flight"] -= 1
+        return response
+
+    async def done_when_sent(lines):
+        try:
+            async for line in lines:
+                yield line
+        finally:
+            app.state.ollama["in_flight"] -= 1
+
+    response.body_iterator = done_when_sent(response.body_iterator)
+    return response
+
+
+# OAuth token endpoint and control
+
+@app.post("/token")
+async def token():
+    app.state.requests["token"] += 1
+    return {"access_token": f"fake-{uuid.uuid4().hex}", "expires_in": 3600, "token_type": "Bearer"}
+
+
+@app.post("/config")
+async def update_config(request: Request):
+    updates = await request.json()
+    unknown = set(updates) - set(app.state.settings)
+    if unknown:
+        return JSONResponse({"error": f"unknown settings: {sorted(unknown)}"}, status_code=400)
+    app.state.settings.update(updates)
+    return app.state.settings
+
+
+@app.get("/stats")
+async def stats():
+    return {"requests": dict(app.state.requests), "injected": {str(k): v for k, v in app.state.injected.items()},
+            "embedding_calls": app.state.embedding_calls,
+            "cached_contents": len(app.state.cached_contents), **app.state.cache_stats}
+
+
+@app.post("/stats/reset")
+async def reset_stats():
+    app.state.requests.clear()
+    app.state.injected.clear()
+    return {}
+
+
+# Registered last: Vertex URLs end in ":<method>" after a deployment-specific prefix
+@app.post("/{path:path}")
+async def vertex(path: str, request: Request):
+    method = path.rsplit(":", 1)[-1] if ":" in path else ""
+    kind = {"generateContent": "gemini", "streamGenerateContent": "gemini",
+            "rawPredict": "claude", "streamRawPredict": "claude"}.get(method)
+    if kind is None:
+        return JSONResponse({"error": {"code": 404, "message": f"no fake for /{path}"}}, status_code=404)
+
+    body = await request.json()
+    app.state.requests[kind] += 1
+    stream = method.startswith("stream")
+    fault = injected_fault()
+    if fault is not None:
+        status, message = fault
+        if kind == "claude":
+            error_type = "rate_limit_error" if status == 429 else "api_error"
+            return fault_response(status, {"type": "error", "error": {"type": error_type, "message": message}})
+        state = "RESOURCE_EXHAUSTED" if status == 429 else "INTERNAL"
+        return fault_response(status, {"error": {"code": status, "message": message, "status": state}})
+    return await (gemini(body, stream) if kind == "gemini" else claude(body, stream))
+
+
+def write_credentials(path: str, token_uri: str, project: str):
+    """A service account file whose tokens come from this server's /token endpoint."""
+    try:
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                                serialization.NoEncryption()).decode()
+    except ImportError:
+        import rsa  # google-auth's fallback signer
+
+        pem = rsa.newkeys(1024)[1].save_pkcs1().decode()
+    with open(path, "w") as credentials_file:
+        json.dump({"type": "service_account", "project_id": project, "private_key_id": uuid.uuid4().hex,
+                   "private_key": pem, "client_email": f"fake@{project}.iam.gserviceaccount.com",
+                   "client_id": str(uuid.uuid4().int),
+                   "token_uri": token_uri}, credentials_file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=1.0, help="mean seconds to the first token")
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "exponential", "lognormal"], default="fixed")
+    parser.add_argument("--latency-spread", type=float, default=0.5,
+                        help="uniform: +/- fraction of --latency; lognormal: sigma")
+    parser.add_argument("--tokens", type=int, default=6, help="completion tokens per reply")
+    parser.add_argument("--token-interval", type=float, default=0.0, help="seconds between tokens")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--rate-500", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds on injected 429s")
+    parser.add_argument("--ollama-load-seconds", type=float, default=0.0,
+                        help="seconds for the fake Ollama to swap in a model that isn't loaded")
+    parser.add_argument("--credentials", help="write a fake service account file that gets tokens from here")
+    parser.add_argument("--project", default="local-benchmark")
+    args = parser.parse_args()
+
+    app.state.settings.update(
+        latency=args.latency, latency_dist=args.latency_dist, latency_spread=args.latency_spread,
+        tokens=args.tokens, token_interval=args.token_interval, rate_429=args.rate_429, rate_500=args.rate_500,
+        retry_after=args.retry_after, ollama_load_seconds=args.ollama_load_seconds,
+    )
+    if args.credentials:
+        write_credentials(args.credentials, f"http://{args.host}:{args.port}/token", args.project)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,113 @@
+"""Load-test suite: every provider path and mode at a fixed concurrency.
+
+Start the fake upstream with credentials for the Vertex models, and one
+proxy worker on benchmarks/config.yaml, then run the suite:
+
+    python benchmarks/fake_upstream.py --port 9000 --credentials /tmp/fake-credentials.json
+    GOOGLE_APPLICATION_CREDENTIALS=/tmp/fake-credentials.json CONFIG_PATH=benchmarks/config.yaml \\
+        python main.py --port 8000 --workers 1
+    python benchmarks/load_test.py --concurrency 20 --requests 200 --output results.json
+
+Before each scenario the suite sets the fake upstream's latency, token and
+fault settings through its /config endpoint. Each scenario reports
+throughput, p50/p95/p99 latency, time to first token for streams, status
+counts and how many calls reached the upstream. The same requests are also
+sent straight to the fake upstream; the difference in latency percentiles is
+reported as the proxy's overhead.
+"""
+import argparse
+import asyncio
+import json
+
+import httpx
+
+from concurrency_bench import run
+
+# name -> (model, stream, tools, upstream settings on top of the suite's)
+SCENARIOS = {
+    "openai": ("openai/fake-model", False, False, {}),
+    "openai_stream": ("openai/fake-model", True, False, {}),
+    "openai_tools": ("openai/fake-model", False, True, {}),
+    "gemini": ("vertex_ai/gemini-1.5-flash", False, False, {}),
+    "gemini_stream": ("vertex_ai/gemini-1.5-flash", True, False, {}),
+    "gemini_tools": ("vertex_ai/gemini-1.5-flash", False, True, {}),
+    "claude": ("vertex_ai/claude-3-5-sonnet", False, False, {}),
+    "claude_stream": ("vertex_ai/claude-3-5-sonnet", True, False, {}),
+    "ollama": ("ollama/mistral:latest", False, False, {}),
+    "ollama_stream": ("ollama/mistral:latest", True, False, {}),
+    "faults": ("openai/fake-model", False, False, {"rate_429": 0.05, "rate_500": 0.02}),
+}
+OVERHEAD_FIELDS = ("latency_p50_s", "latency_p95_s", "latency_p99_s", "ttft_p50_s", "ttft_p95_s", "ttft_p99_s")
+
+
+async def configure(client: httpx.AsyncClient, upstream: str, settings: dict):
+    response = await client.post(f"{upstream}/config", json=settings)
+    response.raise_for_status()
+    await client.post(f"{upstream}/stats/reset")
+
+
+async def upstream_requests(client: httpx.AsyncClient, upstream: str) -> int:
+    stats = (await client.get(f"{upstream}/stats")).json()
+    return sum(count for kind, count in stats["requests"].items() if kind != "token")
+
+
+async def suite(args) -> dict:
+    settings = {"latency": args.latency, "latency_dist": args.latency_dist, "latency_spread": args.latency_spread,
+                "tokens": args.tokens, "token_interval": args.token_interval, "rate_429": 0.0, "rate_500": 0.0}
+    names = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    proxy_url = f"{args.proxy}/v1/chat/completions"
+
+    async with httpx.AsyncClient(timeout=10) as control:
+        # Direct baselines with the same latency model, one per response shape used
+        await configure(control, args.upstream, settings)
+        baselines = {}
+        for stream, tools in sorted({SCENARIOS[name][1:3] for name in names}):
+            baselines[stream, tools] = await run(f"{args.upstream}/v1/chat/completions", "fake-model",
+                                                 args.concurrency, args.requests, args.timeout, unique=True,
+                                                 stream=stream, tools=tools)
+
+        results = {}
+        for name in names:
+            model, stream, tools, overrides = SCENARIOS[name]
+            await configure(control, args.upstream, {**settings, **overrides})
+            result = await run(proxy_url, model, args.concurrency, args.requests, args.timeout, unique=True,
+                               stream=stream, tools=tools)
+            result["model"] = model
+            result["upstream_requests"] = await upstream_requests(control, args.upstream)
+            baseline = baselines[stream, tools]
+            for field in OVERHEAD_FIELDS:
+                if result.get(field) is not None and baseline.get(field) is not None:
+                    result[field.replace("_s", "_overhead_s", 1)] = round(result[field] - baseline[field], 4)
+            results[name] = result
+
+        await configure(control, args.upstream, settings)
+
+    return {"settings": {**settings, "concurrency": args.concurrency, "requests": args.requests},
+            "direct": {("stream" if stream else "non_stream") + ("_tools" if tools else ""): result
+                       for (stream, tools), result in baselines.items()},
+            "scenarios": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--proxy", default="http://127.0.0.1:8000")
+    parser.add_argument("--upstream", default="http://127.0.0.1:9000")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--scenarios", help=f"comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--latency", type=float, default=0.2, help="upstream mean seconds to the first token")
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "exponential", "lognormal"],
+                        default="lognormal")
+    parser.add_argument("--latency-spread", type=float, default=0.3)
+    parser.add_argument("--tokens", type=int, default=30, help="upstream completion tokens per reply")
+    parser.add_argument("--token-interval", type=float, default=0.01, help="upstream seconds between tokens")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = asyncio.run(suite(args))
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(text + "\n")
+    print(text)
@@ -0,0 +1,220 @@
+"""Open-loop replay of recorded traffic against /v1/chat/completions.
+
+Reads a JSONL file in the batch input format (`{"custom_id", "body", ...}`,
+or bare request bodies), optionally with a `timestamp` per line (epoch
+seconds or ISO 8601). Requests are sent at their scheduled times whether or
+not earlier ones have finished, and latency is measured from the scheduled
+time, so a slow proxy shows up as queueing delay instead of a lower send rate
+(no coordinated omission).
+
+Each comma-separated --speed replays the recorded gaps that many times
+faster; each --rate sends Poisson arrivals at that many requests/s for
+--duration seconds, cycling through the file. Steps run in order. The first
+step whose error rate, p99 latency or throughput shortfall crosses its limit
+is reported as the saturation point:
+
+    python benchmarks/fake_upstream.py --port 9000 --latency 0.2
+    CONFIG_PATH=benchmarks/config.yaml python main.py --port 8000 --workers 1
+    python benchmarks/replay.py benchmarks/sample_traffic.jsonl --speed 1,4,16 --model openai/fake-model
+    python benchmarks/replay.py benchmarks/sample_traffic.jsonl --rate 10,20,40,80 --duration 20
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+import httpx
+
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+
+def parse_timestamp(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def load_requests(path: str, model: str = None, model_map: dict = None):
+    """[(timestamp or None, body)] from a JSONL file; blank and malformed lines are skipped."""
+    requests = []
+    with open(path) as input_file:
+        for line in input_file:
+            try:
+                item = json.loads(line)
+            except ValueError:
+                continue
+            body = item.get("body") if isinstance(item.get("body"), dict) else item
+            if not isinstance(body.get("messages"), list):
+                continue
+            body = {k: v for k, v in body.items() if k != "timestamp"}
+            if model:
+                body["model"] = model
+            elif model_map:
+                body["model"] = model_map.get(body.get("model"), body.get("model"))
+            requests.append((parse_timestamp(item.get("timestamp")), body))
+    return requests
+
+
+def recorded_schedule(requests, speed: float):
+    """Send offsets that keep the recorded gaps, divided by `speed`."""
+    start = min(timestamp for timestamp, _ in requests)
+    return sorted(((timestamp - start) / speed, body) for timestamp, body in requests)
+
+
+def poisson_schedule(requests, rate: float, duration: float, seed: int = 0):
+    rng = random.Random(seed)
+    schedule, offset, i = [], rng.expovariate(rate), 0
+    while offset < duration:
+        schedule.append((offset, requests[i % len(requests)][1]))
+        offset += rng.expovariate(rate)
+        i += 1
+    return schedule
+
+
+def percentile(values, p):
+    return round(values[min(len(values) - 1, int(p * len(values)))], 4) if values else None
+
+
+def summarize(outcomes) -> dict:
+    latencies = sorted(o["latency"] for o in outcomes if o["status"] == 200)
+    first_tokens = sorted(o["ttft"] for o in outcomes if o.get("ttft") is not None)
+    statuses = Counter(str(o["status"]) for o in outcomes)
+    histogram = Counter()
+    for latency in latencies:
+        histogram[next(bound for bound in BUCKETS if latency <= bound)] += 1
+    summary = {
+        "requests": len(outcomes),
+        "statuses": dict(sorted(statuses.items())),
+        "error_rate": round(1 - len(latencies) / len(outcomes), 4) if outcomes else 0.0,
+        "latency_p50_s": percentile(latencies, 0.50),
+        "latency_p90_s": percentile(latencies, 0.90),
+        "latency_p95_s": percentile(latencies, 0.95),
+        "latency_p99_s": percentile(latencies, 0.99),
+        "latency_max_s": round(latencies[-1], 4) if latencies else None,
+        "histogram": {("+Inf" if bound == float("inf") else str(bound)): histogram[bound] for bound in BUCKETS},
+    }
+    if first_tokens:
+        summary.update(ttft_p50_s=percentile(first_tokens, 0.50), ttft_p99_s=percentile(first_tokens, 0.99))
+    return summary
+
+
+async def send(client: httpx.AsyncClient, url: str, body: dict, headers: dict, scheduled: float) -> dict:
+    outcome = {"model": body.get("model"), "status": None, "ttft": None,
+               "send_lag": time.perf_counter() - scheduled}
+    try:
+        if body.get("stream"):
+            async with client.stream("POST", url, json=body, headers=headers) as response:
+                outcome["status"] = response.status_code
+                async for line in response.aiter_lines():
+                    if outcome["ttft"] is None and line.startswith("data: {"):
+                        outcome["ttft"] = time.perf_counter() - scheduled
+        else:
+            response = await client.post(url, json=body, headers=headers)
+            outcome["status"] = response.status_code
+    except httpx.HTTPError as e:
+        outcome["status"] = type(e).__name__
+    outcome["latency"] = time.perf_counter() - scheduled
+    return outcome
+
+
+async def run_step(client: httpx.AsyncClient, url: str, schedule, headers: dict) -> dict:
+    tasks = []
+    started = time.perf_counter()
+    for offset, body in schedule:
+        delay = started + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(client, url, body, headers, started + offset)))
+    outcomes = await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    by_model = defaultdict(list)
+    for outcome in outcomes:
+        by_model[outcome["model"]].append(outcome)
+    span = schedule[-1][0] if schedule else 0.0
+    lags = sorted(o["send_lag"] for o in outcomes)
+    return {
+        "offered_rps": round(len(schedule) / span, 2) if span else None,
+        "throughput_rps": round(sum(o["status"] == 200 for o in outcomes) / elapsed, 2),
+        "elapsed_s": round(elapsed, 3),
+        "send_lag_p99_s": percentile(lags, 0.99),
+        **summarize(outcomes),
+        "models": {model: summarize(items) for model, items in sorted(by_model.items(), key=lambda kv: str(kv[0]))},
+    }
+
+
+def saturated(step: dict, max_error_rate: float, slo_p99: float, min_throughput_ratio: float) -> bool:
+    if step["error_rate"] > max_error_rate:
+        return True
+    if slo_p99 is not None and (step["latency_p99_s"] is None or step["latency_p99_s"] > slo_p99):
+        return True
+    offered = step["offered_rps"]
+    return bool(offered) and step["throughput_rps"] < min_throughput_ratio * offered
+
+
+async def replay(args) -> dict:
+    model_map = dict(pair.split("=", 1) for pair in args.model_map.split(",")) if args.model_map else None
+    requests = load_requests(args.input, args.model, model_map)
+    if not requests:
+        raise SystemExit(f"No chat requests in {args.input}")
+    if args.rate:
+        steps = [(f"rate={rate}", poisson_schedule(requests, float(rate), args.duration, args.seed))
+                 for rate in args.rate.split(",")]
+    else:
+        if any(timestamp is None for timestamp, _ in requests):
+            raise SystemExit("Every line needs a timestamp to replay recorded gaps; use --rate instead")
+        steps = [(f"speed={speed}", recorded_schedule(requests, float(speed))) for speed in args.speed.split(",")]
+
+    headers = {}
+    if args.api_key:
+        headers["Authorization"] = f"Bearer {args.api_key}"
+    if args.no_cache:
+        headers["Cache-Control"] = "no-store"
+
+    results = {}
+    saturation = None
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=args.keepalive)
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+        for name, schedule in steps:
+            results[name] = step = await run_step(client, f"{args.url}/v1/chat/completions", schedule, headers)
+            if saturation is None and saturated(step, args.max_error_rate, args.slo_p99, args.min_throughput_ratio):
+                saturation = name
+                if not args.keep_going:
+                    break
+    return {"input": args.input, "requests_in_file": len(requests), "saturation": saturation, "steps": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input", help="JSONL of batch lines or request bodies, optionally with a timestamp")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    schedule = parser.add_mutually_exclusive_group()
+    schedule.add_argument("--speed", default="1", help="replay recorded gaps this many times faster (comma list)")
+    schedule.add_argument("--rate", help="Poisson arrivals at this many requests/s (comma list)")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per --rate step")
+    parser.add_argument("--model", help="send every request to this model")
+    parser.add_argument("--model-map", help="rename models, e.g. gemini-1.5-pro=openai/fake-model,...")
+    parser.add_argument("--api-key")
+    parser.add_argument("--no-cache", action="store_true", help="send Cache-Control: no-store")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--keepalive", type=int, default=200, help="idle connections kept to the proxy")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--slo-p99", type=float, help="p99 latency in seconds above which a step is saturated")
+    parser.add_argument("--min-throughput-ratio", type=float, default=0.9,
+                        help="a step is saturated below this share of the offered rate")
+    parser.add_argument("--keep-going", action="store_true", help="run every step even after saturation")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = asyncio.run(replay(args))
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(text + "\n")
+    print(text)
@@ -0,0 +1,127 @@
+"""Per-request CPU and allocations of request parsing and response encoding.
+
+Builds a 100-turn, tool-heavy chat request and a tool-call response, then
+runs the proxy's request/response handling (parse + validate, request key,
+normalize, encode) without any network I/O. "baseline" is the previous path:
+json.loads, then pydantic validation, a stdlib-json request key, model_dump
+plus dict fix-ups, and FastAPI's jsonable_encoder + json.dumps.
+
+    python benchmarks/serialization_bench.py --turns 100 --iterations 200
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from fastapi.encoders import jsonable_encoder
+from litellm import ModelResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from proxy.keys import canonical_key  # noqa: E402
+from proxy.serialization import ChatCompletionRequest, dumps, normalize_completion, orjson, parse_chat_request  # noqa: E402
+
+TOOLS = [
+    {"type": "function", "function": {
+        "name": f"tool_{i}",
+        "description": "Look up records in an internal system. " * 4,
+        "parameters": {"type": "object", "properties": {
+            "query": {"type": "string", "description": "Search text"},
+            "limit": {"type": "integer", "minimum": 1, "maximum": 100},
+            "filters": {"type": "object", "additionalProperties": {"type": "string"}},
+        }, "required": ["query"]},
+    }}
+    for i in range(20)
+]
+
+
+def build_request(turns: int) -> bytes:
+    messages = [{"role": "system", "content": "You are a helpful assistant. " * 50}]
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"Question {i}: " + "please check the records. " * 20})
+        messages.append({"role": "assistant", "content": None, "tool_calls": [{
+            "id": f"call_{i}", "type": "function",
+            "function": {"name": f"tool_{i % 20}", "arguments": json.dumps({"query": f"q{i}", "limit": 10})},
+        }]})
+        messages.append({"role": "tool", "tool_call_id": f"call_{i}", "content": json.dumps(
+            {"results": [{"id": j, "title": f"record {j}", "body": "lorem ipsum " * 10} for j in range(5)]})})
+    payload = {"model": "vertex_ai/gemini-1.5-pro", "messages": messages, "temperature": 0, "tools": TOOLS}
+    return json.dumps(payload).encode()
+
+
+def build_response() -> ModelResponse:
+    return ModelResponse(
+        id="chatcmpl-bench", model="gemini-1.5-pro",
+        choices=[{"index": 0, "finish_reason": "tool_calls", "message": {
+            "role": "assistant", "content": "Let me look that up. " * 20,
+            "tool_calls": [{"id": f"call_{i}", "type": "function",
+                            "function": {"name": "tool_1", "arguments": json.dumps({"query": "x" * 200})}}
+                           for i in range(5)],
+        }}],
+        usage={"prompt_tokens": 50000, "completion_tokens": 300, "total_tokens": 50300},
+    )
+
+
+def request_args(request: ChatCompletionRequest) -> dict:
+    args = {"model": request.model, "messages": request.messages, "temperature": request.temperature}
+    if request.tools:
+        args["tools"] = request.tools
+    return {**(request.model_extra or {}), **args}
+
+
+def baseline(body: bytes, response: ModelResponse) -> bytes:
+    request = ChatCompletionRequest.model_validate(json.loads(body))
+    normalized = {k: v for k, v in request_args(request).items() if v is not None}
+    hashlib.sha256(json.dumps(normalized, sort_keys=True, separators=(",", ":"), ensure_ascii=False,
+                              default=str).encode()).hexdigest()
+    data = response.model_dump()
+    data.setdefault("model", request.model)
+    data.setdefault("object", "chat.completion")
+    for choice in data["choices"]:
+        choice.setdefault("finish_reason", "stop")
+        if "message" in choice:
+            choice["message"].setdefault("role", "assistant")
+    return json.dumps(jsonable_encoder(data)).encode()
+
+
+def fast(body: bytes, response: ModelResponse) -> bytes:
+    request = parse_chat_request(body)
+    canonical_key(request_args(request))
+    return dumps(normalize_completion(response, request.model))
+
+
+def measure(fn, body: bytes, response: ModelResponse, iterations: int) -> dict:
+    for _ in range(5):
+        fn(body, response)
+
+    started = time.process_time()
+    for _ in range(iterations):
+        fn(body, response)
+    cpu = (time.process_time() - started) / iterations
+
+    tracemalloc.start()
+    fn(body, response)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"cpu_ms_per_request": round(cpu * 1000, 3), "peak_alloc_kb": round(peak / 1024, 1)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    body = build_request(args.turns)
+    response = build_response()
+    assert json.loads(baseline(body, response)) == json.loads(fast(body, response))
+    result = {
+        "request_kb": round(len(body) / 1024, 1),
+        "orjson": orjson is not None,
+        "baseline": measure(baseline, body, response, args.iterations),
+        "fast": measure(fast, body, response, args.iterations),
+    }
+    print(json.dumps(result, indent=2))
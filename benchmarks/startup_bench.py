@@ -0,0 +1,109 @@
+"""Measure cold start: import time by package, and time to first response.
+
+Start the fake upstream, then let this script launch one proxy worker per
+run and poll it until it answers:
+
+    python benchmarks/fake_upstream.py --port 9000 --latency 0
+    python benchmarks/startup_bench.py --runs 5
+
+Each run records the seconds from process start until `/` (liveness)
+answers, until the first /v1/chat/completions request, sent as soon as the
+worker is live, succeeds, and until `/ready` answers 200. The import
+breakdown comes from `python -X importtime -c "import main"`.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_breakdown(env: dict, top: int) -> dict:
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    by_package = Counter()
+    total_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # header line
+        by_package[name.strip().split(".")[0]] += int(self_us)
+        if name.strip() == "main":
+            total_us = int(cumulative_us)
+    return {
+        "import_main_s": round(total_us / 1e6, 3),
+        "by_package_s": {name: round(us / 1e6, 3) for name, us in by_package.most_common(top)},
+    }
+
+
+def poll(client: httpx.Client, method: str, url: str, deadline: float, interval: float = 0.01, **kwargs):
+    """perf_counter() when `url` answers 200, or None if it does not before the deadline or returns 404."""
+    while time.perf_counter() < deadline:
+        try:
+            response = client.request(method, url, **kwargs)
+            if response.status_code == 200:
+                return time.perf_counter()
+            if response.status_code == 404:
+                return None
+        except httpx.TransportError:
+            pass
+        time.sleep(interval)
+    return None
+
+
+def cold_start(env: dict, port: int, model: str, timeout: float) -> dict:
+    base = f"http://127.0.0.1:{port}"
+    payload = {"model": model, "messages": [{"role": "user", "content": "ping"}]}
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-m", "proxy.server", "--workers", "1", "--port", str(port)],
+                               cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = started + timeout
+        with httpx.Client(timeout=timeout) as client:
+            live = poll(client, "GET", base + "/", deadline)
+            answered = poll(client, "POST", base + "/v1/chat/completions", deadline, interval=0.05, json=payload)
+            ready = poll(client, "GET", base + "/ready", deadline, interval=0.05)
+    finally:
+        process.terminate()
+        process.wait()
+
+    def since_start(moment):
+        return round(moment - started, 3) if moment is not None else None
+
+    return {"live_s": since_start(live), "first_response_s": since_start(answered), "ready_s": since_start(ready)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default=os.path.join(ROOT, "benchmarks", "config.yaml"))
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--model", default="openai/fake-model")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--top", type=int, default=10, help="Packages to list in the import breakdown")
+    args = parser.parse_args()
+
+    env = {**os.environ, "CONFIG_PATH": os.path.abspath(args.config)}
+    runs = [cold_start(env, args.port, args.model, args.timeout) for _ in range(args.runs)]
+
+    def median(field):
+        values = [run[field] for run in runs if run[field] is not None]
+        return round(statistics.median(values), 3) if values else None
+
+    result = {
+        **import_breakdown(env, args.top),
+        "runs": runs,
+        "live_median_s": median("live_s"),
+        "first_response_median_s": median("first_response_s"),
+        "ready_median_s": median("ready_s"),
+    }
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,45 @@
+"""Local stand-in for the Langfuse ingestion API.
+
+Accepts every batch the Langfuse SDK sends, optionally after a delay, and
+counts the events so tracing overhead can be measured without a Langfuse
+project:
+
+    python benchmarks/stub_langfuse.py --port 3000 --latency 0.2
+    LANGFUSE_HOST=http://127.0.0.1:3000 LANGFUSE_PUBLIC_KEY=pk LANGFUSE_SECRET_KEY=sk ...
+"""
+import argparse
+import asyncio
+from collections import Counter
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI()
+app.state.latency = 0.0
+app.state.events = Counter()
+
+
+@app.post("/api/public/ingestion")
+async def ingestion(request: Request):
+    body = await request.json()
+    await asyncio.sleep(app.state.latency)
+    batch = body.get("batch") or []
+    for event in batch:
+        app.state.events[event.get("type", "unknown")] += 1
+    return JSONResponse({"successes": [{"id": e.get("id"), "status": 201} for e in batch], "errors": []},
+                        status_code=207)
+
+
+@app.get("/stats")
+def stats():
+    return dict(app.state.events)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=3000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before each batch is acknowledged")
+    args = parser.parse_args()
+    app.state.latency = args.latency
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
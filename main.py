@@ -1,94 +1,730 @@
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, HTTPException, Header
+from fastapi.exception_handlers import http_exception_handler
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from litellm import completion
+from fastapi.responses import FileResponse, Response, StreamingResponse
+import asyncio
+import json
+import math
 import os
+import sys
+import time
+import uuid
 import yaml
-from google.auth import default
-from google.auth.transport.requests import Request as GoogleRequest
-from langfuse import Langfuse
-from langfuse.decorators import observe, langfuse_context
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 from typing import Optional, List, Dict, Any
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ValidationError
 
-app = FastAPI()
+from proxy.admission import AdmissionController, AdmissionRejected
+from proxy.batch import BATCH_ENDPOINT, BatchManager, BatchRunner
+from proxy.cache import cache_from_config, cache_directives
+from proxy.cancellation import (DEADLINE_HEADER, ClientDisconnected, CompletionEstimator, DeadlineExceeded,
+                                 cancel_on_disconnect, cancellation_reason, current_deadline, remaining, request_timeout,
+                                 within_deadline, without_deadline)
+from proxy.circuit_breaker import is_upstream_failure
+from proxy.context_cache import context_cache_from_config, is_rejected
+from proxy.embeddings import embeddings_from_config, encode_base64
+from proxy.fallback import complete_with_fallbacks
+from proxy.hedging import Hedger
+from proxy.http_client import deployment_origin, upstream_client_from_config
+from proxy.keys import canonical_key
+from proxy.log import RequestIdMiddleware, configure_from_config, current_request_id, log, request_id_from_client
+from proxy.metrics import MetricsMiddleware, MetricsRegistry, current_timings, dispatch_timer, error_class
+from proxy.ollama import ollama_schedulers_from_config
+from proxy.retry import retry_policy_from_config
+from proxy.rate_limit import RateLimiter, RateLimitExceeded, api_key_from_header, estimate_tokens, reconcile_stream
+from proxy.serialization import (JSON_MEDIA_TYPE, ChatCompletionRequest, EmbeddingRequest, dumps, first_content, loads,
+                                  normalize_completion, parse_chat_request)
+from proxy.router import Deployment, ModelGroup, NoHealthyDeploymentError, UnknownModelError, router_from_config
+from proxy.shared_state import BreakerSync, SharedBuckets, SharedStore
+from proxy.singleflight import SingleFlight
+from proxy.streaming import (SSE_DONE, SSE_HEADERS, sse_frame, chunk_to_dict, close_upstream, is_empty_chunk,
+                             release_when_done)
+from proxy.token_manager import TokenManager, default_credentials
+from proxy.tracing import LazyLangfuse, current_trace, exporter_from_config
+from proxy.warmup import Warmup, import_module
 
 # Load configuration
-with open("config.yaml", "r") as config_file:
+with open(os.getenv("CONFIG_PATH", "config.yaml"), "r") as config_file:
     config = yaml.safe_load(config_file)
 
+# Structured JSON logs, written to stdout in the background
+configure_from_config(config)
+
 # Set up Vertex AI settings
 os.environ["VERTEX_PROJECT"] = config["general_settings"]["vertex_project"]
 os.environ["VERTEX_LOCATION"] = config["general_settings"]["vertex_location"]
 
-# Set up Langfuse
-langfuse = Langfuse(
+# litellm otherwise downloads its model price map while being imported; the proxy doesn't use it
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+
+# Set up Langfuse; the client is built on first export
+langfuse = LazyLangfuse(
     public_key=os.getenv("LANGFUSE_PUBLIC_KEY"),
     secret_key=os.getenv("LANGFUSE_SECRET_KEY"),
     host=os.getenv("LANGFUSE_HOST")
 )
 
-# Get default credentials
-credentials, _ = default()
+# Sampled traces are queued and shipped to Langfuse in the background
+tracer = exporter_from_config(langfuse, config)
 
-class ChatCompletionRequest(BaseModel):
-    model: str = Field(default="vertex_ai/gemini-1.5-pro")
-    messages: List[Dict[str, str]]
-    temperature: Optional[float] = 0.7
-    tools: Optional[List[Dict[str, Any]]] = None
-    tool_choice: Optional[str] = None
-    stream: Optional[bool] = False
+# Default credentials, discovered on the first refresh and kept fresh in the background
+token_manager = TokenManager(
+    discover=default_credentials,
+    refresh_skew=float(config["general_settings"].get("credential_refresh_skew_seconds", 300)),
+)
 
-    class Config:
-        extra = "allow"
+# Model names and aliases resolved once from model_list
+router = router_from_config(config)
+needs_google_credentials = any(deployment.is_vertex for deployment in router.deployments.values())
 
-@observe(as_type="generation")
-def vertex_completion(model: str, messages: List[Dict[str, str]], 
-                     temperature: float = 0.7, tools: Optional[List[Dict[str, Any]]] = None, 
-                     **kwargs):
-    try:
-        # Refresh credentials if necessary
-        if credentials.expired:
-            credentials.refresh(GoogleRequest())
+# Shared upstream client with a connection pool per upstream host, opened and closed with the app
+upstream = upstream_client_from_config(config, filter(None, (
+    deployment_origin(d.model, d.default_params.get("api_base"), d.region or os.environ["VERTEX_LOCATION"])
+    for d in router.deployments.values()
+)))
 
-        # Call completion with explicit parameters
-        completion_args = {
-            "model": model,
-            "messages": messages,
-            "temperature": temperature,
-        }
-        
-        # Only add credentials for Vertex AI models
-        if model.startswith("vertex_ai/"):
-            # Pass the credentials token instead of the credentials object
-            completion_args["api_key"] = credentials.token
-        
+# Vertex cached content for long system prompts and tool schemas that repeat across requests
+context_cache = context_cache_from_config(config, lambda: upstream.client, token_manager.get_token)
+
+# Slow imports and client setup, run once the port is bound; /ready reports when they are done
+warmup = Warmup([
+    ("litellm", import_module("litellm")),
+    ("upstream_client", upstream.attach_litellm),
+    *([("langfuse", lambda: langfuse.client)] if tracer.enabled else []),
+])
+
+# Per-model and per-deployment concurrency limits with bounded wait queues
+admission = AdmissionController(config)
+admission.attach(router)
+
+# Ollama hosts serve queued requests model by model, keep hot models loaded, and adapt
+# each model's concurrency to its latency
+ollama_schedulers = ollama_schedulers_from_config(config, router)
+upstream.request_hooks.update({host: scheduler.with_keep_alive for host, scheduler in ollama_schedulers.items()})
+
+# Backup requests to a second region when the first is slow
+hedging_settings = dict(config.get("hedging") or {})
+hedger = Hedger(**hedging_settings) if hedging_settings.pop("enabled", False) else None
+
+# Retries of throttled or failed upstream calls, capped by a deadline and a share of traffic
+retry_policy = retry_policy_from_config(config)
+
+# Requests past their deadline or abandoned by the client have their upstream call cancelled;
+# the running mean of completion tokens per model estimates what that saved
+default_request_timeout = config["general_settings"].get("request_timeout_seconds")
+completion_estimator = CompletionEstimator()
+
+# State shared by the workers on this host: response cache, rate-limit buckets and
+# circuit breaker openings. Without shared_state.path each worker keeps its own
+shared_settings = config.get("shared_state") or {}
+shared_store = (
+    SharedStore(shared_settings["path"], busy_timeout=float(shared_settings.get("busy_timeout_seconds", 0.05)))
+    if shared_settings.get("path") else None
+)
+breaker_sync = (
+    BreakerSync(shared_store, router.deployments,
+                interval=float(shared_settings.get("breaker_sync_interval_seconds", 1)))
+    if shared_store is not None else None
+)
+
+# Requests/minute and tokens/minute quotas per API key and per model
+rate_limiter = RateLimiter(config, shared=SharedBuckets(shared_store) if shared_store is not None else None)
+
+# Response cache for deterministic (low-temperature) requests
+response_cache, default_cache_policy, model_cache_policies = cache_from_config(config, shared_store)
+
+# Identical concurrent requests share one upstream call
+coalescing_settings = config.get("coalescing") or {}
+coalescer = (
+    SingleFlight(max_waiters=int(coalescing_settings.get("max_waiters", 100)))
+    if coalescing_settings.get("enabled", True) else None
+)
+
+# Concurrent /v1/embeddings calls merged into batched upstream calls, behind a content-hash cache
+embeddings = embeddings_from_config(config, lambda model, texts, params: embed_upstream(model, texts, params))
+
+# Offline batch jobs, run through the same path as /v1/chat/completions
+batch_settings = config.get("batch_settings") or {}
+batches = BatchManager(
+    batch_settings.get("storage_dir", "batches"),
+    execute=lambda body, api_key: execute_batch_request(body, api_key),
+    concurrency=int(batch_settings.get("concurrency", 16)),
+    max_retries=int(batch_settings.get("max_retries", 5)),
+)
+
+# Prometheus metrics, merged across workers through metrics.multiprocess_dir
+metrics_settings = config.get("metrics") or {}
+metrics = MetricsRegistry(
+    multiprocess_dir=metrics_settings.get("multiprocess_dir"),
+    flush_interval=float(metrics_settings.get("flush_interval_seconds", 5)),
+)
+upstream_latency = metrics.histogram(
+    "proxy_upstream_duration_seconds", "Upstream call latency (first chunk for streams).", ("model", "region"))
+time_to_first_token = metrics.histogram(
+    "proxy_time_to_first_token_seconds", "Time from upstream call to first streamed chunk.", ("model", "region"))
+queue_wait = metrics.histogram(
+    "proxy_queue_wait_seconds", "Time spent waiting for an admission slot.", ("model", "scope"))
+tokens_total = metrics.counter("proxy_tokens_total", "Tokens reported by upstream usage.", ("model", "type"))
+upstream_retries = metrics.counter(
+    "proxy_upstream_retries_total", "Retryable upstream failures, by whether they were retried.", ("model", "outcome"))
+fallbacks_total = metrics.counter(
+    "proxy_fallbacks_total", "Requests moved to the next model of their fallback chain.", ("model", "fallback", "reason"))
+cancelled_requests = metrics.counter(
+    "proxy_cancelled_requests_total", "Requests whose upstream call was cancelled.", ("model", "reason"))
+tokens_saved = metrics.counter(
+    "proxy_cancelled_tokens_saved_total", "Estimated completion tokens not generated because of cancellation.",
+    ("model",))
+cache_requests = metrics.counter("proxy_cache_requests_total", "Response cache lookups.", ("model", "result"))
+context_cache_requests = metrics.counter(
+    "proxy_context_cache_requests_total", "Upstream calls sent with a Vertex cached-content handle.", ("model",))
+embedding_texts = metrics.counter(
+    "proxy_embedding_texts_total", "Embedding inputs served, by source.", ("model", "source"))
+embedding_batch_size = metrics.histogram(
+    "proxy_embedding_batch_size", "Texts per upstream embedding call.", ("model",),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+metrics.gauge("proxy_admission_active", "Upstream calls holding an admission slot.", ("limiter",),
+              lambda: {(name,): limiter.active for name, limiter in admission.limiters.items()})
+metrics.gauge("proxy_admission_queued", "Requests waiting for an admission slot.", ("limiter",),
+              lambda: {(name,): limiter.queued for name, limiter in admission.limiters.items()})
+metrics.gauge("proxy_ollama_concurrency_limit", "Adaptive concurrency limit of each model on an Ollama host.",
+              ("upstream", "model"),
+              lambda: {(host, model): lane["limit"] for host, scheduler in ollama_schedulers.items()
+                       for model, lane in scheduler.stats()["models"].items()})
+metrics.gauge("proxy_ollama_queued", "Requests waiting for their model's turn on an Ollama host.", ("upstream", "model"),
+              lambda: {(host, model): lane["queued"] for host, scheduler in ollama_schedulers.items()
+                       for model, lane in scheduler.stats()["models"].items()})
+metrics.gauge("proxy_ollama_model_switches", "Times an Ollama host was switched to serving another model.",
+              ("upstream",), lambda: {(host,): scheduler.switches for host, scheduler in ollama_schedulers.items()})
+metrics.gauge("proxy_circuit_open", "1 while a deployment's circuit breaker is not closed.", ("deployment",),
+              lambda: {(d.id,): float(d.breaker.state != "closed") for d in router.deployments.values()},
+              merge="max")
+upstream_pool_wait = metrics.histogram(
+    "proxy_upstream_pool_wait_seconds", "Time from an upstream request reaching its pool to its headers being sent.",
+    ("upstream",))
+upstream.on_wait = lambda origin, seconds: upstream_pool_wait.labels(origin).observe(seconds)
+metrics.gauge("proxy_upstream_pool_connections", "Connections in each upstream's pool.", ("upstream", "state"),
+              lambda: {(origin, state): pool[state] for origin, pool in upstream.stats().items()
+                       for state in ("active", "idle")})
+metrics.gauge("proxy_trace_queue_depth", "Trace events waiting to be exported.", (),
+              lambda: {(): tracer.stats()["queue_depth"]})
+metrics.gauge("proxy_trace_events_dropped", "Trace events dropped because the export queue was full.", (),
+              lambda: {(): tracer.dropped})
+metrics.gauge("proxy_log_records_dropped", "Log records dropped because the log queue was full.", (),
+              lambda: {(): log.dropped})
+metrics.gauge("proxy_shared_state_errors", "Shared-state operations skipped because the database was busy.", (),
+              lambda: {(): shared_store.errors if shared_store is not None else 0})
+token_refreshes = metrics.counter(
+    "proxy_token_refreshes_total", "Vertex access token refreshes by outcome.", ("outcome",))
+token_refresh_latency = metrics.histogram(
+    "proxy_token_refresh_seconds", "Time to refresh the Vertex access token, including failed attempts.")
+metrics.gauge("proxy_token_seconds_until_expiry", "Seconds until the current Vertex access token expires.", (),
+              lambda: {(): token_manager.stats()["seconds_until_expiry"]}, merge="min")
+metrics.gauge("proxy_cache_entries", "Entries in the response cache.", (),
+              lambda: {(): response_cache.stats()["entries"]}, merge="max" if shared_store is not None else "sum")
+metrics.gauge("proxy_context_cache_entries", "Live Vertex cached-content handles.", (),
+              lambda: {(): len(context_cache.entries)})
+
+def region_label(deployment: Deployment) -> str:
+    return deployment.region or "default"
+
+def usage_dict(usage: Any) -> Optional[Dict[str, Any]]:
+    if usage is None or isinstance(usage, dict):
+        return usage
+    return usage.model_dump() if hasattr(usage, "model_dump") else dict(usage)
+
+def record_usage(model: str, usage: Optional[Dict[str, Any]]):
+    if usage:
+        tokens_total.labels(model, "prompt").inc(usage.get("prompt_tokens") or 0)
+        tokens_total.labels(model, "completion").inc(usage.get("completion_tokens") or 0)
+        completion_estimator.observe(model, usage.get("completion_tokens"))
+
+def record_cancelled(deployment: Deployment, generated: int = 0):
+    tokens_saved.labels(deployment.model_name).inc(completion_estimator.saved(deployment.model_name, generated))
+
+def record_token_refresh(seconds: float, error: Optional[Exception]):
+    token_refreshes.labels("failure" if error is not None else "success").inc()
+    token_refresh_latency.labels().observe(seconds)
+
+token_manager.on_refresh = record_token_refresh
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await log.start()
+    await upstream.start()
+    await warmup.start()
+    if needs_google_credentials:
+        await token_manager.start()
+    await batches.start()
+    await metrics.start()
+    await tracer.start()
+    if breaker_sync is not None:
+        await breaker_sync.start()
+    yield
+    if breaker_sync is not None:
+        await breaker_sync.close()
+    await tracer.close()
+    await context_cache.close()
+    await metrics.close()
+    await batches.close()
+    await token_manager.close()
+    await warmup.close()
+    await upstream.close()
+    if shared_store is not None:
+        shared_store.close()
+    await log.close()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.exception_handler(HTTPException)
+async def throttled_response(request: Request, exc: HTTPException):
+    # Tell clients when to come back from 429s and 503s that carry no Retry-After of their own
+    if exc.status_code in (429, 503) and "retry-after" not in {k.lower() for k in exc.headers or {}}:
+        exc.headers = {**(exc.headers or {}), "Retry-After": "1"}
+    return await http_exception_handler(request, exc)
+
+app.add_middleware(MetricsMiddleware, registry=metrics, paths=["/v1/chat/completions", "/v1/embeddings"])
+app.add_middleware(RequestIdMiddleware)
+
+async def build_completion_args(deployment: Deployment, messages: List[Dict[str, Any]],
+                                temperature: float = 0.7,
+                                tools: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    await warmup.wait()
+
+    # Call completion with explicit parameters on top of the deployment defaults
+    completion_args = {
+        **deployment.default_params,
+        "model": deployment.model,
+        "messages": messages,
+        "temperature": temperature,
+    }
+
+    # Only add credentials for Vertex AI models
+    if deployment.is_vertex:
+        # Pass the credentials token instead of the credentials object
+        completion_args["api_key"] = await token_manager.get_token()
+
+    if tools:
+        completion_args["tools"] = tools
+
+    # Send a long repeated prefix as a Vertex cached-content handle instead of inline
+    cached = context_cache.prepare(deployment.model_name, deployment.model,
+                                   deployment.region or os.environ["VERTEX_LOCATION"], messages, tools)
+    if cached is not None:
+        completion_args["cached_content"], completion_args["messages"] = cached
+        completion_args.pop("tools", None)
+        context_cache_requests.labels(deployment.model_name).inc()
+
+    completion_args.update(upstream.completion_kwargs(deployment.model))
+
+    # Retries are made by retry_policy, across deployments; the OpenAI SDK's own would stack on top
+    if retry_policy is not None:
+        completion_args.setdefault("max_retries", 0)
+
+    # Let the upstream client give up at the request's deadline too
+    left = remaining()
+    if left is not None:
+        completion_args["timeout"] = max(left, 0.001)
+    return completion_args
+
+async def upstream_completion(completion_args: Dict[str, Any], messages: List[Dict[str, Any]],
+                              tools: Optional[List[Dict[str, Any]]] = None):
+    """acompletion, resent once with the full prompt if Vertex refuses the cached-content handle."""
+    from litellm import acompletion
+
+    try:
+        return await acompletion(**completion_args)
+    except Exception as e:
+        name = completion_args.get("cached_content")
+        if name is None or not is_rejected(e):
+            raise
+        log.warning("context_cache_rejected", name=name, status_code=getattr(e, "status_code", None), error=str(e))
+        context_cache.invalidate(name)
+        retry_args = {k: v for k, v in completion_args.items() if k != "cached_content"}
+        retry_args["messages"] = messages
         if tools:
-            completion_args["tools"] = tools
-            
-        response = completion(**completion_args)
+            retry_args["tools"] = tools
+        return await acompletion(**retry_args)
+
+def upstream_http_error(e: Exception) -> HTTPException:
+    # Keep throttling and overload statuses so clients back off instead of retrying an opaque 500
+    status_code = getattr(e, "status_code", None)
+    if status_code in (429, 503):
+        # Only the upstream's own Retry-After, so retries here back off on their own schedule without one;
+        # clients still get a default from throttled_response
+        response_headers = getattr(getattr(e, "response", None), "headers", None) or {}
+        retry_after = response_headers.get("retry-after")
+        headers = {"Retry-After": retry_after} if retry_after is not None else None
+        return HTTPException(status_code=status_code, detail=str(e), headers=headers)
+    if status_code in (408, 502, 504) or (isinstance(status_code, int) and 400 <= status_code < 500):
+        return HTTPException(status_code=status_code, detail=str(e))
+    return HTTPException(status_code=500, detail=str(e))
+
+def generation_fields(deployment: Deployment, temperature: float, start_time: datetime) -> Dict[str, Any]:
+    return {
+        "name": "vertex_completion",
+        "model": deployment.model,
+        "model_parameters": {"temperature": temperature},
+        "metadata": {"deployment": deployment.id},
+        "start_time": start_time,
+    }
+
+async def vertex_completion(model: str, messages: List[Dict[str, Any]], 
+                     temperature: float = 0.7, tools: Optional[List[Dict[str, Any]]] = None, 
+                     deployment_id: Optional[str] = None, **kwargs):
+    deployment = router.deployments[deployment_id] if deployment_id else router.pick(model)
+    started = time.perf_counter()
+    await deployment.acquire()
+    queue_wait.labels(deployment.model_name, "deployment").observe(time.perf_counter() - started)
+    started = time.perf_counter()
+    start_time = datetime.now(timezone.utc)
+    try:
+        completion_args = await build_completion_args(deployment, messages, temperature, tools)
+        response = await upstream_completion(completion_args, messages, tools)
+        elapsed = time.perf_counter() - started
+        deployment.record_success(elapsed)
+        upstream_latency.labels(deployment.model_name, region_label(deployment)).observe(elapsed)
+        usage = usage_dict(response['usage'])
+        record_usage(deployment.model_name, usage)
         
-        # Update Langfuse with response data
-        langfuse_context.update_current_observation(
+        # Record the generation if this request's trace was sampled
+        tracer.generation(
+            input=messages,
             output=response['choices'][0]['message']['content'],
-            usage=response['usage']
+            usage=usage,
+            end_time=datetime.now(timezone.utc),
+            **generation_fields(deployment, temperature, start_time),
         )
         
         return response
-        
+
+    except asyncio.CancelledError:
+        # Only a request given up on saves tokens; hedge losers and fallback cancellations don't
+        if cancellation_reason() is not None:
+            record_cancelled(deployment)
+        raise
+
     except Exception as e:
-        print(f"Error in vertex_completion: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        if is_upstream_failure(e):
+            deployment.record_failure()
+        log.error("upstream_error", deployment=deployment.id, stream=False,
+                  status_code=getattr(e, "status_code", None), error=str(e))
+        tracer.generation(input=messages, level="ERROR", status_message=str(e), end_time=datetime.now(timezone.utc),
+                          **generation_fields(deployment, temperature, start_time))
+        raise upstream_http_error(e)
+
+    finally:
+        deployment.release()
 
-@app.post("/v1/chat/completions")
-@observe(as_type="vertex_ai_proxy")
-async def chat_completions(request: ChatCompletionRequest):
+async def vertex_completion_stream(model: str, messages: List[Dict[str, Any]],
+                                   temperature: float = 0.7, tools: Optional[List[Dict[str, Any]]] = None,
+                                   deployment_id: Optional[str] = None, served_model: Optional[str] = None,
+                                   **kwargs):
+    deployment = router.deployments[deployment_id] if deployment_id else router.pick(model)
+    started = time.perf_counter()
+    await deployment.acquire()
+    queue_wait.labels(deployment.model_name, "deployment").observe(time.perf_counter() - started)
+    started = time.perf_counter()
+    start_time = datetime.now(timezone.utc)
     try:
-        # Log incoming request
-        print(f"Received request: {request.model_dump()}")
-        
+        completion_args = await build_completion_args(deployment, messages, temperature, tools)
+        completion_args["stream"] = True
+        completion_args["stream_options"] = {"include_usage": True}
+        stream = await upstream_completion(completion_args, messages, tools)
+
+        # Wait for the first chunk here so upstream errors still map to an HTTP
+        # status and time-to-first-token is measured
+        first_chunk = await anext(stream, None)
+        elapsed = time.perf_counter() - started
+        deployment.record_success(elapsed, first_token=True)
+        upstream_latency.labels(deployment.model_name, region_label(deployment)).observe(elapsed)
+        time_to_first_token.labels(deployment.model_name, region_label(deployment)).observe(elapsed)
+    except asyncio.CancelledError:
+        # Only a request given up on saves tokens; hedge losers and fallback cancellations don't
+        deployment.release()
+        if cancellation_reason() is not None:
+            record_cancelled(deployment)
+        raise
+    except Exception as e:
+        deployment.release()
+        if is_upstream_failure(e):
+            deployment.record_failure()
+        log.error("upstream_error", deployment=deployment.id, stream=True,
+                  status_code=getattr(e, "status_code", None), error=str(e))
+        tracer.generation(input=messages, level="ERROR", status_message=str(e), end_time=datetime.now(timezone.utc),
+                          **generation_fields(deployment, temperature, start_time))
+        raise upstream_http_error(e)
+
+    # The relay may outlive this context (coalesced streams), so carry the trace along
+    trace = current_trace.get()
+    generation = None
+    if trace is not None:
+        generation = {**generation_fields(deployment, temperature, start_time),
+                      "input": messages, "completion_start_time": datetime.now(timezone.utc)}
+
+    return relay_stream(stream, first_chunk, model, deployment, trace, generation, served_model)
+
+async def relay_stream(stream, first_chunk, model: str, deployment: Deployment,
+                       trace=None, generation: Optional[Dict[str, Any]] = None, served_model: Optional[str] = None):
+    content = []
+    usage = None
+
+    async def upstream_chunks():
+        if first_chunk is None:
+            return
+        yield first_chunk
+        async for chunk in stream:
+            yield chunk
+
+    try:
+        async for raw_chunk in upstream_chunks():
+            chunk = chunk_to_dict(raw_chunk, model)
+            if is_empty_chunk(chunk):
+                continue
+            if served_model:
+                chunk["model"] = served_model
+            for choice in chunk.get("choices") or []:
+                content.append(choice.get("delta", {}).get("content") or "")
+            usage = chunk.get("usage") or usage
+            yield sse_frame(chunk)
+
+        yield SSE_DONE
+
+    except asyncio.CancelledError:
+        # Every client went away: stop the upstream generating tokens nobody will read
+        cancelled_requests.labels(deployment.model_name, "client_disconnect").inc()
+        record_cancelled(deployment, len(content))
+        asyncio.ensure_future(close_upstream(stream))
+        raise
+
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band
+        log.error("stream_relay_error", deployment=deployment.id, error=str(e))
+        yield sse_frame({"error": {"message": str(e), "type": "upstream_error"}})
+
+    finally:
+        deployment.release()
+        record_usage(deployment.model_name, usage)
+
+        if trace is not None:
+            tracer.generation(trace, output="".join(content), usage=usage,
+                              end_time=datetime.now(timezone.utc), **generation)
+
+async def routed_completion(model_group: ModelGroup, completion_args: Dict[str, Any], stream: bool = False):
+    """Admit the request against the model's concurrency limit, then dispatch it.
+
+    Streams keep their slot until the last chunk has been relayed.
+    """
+    limiter = admission.limiter(model_group.name)
+    if limiter is None:
+        return await dispatch_completion(model_group, completion_args, stream)
+
+    started = time.perf_counter()
+    await limiter.acquire()
+    queue_wait.labels(model_group.name, "model").observe(time.perf_counter() - started)
+    try:
+        result = await dispatch_completion(model_group, completion_args, stream)
+    except BaseException:
+        limiter.release()
+        raise
+
+    if stream:
+        return release_when_done(result, limiter.release)
+    limiter.release()
+    return result
+
+async def dispatch_completion(model_group: ModelGroup, completion_args: Dict[str, Any], stream: bool = False):
+    """Send a request to the model group, retrying retryable failures on another deployment when there is one.
+
+    Streams are retried only until their first chunk: vertex_completion_stream
+    waits for it, and later errors are reported in-band by relay_stream.
+    """
+    if retry_policy is None:
+        return await attempt_completion(model_group, model_group.pick(), completion_args, stream)
+
+    tried = []
+
+    async def attempt(number: int):
+        primary = (model_group.pick(exclude=tried[-1]) if tried else None) or model_group.pick()
+        tried.append(primary)
+        return await attempt_completion(model_group, primary, completion_args, stream)
+
+    def on_outcome(outcome: str, error: Exception, number: int, delay: Optional[float]):
+        upstream_retries.labels(model_group.name, outcome).inc()
+        log.warning("upstream_retry", model=model_group.name, deployment=tried[-1].id, attempt=number,
+                    status_code=getattr(error, "status_code", None), outcome=outcome,
+                    delay=round(delay, 3) if delay is not None else None)
+
+    return await retry_policy.run(attempt, on_outcome, remaining())
+
+async def attempt_completion(model_group: ModelGroup, primary: Deployment, completion_args: Dict[str, Any],
+                             stream: bool = False):
+    """Send a request to one deployment of the group, hedging to a second region when it is slow."""
+    call = vertex_completion_stream if stream else vertex_completion
+    delay = hedger.delay_for(primary, stream) if hedger is not None else None
+    if delay is None:
+        return await call(**completion_args, deployment_id=primary.id)
+
+    def backup():
+        try:
+            secondary = model_group.pick(exclude=primary)
+        except NoHealthyDeploymentError:
+            return None
+        return call(**completion_args, deployment_id=secondary.id) if secondary else None
+
+    return await hedger.run(lambda: call(**completion_args, deployment_id=primary.id), backup, delay)
+
+async def fallback_completion(model_group: ModelGroup, completion_args: Dict[str, Any], stream: bool = False):
+    """routed_completion along the model's fallback chain; returns (result, the group that served it).
+
+    A response from a fallback reports that model's name as its `model`.
+    """
+    chain = router.fallback_chain(model_group)
+    if len(chain) == 1:
+        return await routed_completion(model_group, completion_args, stream), model_group
+
+    def call(group: ModelGroup):
+        if group is model_group:
+            return routed_completion(group, completion_args, stream)
+        return routed_completion(group, {**completion_args, "model": group.name, "served_model": group.name}, stream)
+
+    def on_fallback(group: ModelGroup, fallback: ModelGroup, reason: str, error: Exception):
+        fallbacks_total.labels(model_group.name, fallback.name, reason).inc()
+        log.warning("model_fallback", model=group.name, fallback=fallback.name, reason=reason,
+                    status_code=getattr(error, "status_code", None), error=str(error) or type(error).__name__)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.metadata.update(served_model=fallback.name, fallback_reason=reason)
+
+    return await complete_with_fallbacks(chain, call, model_group.fallback_ttft_seconds, on_fallback)
+
+async def served_stream(model_group: ModelGroup, completion_args: Dict[str, Any]):
+    stream, _ = await fallback_completion(model_group, completion_args, stream=True)
+    return stream
+
+async def fetch_completion(model_group: ModelGroup, completion_args: Dict[str, Any], model: str):
+    """Call upstream, normalize and encode once; coalesced callers share the encoded body.
+
+    Also returns whether a fallback model served the response.
+    """
+    response, served = await fallback_completion(model_group, completion_args)
+    response = normalize_completion(response, model)
+    fell_back = served is not model_group
+    if fell_back:
+        response["model"] = served.name
+    return dumps(response), response.get("usage"), first_content(response), fell_back
+
+async def embed_upstream(model: str, texts: List[str], params: Dict[str, Any]):
+    """One upstream embedding call for a micro-batch; returns (vectors in input order, prompt tokens)."""
+    await warmup.wait()
+    from litellm import aembedding
+
+    model_group = router.resolve(model)
+    limiter = admission.limiter(model_group.name)
+    if limiter is not None:
+        started = time.perf_counter()
+        await limiter.acquire()
+        queue_wait.labels(model_group.name, "model").observe(time.perf_counter() - started)
+    try:
+        deployment = model_group.pick()
+        started = time.perf_counter()
+        await deployment.acquire()
+        queue_wait.labels(deployment.model_name, "deployment").observe(time.perf_counter() - started)
+        started = time.perf_counter()
+        try:
+            embedding_args = {**deployment.default_params, **params, "model": deployment.model, "input": texts}
+            if deployment.is_vertex:
+                embedding_args["api_key"] = await token_manager.get_token()
+            response = await aembedding(**embedding_args)
+            elapsed = time.perf_counter() - started
+            deployment.record_success(elapsed)
+            upstream_latency.labels(deployment.model_name, region_label(deployment)).observe(elapsed)
+            embedding_batch_size.labels(deployment.model_name).observe(len(texts))
+        except Exception as e:
+            if is_upstream_failure(e):
+                deployment.record_failure()
+            log.error("upstream_error", deployment=deployment.id, endpoint="embeddings", texts=len(texts),
+                      status_code=getattr(e, "status_code", None), error=str(e))
+            raise upstream_http_error(e)
+        finally:
+            deployment.release()
+    finally:
+        if limiter is not None:
+            limiter.release()
+
+    data = sorted(response.data, key=lambda item: item["index"])
+    usage = usage_dict(response.usage) or {}
+    prompt_tokens = usage.get("prompt_tokens") or 0
+    tokens_total.labels(model_group.name, "prompt").inc(prompt_tokens)
+    return [item["embedding"] for item in data], prompt_tokens
+
+@app.post("/v1/chat/completions", openapi_extra={"requestBody": {
+    "required": True,
+    "content": {JSON_MEDIA_TYPE: {"schema": ChatCompletionRequest.model_json_schema()}},
+}})
+async def chat_completions(raw_request: Request,
+                           cache_control: Optional[str] = Header(default=None),
+                           authorization: Optional[str] = Header(default=None)):
+    # Validate straight from the body bytes instead of json.loads followed by validation
+    try:
+        request = parse_chat_request(await raw_request.body())
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+    try:
+        return await cancel_on_disconnect(raw_request.receive, complete_chat(
+            request, cache_control, authorization, raw_request.headers.get(DEADLINE_HEADER)))
+    except ClientDisconnected:
+        try:
+            model = router.resolve(request.model).name
+        except UnknownModelError:
+            model = "unknown"
+        cancelled_requests.labels(model, "client_disconnect").inc()
+        log.info("client_disconnected", model=model)
+        # Nobody is left to read it; 499 is nginx's "client closed request"
+        return Response(status_code=499)
+
+async def complete_chat(request: ChatCompletionRequest, cache_control: Optional[str] = None,
+                        authorization: Optional[str] = None, timeout: Optional[str] = None,
+                        api_key: Optional[str] = None):
+    """Serve one chat completion; batch jobs pass the submitter's `api_key` fingerprint instead of `authorization`."""
+    timings = current_timings.get()
+    trace = None
+    trace_output = None
+    trace_metadata = {}
+    try:
+        # Reject unknown models before doing any upstream work
+        try:
+            model_group = router.resolve(request.model)
+        except UnknownModelError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        if timings is not None:
+            timings.model = model_group.name
+            timings.stream = bool(request.stream)
+
+        # Upstream calls, retries and fallbacks all stop at the request's deadline
+        seconds = request_timeout(timeout, model_group.request_timeout_seconds or default_request_timeout)
+        if seconds is not None:
+            current_deadline.set(time.monotonic() + seconds)
+
+        # Head-sampled trace; generations recorded below attach to it. Clients reuse their X-Request-ID
+        # across retries, so only an ID made here is unique enough to be the trace's
+        api_key = api_key or api_key_from_header(authorization)
+        request_id = current_request_id.get()
+        trace = tracer.start_trace("vertex_ai_proxy", model_group.name, api_key, input=request.messages,
+                                   metadata={"model": request.model, "stream": bool(request.stream),
+                                             "request_id": request_id},
+                                   trace_id=None if request_id_from_client.get() else request_id)
+        current_trace.set(trace)
+
+        # Log incoming request; message contents are redacted or truncated per logging.payload_mode
+        log.info("chat_completion_request", model=model_group.name, stream=bool(request.stream),
+                 temperature=request.temperature, tools=len(request.tools or []),
+                 messages=log.payload(request.messages), trace_id=trace.id if trace else None)
+
         # Extract and standardize parameters
         completion_args = {
-            "model": request.model,
+            "model": model_group.name,
             "messages": request.messages,
             "temperature": request.temperature,
         }
@@ -100,40 +736,303 @@ async def chat_completions(request: ChatCompletionRequest):
         if request.tool_choice:
             completion_args["tool_choice"] = request.tool_choice
 
-        # Call vertex_completion with standardized parameters
-        response = vertex_completion(**completion_args)
-        
-        # Ensure response matches OpenAI format
-        if isinstance(response, dict):
-            response.setdefault("model", request.model)
-            response.setdefault("object", "chat.completion")
-            
-            if "choices" in response:
-                for choice in response["choices"]:
-                    choice.setdefault("finish_reason", "stop")
-                    if "message" in choice:
-                        choice["message"].setdefault("role", "assistant")
-        
-        return response
-        
+        request_key = canonical_key({**(request.model_extra or {}), **completion_args})
+        estimated_tokens = estimate_tokens(request.messages, (request.model_extra or {}).get("max_tokens"))
+
+        if request.stream:
+            reservation = rate_limiter.acquire(api_key, model_group.name, estimated_tokens)
+            open_stream = lambda: served_stream(model_group, completion_args)
+            try:
+                if coalescer is not None:
+                    # The shared call runs past the leader's deadline; each caller enforces its own
+                    stream = await within_deadline(
+                        coalescer.stream(request_key, lambda: without_deadline(open_stream())))
+                else:
+                    stream = await within_deadline(open_stream())
+            except BaseException:
+                rate_limiter.refund(reservation)
+                raise
+            return StreamingResponse(reconcile_stream(stream, reservation),
+                                     media_type="text/event-stream", headers=SSE_HEADERS)
+
+        # Serve repeated deterministic requests from the cache
+        cache_key = None
+        cache_policy = model_cache_policies.get(model_group.name, default_cache_policy)
+        cache_ttl = cache_policy.ttl_for(request.temperature, request.tools)
+        directives = cache_directives(cache_control)
+        if cache_ttl and "no-store" not in directives:
+            cache_key = request_key
+            if "no-cache" not in directives:
+                cached = response_cache.get(cache_key)
+                cache_requests.labels(model_group.name, "hit" if cached is not None else "miss").inc()
+                if cached is not None:
+                    trace_metadata["cache"] = "hit"
+                    return Response(cached, media_type=JSON_MEDIA_TYPE, headers={"X-Cache": "HIT"})
+
+        # Cache hits are free; everything past here counts against the quotas
+        reservation = rate_limiter.acquire(api_key, model_group.name, estimated_tokens)
+
+        # Call vertex_completion with standardized parameters; the response comes back
+        # normalized to the OpenAI format and already encoded
+        fetch = lambda: fetch_completion(model_group, completion_args, request.model)
+        try:
+            with dispatch_timer():
+                if coalescer is not None:
+                    # As for streams, the shared call isn't bound by the leader's deadline
+                    body, usage, trace_output, fell_back = await within_deadline(
+                        coalescer.do(request_key, lambda: without_deadline(fetch())))
+                else:
+                    body, usage, trace_output, fell_back = await within_deadline(fetch())
+        except BaseException:
+            rate_limiter.refund(reservation)
+            raise
+        rate_limiter.reconcile(reservation, usage)
+
+        if cache_key:
+            # A fallback's answer would keep being served for this model after it recovers
+            if not fell_back:
+                response_cache.set(cache_key, body, cache_ttl)
+            return Response(body, media_type=JSON_MEDIA_TYPE, headers={"X-Cache": "MISS"})
+
+        return Response(body, media_type=JSON_MEDIA_TYPE)
+
+    except HTTPException as e:
+        trace_metadata["error"] = str(e.detail)
+        raise
+
+    except RateLimitExceeded as e:
+        trace_metadata["error"] = str(e)
+        raise HTTPException(status_code=429, detail=str(e), headers=e.headers)
+
+    except AdmissionRejected as e:
+        trace_metadata["error"] = str(e)
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=e.headers)
+
+    except NoHealthyDeploymentError as e:
+        trace_metadata["error"] = str(e)
+        raise HTTPException(status_code=503, detail=str(e),
+                            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
+
+    except DeadlineExceeded as e:
+        trace_metadata["error"] = str(e)
+        cancelled_requests.labels(model_group.name, "deadline").inc()
+        raise HTTPException(status_code=504, detail=str(e))
+
     except Exception as e:
-        print(f"Error in chat_completions: {str(e)}")
+        log.error("chat_completion_failed", model=request.model, error=str(e))
+        if timings is not None:
+            timings.error_class = error_class(e)
+        trace_metadata["error"] = str(e)
         raise HTTPException(status_code=500, detail=str(e))
 
+    finally:
+        tracer.end_trace(trace, output=trace_output, metadata=trace_metadata)
+
+
+@app.post("/v1/embeddings")
+async def create_embeddings(request: EmbeddingRequest, authorization: Optional[str] = Header(default=None)):
+    timings = current_timings.get()
+    try:
+        try:
+            model_group = router.resolve(request.model)
+        except UnknownModelError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        if timings is not None:
+            timings.model = model_group.name
+
+        texts = [request.input] if isinstance(request.input, str) else request.input
+        if not texts:
+            raise HTTPException(status_code=400, detail="input must not be empty")
+        # Parameters that change the vectors; they are part of the cache key and the batch key
+        params = {k: v for k, v in (request.model_extra or {}).items() if v is not None}
+        if request.dimensions is not None:
+            params["dimensions"] = request.dimensions
+
+        vectors, missing = embeddings.lookup(model_group.name, texts, params)
+        prompt_tokens = 0
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            # Cached inputs are free; only the texts sent upstream count against the quotas
+            reservation = rate_limiter.acquire(
+                api_key_from_header(authorization), model_group.name,
+                sum(len(text) for text in missing_texts) // 4 + len(missing_texts))
+            try:
+                with dispatch_timer():
+                    results = await embeddings.fetch(model_group.name, missing_texts, params)
+            except BaseException:
+                rate_limiter.refund(reservation)
+                raise
+            for i, (vector, tokens) in zip(missing, results):
+                vectors[i] = vector
+                prompt_tokens += tokens
+            prompt_tokens = round(prompt_tokens)
+            rate_limiter.reconcile(reservation, {"total_tokens": prompt_tokens})
+        embedding_texts.labels(model_group.name, "cache").inc(len(texts) - len(missing))
+        embedding_texts.labels(model_group.name, "upstream").inc(len(missing))
+
+        encode = encode_base64 if request.encoding_format == "base64" else None
+        return Response(dumps({
+            "object": "list",
+            "data": [{"object": "embedding", "index": i, "embedding": encode(vector) if encode else vector}
+                     for i, vector in enumerate(vectors)],
+            "model": request.model,
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        }), media_type=JSON_MEDIA_TYPE)
+
+    except HTTPException:
+        raise
+
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=e.headers)
+
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=e.headers)
+
+    except NoHealthyDeploymentError as e:
+        raise HTTPException(status_code=503, detail=str(e),
+                            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
+
+    except Exception as e:
+        log.error("embedding_failed", model=request.model, error=str(e))
+        if timings is not None:
+            timings.error_class = error_class(e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+async def execute_batch_request(body: Dict[str, Any], api_key: Optional[str] = None) -> Dict[str, Any]:
+    request = ChatCompletionRequest.model_validate({**body, "stream": False})
+    # Each line, and each retry of one, is a request of its own in logs and traces
+    token = current_request_id.set(uuid.uuid4().hex)
+    try:
+        response = await complete_chat(request, api_key=api_key)
+    finally:
+        current_request_id.reset(token)
+    return loads(response.body)
+
+
+class BatchCreateRequest(BaseModel):
+    input_file_id: str
+    endpoint: str = BATCH_ENDPOINT
+    completion_window: str = "24h"
+    metadata: Optional[Dict[str, Any]] = None
+
+
+@app.post("/v1/files")
+async def upload_file(request: Request):
+    # Multipart uploads (OpenAI SDK) need python-multipart; a raw JSONL body always works
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        try:
+            form = await request.form()
+        except AssertionError as e:
+            raise HTTPException(status_code=415, detail=str(e))
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Missing file")
+
+        async def chunks():
+            while chunk := await upload.read(1 << 20):
+                yield chunk
+
+        return await batches.save_file(chunks(), upload.filename or "upload.jsonl", form.get("purpose", "batch"))
+
+    return await batches.save_file(request.stream(), request.query_params.get("filename", "upload.jsonl"),
+                                   request.query_params.get("purpose", "batch"))
+
+
+@app.get("/v1/files/{file_id}")
+def get_file(file_id: str):
+    file = batches.file(file_id)
+    if file is None:
+        raise HTTPException(status_code=404, detail=f"File {file_id} not found")
+    return file
+
+
+@app.get("/v1/files/{file_id}/content")
+def get_file_content(file_id: str):
+    if batches.file(file_id) is None:
+        raise HTTPException(status_code=404, detail=f"File {file_id} not found")
+    return FileResponse(batches.file_path(file_id), media_type="application/jsonl")
+
+
+@app.post("/v1/batches")
+async def create_batch(request: BatchCreateRequest, authorization: Optional[str] = Header(default=None)):
+    try:
+        return batches.create_batch(request.input_file_id, request.endpoint, request.completion_window,
+                                    request.metadata, authorization)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/v1/batches")
+def list_batches(limit: int = 20):
+    return batches.list_batches(limit)
+
+
+@app.get("/v1/batches/{batch_id}")
+def get_batch(batch_id: str):
+    batch = batches.batch(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found")
+    return batch
+
+
+@app.post("/v1/batches/{batch_id}/cancel")
+def cancel_batch(batch_id: str):
+    batch = batches.cancel(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found")
+    return batch
+
+
+async def run_batch_file(input_path: str, output_path: str, concurrency: int):
+    runner = BatchRunner(execute_batch_request, concurrency=concurrency,
+                         max_retries=int(batch_settings.get("max_retries", 5)))
+    await log.start()
+    await upstream.start()
+    await warmup.start()
+    if needs_google_credentials:
+        await token_manager.start()
+    try:
+        await runner.run(input_path, output_path)
+    finally:
+        await token_manager.close()
+        await warmup.close()
+        await upstream.close()
+        await log.close()
+    print(json.dumps({**runner.counts(), "skipped": runner.skipped}))
+
+
+@app.get("/v1/models")
+def list_models():
+    return router.models_response
+
 
 @app.get("/")
 def root():
+    # Liveness: answers as soon as the port is bound
     return {"message": "Vertex AI Proxy is running"}
 
+
+@app.get("/ready")
+def ready():
+    """Readiness: 503 until deferred imports are done and, for Vertex models, a token is held."""
+    checks = {"warmup": warmup.ready}
+    if needs_google_credentials:
+        checks["credentials"] = token_manager.ready
+    is_ready = all(checks.values())
+    return Response(dumps({"ready": is_ready, "checks": checks, "startup": warmup.stats()}),
+                    media_type=JSON_MEDIA_TYPE, status_code=200 if is_ready else 503)
+
 if __name__ == "__main__":
-    import uvicorn
-    
-    # Convert workers value to int, with a default of 4
-    workers = int(config["general_settings"].get("server_workers", 4))
-    
-    uvicorn.run(
-        app, 
-        host="0.0.0.0", 
-        port=8000,
-        workers=workers
-    )
+    # Serving and batch runs go through the launcher: uvicorn's worker processes
+    # re-run the parent's __main__ module first, so it must not be this one
+    os.execve(sys.executable, [sys.executable, "-m", "proxy.server", *sys.argv[1:]],
+              {**os.environ, "PYTHONPATH": os.pathsep.join(
+                  filter(None, [os.path.dirname(os.path.abspath(__file__)), os.getenv("PYTHONPATH")]))})
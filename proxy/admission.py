@@ -0,0 +1,156 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+LIMIT_FIELDS = ("max_concurrency", "max_queue", "queue_timeout_seconds")
+
+
+class AdmissionRejected(Exception):
+    """Raised instead of queueing work the proxy can't take on.
+
+    `status_code` is 429 when the wait queue is full and 503 when a queued
+    request ran out of time; `retry_after` is a hint in seconds.
+    """
+
+    def __init__(self, message: str, status_code: int, retry_after: float):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+class ConcurrencyLimiter:
+    """Semaphore with a bounded FIFO wait queue and a queue-time deadline."""
+
+    def __init__(self, name: str, max_concurrency: int = 100, max_queue: int = 200,
+                 queue_timeout_seconds: float = 10.0):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.active = 0
+        self._waiters = deque()
+
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.wait_seconds_total = 0.0
+        self.max_wait_seconds = 0.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self):
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise AdmissionRejected(f"Too many requests queued for {self.name}", 429, self._retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout_seconds)
+        except asyncio.TimeoutError:
+            self.rejected_timeout += 1
+            raise AdmissionRejected(
+                f"Timed out after {self.queue_timeout_seconds}s waiting for capacity on {self.name}",
+                503, self._retry_after(),
+            )
+        except BaseException:
+            # Cancelled while waiting; if a slot was already handed over, pass it on
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            waited = time.monotonic() - started
+            self.wait_seconds_total += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+        self.admitted += 1
+
+    def release(self):
+        # Hand the slot straight to the next live waiter so queued requests keep FIFO order
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def observe(self, latency: Optional[float], ok: bool = True, first_token: bool = False):
+        # Fixed limit; latency only matters to adaptive limiters such as OllamaLane
+        pass
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _retry_after(self) -> float:
+        return self.queue_timeout_seconds
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "wait_seconds_total": self.wait_seconds_total,
+            "max_wait_seconds": self.max_wait_seconds,
+        }
+
+
+class AdmissionController:
+    """Per-model limiters, plus per-deployment limiters attached to the router's deployments."""
+
+    def __init__(self, config: Dict[str, Any]):
+        settings = config.get("admission") or {}
+        self.enabled = settings.get("enabled", True)
+        self.defaults = {k: settings[k] for k in LIMIT_FIELDS if k in settings}
+        self.deployment_max_concurrency = settings.get("deployment_max_concurrency")
+        self.overrides = {
+            entry["model_name"]: entry["admission"]
+            for entry in config.get("model_list") or [] if entry.get("admission")
+        }
+        self.limiters: Dict[str, ConcurrencyLimiter] = {}
+
+    def _limits(self, model: str) -> Dict[str, Any]:
+        return {**self.defaults, **{k: v for k, v in self.overrides.get(model, {}).items() if k in LIMIT_FIELDS}}
+
+    def limiter(self, model: str) -> Optional[ConcurrencyLimiter]:
+        if not self.enabled:
+            return None
+        limiter = self.limiters.get(model)
+        if limiter is None:
+            limiter = self.limiters[model] = ConcurrencyLimiter(model, **self._limits(model))
+        return limiter
+
+    def attach(self, router):
+        if not self.enabled:
+            return
+        for deployment in router.deployments.values():
+            override = self.overrides.get(deployment.model_name, {})
+            max_concurrency = override.get("deployment_max_concurrency", self.deployment_max_concurrency)
+            if max_concurrency:
+                limits = self._limits(deployment.model_name)
+                limits["max_concurrency"] = int(max_concurrency)
+                deployment.limiter = ConcurrencyLimiter(deployment.id, **limits)
+            self.limiter(deployment.model_name)
@@ -0,0 +1,335 @@
+import asyncio
+import contextvars
+import fcntl
+import json
+import os
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from proxy.keys import key_fingerprint
+from proxy.rate_limit import api_key_from_header
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+RETRYABLE_STATUS = {429, 503}
+ACTIVE_STATUSES = {"validating", "in_progress", "cancelling"}
+
+Execute = Callable[[Dict[str, Any], Optional[str]], Awaitable[Dict[str, Any]]]
+
+
+def scan_output(path: str) -> Tuple[Set[str], int, int]:
+    """Return the custom_ids already written to an output file, plus completed/failed counts.
+
+    A line cut short by a crash is truncated away so appends start on a clean line.
+    """
+    done: Set[str] = set()
+    completed = failed = 0
+    if not os.path.exists(path):
+        return done, completed, failed
+
+    valid_bytes = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                result = json.loads(line)
+            except ValueError:
+                break
+            valid_bytes += len(line)
+            if result.get("custom_id") is not None:
+                done.add(result["custom_id"])
+            if (result.get("response") or {}).get("status_code") == 200:
+                completed += 1
+            else:
+                failed += 1
+
+    if valid_bytes < os.path.getsize(path):
+        with open(path, "r+b") as f:
+            f.truncate(valid_bytes)
+    return done, completed, failed
+
+
+def _error_status(e: Exception) -> int:
+    return getattr(e, "status_code", None) or 500
+
+
+def _retry_after(e: Exception, attempt: int) -> float:
+    headers = getattr(e, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After") or headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return min(2.0 ** attempt, 60.0)
+
+
+class BatchRunner:
+    """Streams a JSONL file of chat requests through `execute` with bounded concurrency.
+
+    Input is read one line at a time and only `concurrency` requests are in
+    memory at once. Results are appended to the output file as they finish,
+    and custom_ids already present in it are skipped, so a crashed run
+    resumes where it stopped.
+    """
+
+    def __init__(self, execute: Execute, concurrency: int = 16, max_retries: int = 5,
+                 api_key: Optional[str] = None):
+        self.execute = execute
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.api_key = api_key  # key_fingerprint of the submitter
+        self.total = 0
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+
+    def counts(self) -> Dict[str, int]:
+        return {"total": self.total, "completed": self.completed, "failed": self.failed}
+
+    async def run(self, input_path: str, output_path: str):
+        done, self.completed, self.failed = scan_output(output_path)
+        self.skipped = len(done)
+        self.total = self.completed + self.failed
+        slots = asyncio.Semaphore(self.concurrency)
+        pending: Set[asyncio.Task] = set()
+
+        with open(input_path, "r") as source, open(output_path, "a") as output:
+            try:
+                for line_number, line in enumerate(source, start=1):
+                    if not line.strip():
+                        continue
+                    try:
+                        item = json.loads(line)
+                        custom_id = item.get("custom_id")
+                    except (ValueError, AttributeError):
+                        item, custom_id = None, None
+                    if custom_id is not None and custom_id in done:
+                        continue
+
+                    self.total += 1
+                    await slots.acquire()
+                    task = asyncio.create_task(self._run_line(item, line_number, output, slots))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+
+                if pending:
+                    await asyncio.gather(*pending)
+            finally:
+                for task in pending:
+                    task.cancel()
+
+    async def _run_line(self, item: Optional[Dict[str, Any]], line_number: int, output, slots: asyncio.Semaphore):
+        try:
+            result = await self._result_for(item, line_number)
+            if (result.get("response") or {}).get("status_code") == 200:
+                self.completed += 1
+            else:
+                self.failed += 1
+            output.write(json.dumps(result, default=str) + "\n")
+            output.flush()
+        finally:
+            slots.release()
+
+    async def _result_for(self, item: Optional[Dict[str, Any]], line_number: int) -> Dict[str, Any]:
+        result = {"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": None, "response": None, "error": None}
+        if not isinstance(item, dict) or not isinstance(item.get("body"), dict) or item.get("custom_id") is None:
+            result["error"] = {"code": "invalid_request",
+                               "message": f"Line {line_number} needs a custom_id and a JSON body"}
+            return result
+        result["custom_id"] = item["custom_id"]
+        if item.get("url", BATCH_ENDPOINT) != BATCH_ENDPOINT:
+            result["error"] = {"code": "invalid_url", "message": f"Only {BATCH_ENDPOINT} is supported"}
+            return result
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                body = await self.execute(item["body"], self.api_key)
+                result["response"] = {"status_code": 200, "request_id": body.get("id"), "body": body}
+                return result
+            except Exception as e:
+                status = _error_status(e)
+                if status in RETRYABLE_STATUS and attempt < self.max_retries:
+                    await asyncio.sleep(_retry_after(e, attempt))
+                    continue
+                message = getattr(e, "detail", None) or str(e)
+                result["response"] = {"status_code": status, "request_id": None,
+                                      "body": {"error": {"message": message}}}
+                return result
+
+
+class BatchManager:
+    """OpenAI-style files and batches kept under one directory.
+
+    Batch state is a JSON file per batch. The worker running a batch holds an
+    exclusive lock on it, so with several workers each batch runs once, and a
+    batch left `in_progress` by a crashed process is resumed by the next one
+    that starts.
+    """
+
+    def __init__(self, directory: str, execute: Execute, concurrency: int = 16, max_retries: int = 5,
+                 progress_interval: float = 1.0):
+        self.directory = directory
+        self.execute = execute
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.progress_interval = progress_interval
+        self._tasks: Dict[str, asyncio.Task] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _write_json(self, name: str, data: Dict[str, Any]):
+        tmp = self._path(f".{name}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self._path(name))
+
+    def _read_json(self, name: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(name)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    # Files
+
+    async def save_file(self, chunks: AsyncIterator[bytes], filename: str, purpose: str = "batch") -> Dict[str, Any]:
+        file_id = f"file-{uuid.uuid4().hex}"
+        with open(self._path(f"{file_id}.jsonl"), "wb") as f:
+            async for chunk in chunks:
+                f.write(chunk)
+        return self._new_file(file_id, filename, purpose)
+
+    def _new_file(self, file_id: str, filename: str, purpose: str) -> Dict[str, Any]:
+        record = {"id": file_id, "object": "file", "bytes": 0, "created_at": int(time.time()),
+                  "filename": filename, "purpose": purpose}
+        self._write_json(f"{file_id}.json", record)
+        return self.file(file_id)
+
+    def file(self, file_id: str) -> Optional[Dict[str, Any]]:
+        record = self._read_json(f"{os.path.basename(file_id)}.json")
+        if record is None:
+            return None
+        path = self.file_path(file_id)
+        record["bytes"] = os.path.getsize(path) if os.path.exists(path) else 0
+        return record
+
+    def file_path(self, file_id: str) -> str:
+        return self._path(f"{os.path.basename(file_id)}.jsonl")
+
+    # Batches
+
+    def create_batch(self, input_file_id: str, endpoint: str = BATCH_ENDPOINT, completion_window: str = "24h",
+                     metadata: Optional[Dict[str, Any]] = None, authorization: Optional[str] = None) -> Dict[str, Any]:
+        if endpoint != BATCH_ENDPOINT:
+            raise ValueError(f"Only {BATCH_ENDPOINT} batches are supported")
+        if self.file(input_file_id) is None:
+            raise LookupError(f"File {input_file_id} not found")
+
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        output_file_id = f"file-{uuid.uuid4().hex}"
+        open(self.file_path(output_file_id), "a").close()
+        self._new_file(output_file_id, f"{batch_id}_output.jsonl", "batch_output")
+        batch = {
+            "id": batch_id, "object": "batch", "endpoint": endpoint, "errors": None,
+            "input_file_id": input_file_id, "completion_window": completion_window, "status": "validating",
+            "output_file_id": output_file_id, "error_file_id": None, "created_at": int(time.time()),
+            "in_progress_at": None, "completed_at": None, "failed_at": None, "cancelled_at": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0}, "metadata": metadata,
+            # Passed with every line so batch traffic counts against the submitter's rate limits;
+            # only the fingerprint is stored, never the key itself
+            "_api_key": key_fingerprint(api_key_from_header(authorization)),
+        }
+        self._write_json(f"{batch_id}.json", batch)
+        self._start(batch_id)
+        return self.batch(batch_id)
+
+    def batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        batch = self._read_json(f"{os.path.basename(batch_id)}.json")
+        if batch is None or batch.get("object") != "batch":
+            return None
+        return {k: v for k, v in batch.items() if not k.startswith("_")}
+
+    def list_batches(self, limit: int = 20) -> Dict[str, Any]:
+        batches = [self.batch(name[:-5]) for name in os.listdir(self.directory)
+                   if name.startswith("batch_") and name.endswith(".json")]
+        batches = sorted((b for b in batches if b), key=lambda b: b["created_at"], reverse=True)[:limit]
+        return {"object": "list", "data": batches, "has_more": False}
+
+    def cancel(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        batch = self.batch(batch_id)
+        if batch is None or batch["status"] not in ACTIVE_STATUSES:
+            return batch
+        # A marker file reaches whichever worker runs the batch
+        open(self._path(f"{batch['id']}.cancel"), "a").close()
+        batch["status"] = "cancelling"
+        return batch
+
+    async def start(self):
+        """Resume batches a previous process left unfinished."""
+        for name in os.listdir(self.directory):
+            if name.startswith("batch_") and name.endswith(".json"):
+                batch = self.batch(name[:-5])
+                if batch and batch["status"] in ACTIVE_STATUSES:
+                    self._start(batch["id"])
+
+    async def close(self):
+        # Leaves the batches in_progress so the next start resumes them
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _start(self, batch_id: str):
+        if batch_id in self._tasks:
+            return
+        lock = open(self._path(f"{batch_id}.lock"), "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            # Another worker is running it
+            lock.close()
+            return
+        # A fresh context, so the batch doesn't run as part of the request that created it
+        task = contextvars.Context().run(asyncio.create_task, self._run(batch_id))
+        self._tasks[batch_id] = task
+
+        def finished(_):
+            self._tasks.pop(batch_id, None)
+            lock.close()
+        task.add_done_callback(finished)
+
+    def _update(self, batch_id: str, **fields) -> Dict[str, Any]:
+        batch = self._read_json(f"{batch_id}.json")
+        batch.update(fields)
+        self._write_json(f"{batch_id}.json", batch)
+        return batch
+
+    async def _run(self, batch_id: str):
+        batch = self._read_json(f"{batch_id}.json")
+        cancel_marker = self._path(f"{batch_id}.cancel")
+        runner = BatchRunner(self.execute, self.concurrency, self.max_retries, batch.get("_api_key"))
+        batch = self._update(batch_id, status="in_progress", in_progress_at=batch["in_progress_at"] or int(time.time()))
+        task = asyncio.create_task(runner.run(self.file_path(batch["input_file_id"]),
+                                              self.file_path(batch["output_file_id"])))
+        try:
+            while not task.done():
+                await asyncio.wait({task}, timeout=self.progress_interval)
+                if os.path.exists(cancel_marker) and not task.done():
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    self._update(batch_id, status="cancelled", cancelled_at=int(time.time()),
+                                 request_counts=runner.counts())
+                    return
+                self._update(batch_id, request_counts=runner.counts())
+
+            if task.exception() is not None:
+                self._update(batch_id, status="failed", failed_at=int(time.time()), request_counts=runner.counts(),
+                             errors={"object": "list", "data": [{"message": str(task.exception())}]})
+            else:
+                self._update(batch_id, status="completed", completed_at=int(time.time()),
+                             request_counts=runner.counts())
+        finally:
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
@@ -0,0 +1,31 @@
+class RatioBudget:
+    """Caps optional extra work (hedges, retries) at a fraction of regular traffic.
+
+    Every regular request deposits `ratio` tokens, up to `max_tokens`; each
+    extra call spends one. Both operations are O(1) and lock-free on the
+    event loop.
+    """
+
+    def __init__(self, ratio: float = 0.1, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.requests = 0
+        self.spent = 0
+        self.denied = 0
+
+    def deposit(self):
+        self.requests += 1
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        # Tolerate float drift from repeated fractional deposits
+        if self.tokens < 1.0 - 1e-9:
+            self.denied += 1
+            return False
+        self.tokens -= 1.0
+        self.spent += 1
+        return True
+
+    def stats(self):
+        return {"requests": self.requests, "spent": self.spent, "denied": self.denied, "tokens": self.tokens}
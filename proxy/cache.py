@@ -0,0 +1,123 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from proxy.shared_state import SharedResponseCache, SharedStore
+
+GROUNDING_TOOLS = {"googleSearchRetrieval", "google_search_retrieval", "googleSearch", "google_search"}
+
+
+def is_grounded(tools: Optional[List[Dict[str, Any]]]) -> bool:
+    return any(isinstance(tool, dict) and GROUNDING_TOOLS.intersection(tool) for tool in tools or [])
+
+
+def cache_directives(header: Optional[str]) -> set:
+    return {part.strip().lower() for part in (header or "").split(",") if part.strip()}
+
+
+@dataclass
+class CachePolicy:
+    enabled: bool = True
+    max_temperature: float = 0.0
+    ttl_seconds: float = 3600.0
+    # Grounded answers go stale quickly, so they get a much shorter lifetime
+    grounded_ttl_seconds: float = 300.0
+
+    def ttl_for(self, temperature: Optional[float], tools: Optional[List[Dict[str, Any]]]) -> Optional[float]:
+        """Seconds to keep a response for this request, or None if it must not be cached."""
+        if not self.enabled or temperature is None or temperature > self.max_temperature:
+            return None
+        ttl = self.grounded_ttl_seconds if is_grounded(tools) else self.ttl_seconds
+        return ttl if ttl > 0 else None
+
+
+class ResponseCache:
+    """LRU cache of encoded responses bounded by entry count and total bytes, with per-entry TTL."""
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: bytes, ttl: float):
+        if len(value) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self.bytes += len(value)
+
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, value = self._entries.pop(key)
+        self.bytes -= len(value)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+def cache_from_config(config: Dict[str, Any], store: Optional[SharedStore] = None) -> Tuple[ResponseCache, CachePolicy, Dict[str, CachePolicy]]:
+    """Build the cache plus the default and per-model policies from config.yaml.
+
+    With a SharedStore the entries live there and are shared by all workers.
+    """
+    settings = config.get("response_cache") or {}
+    limits = {
+        "max_entries": int(settings.get("max_entries", 10000)),
+        "max_bytes": int(settings.get("max_bytes", 256 * 1024 * 1024)),
+    }
+    if store is not None:
+        cache = SharedResponseCache(store, **limits)
+    else:
+        cache = ResponseCache(**limits)
+    policy_fields = ("enabled", "max_temperature", "ttl_seconds", "grounded_ttl_seconds")
+    default_policy = CachePolicy(**{k: settings[k] for k in policy_fields if k in settings})
+
+    model_policies = {}
+    for entry in config.get("model_list") or []:
+        overrides = entry.get("cache")
+        if overrides:
+            model_policies[entry["model_name"]] = CachePolicy(**{
+                k: overrides.get(k, getattr(default_policy, k)) for k in policy_fields
+            })
+    return cache, default_policy, model_policies
@@ -0,0 +1,142 @@
+import asyncio
+import contextvars
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+DEADLINE_HEADER = "X-Request-Timeout"
+
+# time.monotonic() by which the current request must be answered; copied into tasks it starts
+current_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("current_deadline", default=None)
+
+
+class RequestCancellation:
+    """Why the current request's work was cancelled, shared with every task it starts."""
+
+    def __init__(self):
+        self.reason: Optional[str] = None
+
+
+current_cancellation: contextvars.ContextVar[Optional[RequestCancellation]] = contextvars.ContextVar(
+    "current_cancellation", default=None)
+
+
+def request_cancellation() -> RequestCancellation:
+    cancellation = current_cancellation.get()
+    if cancellation is None:
+        cancellation = RequestCancellation()
+        current_cancellation.set(cancellation)
+    return cancellation
+
+
+def cancellation_reason() -> Optional[str]:
+    """"deadline" or "client_disconnect" once the request itself is cancelled, else None.
+
+    Lets a cancelled upstream call tell the request being given up from being
+    cancelled on the request's behalf, like the losing side of a hedge.
+    """
+    cancellation = current_cancellation.get()
+    return cancellation.reason if cancellation is not None else None
+
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed before the upstream answered; its call has been cancelled."""
+
+
+class ClientDisconnected(Exception):
+    """The client went away before the response was ready; its upstream call has been cancelled."""
+
+
+def request_timeout(header: Optional[str], default: Optional[float]) -> Optional[float]:
+    """Seconds allowed for a request: the X-Request-Timeout header, capped by the model's default."""
+    try:
+        requested = float(header) if header else None
+    except ValueError:
+        requested = None
+    if requested is None or requested <= 0:
+        return default
+    return requested if default is None else min(requested, default)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current request's deadline, or None without one."""
+    deadline = current_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+async def within_deadline(awaitable: Awaitable[Any]) -> Any:
+    """Await `awaitable`, cancelling it and raising DeadlineExceeded once the current deadline passes."""
+    left = remaining()
+    if left is None:
+        return await awaitable
+    cancellation = request_cancellation()
+    task = asyncio.ensure_future(awaitable)
+    try:
+        await asyncio.wait((task,), timeout=max(left, 0.0))
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    if not task.done():
+        cancellation.reason = "deadline"
+        task.cancel()
+        await asyncio.wait((task,))
+        raise DeadlineExceeded("No response within the request deadline")
+    return task.result()
+
+
+async def without_deadline(awaitable: Awaitable[Any]) -> Any:
+    """Await `awaitable` with no request deadline, for a call shared by requests with deadlines of their own.
+
+    Each request still gives up at its own deadline through within_deadline,
+    and the shared call is cancelled once none of them is waiting for it.
+    """
+    token = current_deadline.set(None)
+    try:
+        return await awaitable
+    finally:
+        current_deadline.reset(token)
+
+
+async def wait_for_disconnect(receive: Callable[[], Awaitable[Dict[str, Any]]]):
+    # Once the body has been read, the next ASGI message is the disconnect
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def cancel_on_disconnect(receive: Callable[[], Awaitable[Dict[str, Any]]], awaitable: Awaitable[Any]) -> Any:
+    """Await `awaitable`, cancelling it and raising ClientDisconnected if the client goes away first.
+
+    Call only after the request body has been read. Streaming responses are
+    covered until they are returned; from then on Starlette cancels the body
+    iterator on disconnect.
+    """
+    cancellation = request_cancellation()
+    work = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await asyncio.wait((work, watcher), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not work.done():
+            cancellation.reason = cancellation.reason or "client_disconnect"
+            work.cancel()
+    if not work.done() or work.cancelled():
+        raise ClientDisconnected("Client disconnected before the response was ready")
+    return work.result()
+
+
+class CompletionEstimator:
+    """Running mean of completion tokens per model, for what a cancelled call would have generated."""
+
+    def __init__(self, alpha: float = 0.05):
+        self.alpha = alpha
+        self.means: Dict[str, float] = {}
+
+    def observe(self, model: str, completion_tokens: Optional[int]):
+        if not completion_tokens:
+            return
+        mean = self.means.get(model)
+        self.means[model] = completion_tokens if mean is None else mean + self.alpha * (completion_tokens - mean)
+
+    def saved(self, model: str, generated: int = 0) -> float:
+        """Tokens a call to `model` would still have produced after `generated` of them."""
+        return max(0.0, self.means.get(model, 0.0) - generated)
@@ -0,0 +1,139 @@
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Tracks recent outcomes for one (model, region) deployment.
+
+    Opens when the error rate or the latency percentile over the last
+    `window_size` calls crosses its threshold, rejects calls for
+    `cooldown_seconds`, then lets a single probe through: success closes the
+    circuit again, failure re-opens it. A probe that ends with neither (it was
+    cancelled, or the caller sent a bad request) hands the probe to the next
+    call.
+    """
+
+    def __init__(self, window_size: int = 50, min_requests: int = 10, error_rate_threshold: float = 0.5,
+                 latency_threshold_seconds: Optional[float] = None, latency_percentile: float = 0.9,
+                 cooldown_seconds: float = 30.0):
+        self.window_size = window_size
+        self.min_requests = min_requests
+        self.error_rate_threshold = error_rate_threshold
+        self.latency_threshold_seconds = latency_threshold_seconds
+        self.latency_percentile = latency_percentile
+        self.cooldown_seconds = cooldown_seconds
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+        self.times_opened = 0
+        self._outcomes = deque(maxlen=window_size)  # True for success
+        # Successful calls only; streams report time to first chunk, other calls the whole response,
+        # so the two are kept apart
+        self._latencies = deque(maxlen=window_size)
+        self._first_token_latencies = deque(maxlen=window_size)
+
+    def allow(self) -> bool:
+        """Whether a call may be sent now; has no side effects."""
+        if self.state == CLOSED:
+            return True
+        if self.probing:
+            return False
+        return time.monotonic() >= self.opened_at + self.cooldown_seconds
+
+    def before_call(self):
+        if self.state != CLOSED:
+            self.state = HALF_OPEN
+            self.probing = True
+
+    def release_probe(self):
+        """Called when any call ends; frees the probe slot if the probe recorded no outcome."""
+        if self.state == HALF_OPEN:
+            self.probing = False
+
+    def record_success(self, latency: float, first_token: bool = False):
+        self._outcomes.append(True)
+        self._window(first_token).append(latency)
+        if self.state == HALF_OPEN:
+            self._close()
+        elif self._latency_tripped(first_token):
+            self._open()
+
+    def record_failure(self):
+        self._outcomes.append(False)
+        if self.state == HALF_OPEN or self._errors_tripped():
+            self._open()
+
+    def open_for(self, seconds: float):
+        """Open without local evidence, e.g. because another worker's breaker for this deployment opened."""
+        self.state = OPEN
+        self.opened_at = time.monotonic() + seconds - self.cooldown_seconds
+        self.probing = False
+
+    def retry_after(self) -> float:
+        if self.state == CLOSED:
+            return 0.0
+        return max(0.0, self.opened_at + self.cooldown_seconds - time.monotonic())
+
+    def latency(self, percentile: float, first_token: bool = False) -> Optional[float]:
+        """Latency percentile of recent streams' first chunks, or of other calls' whole responses."""
+        window = self._window(first_token)
+        if not window:
+            return None
+        ordered = sorted(window)
+        return ordered[min(len(ordered) - 1, int(percentile * len(ordered)))]
+
+    def samples(self, first_token: bool = False) -> int:
+        return len(self._window(first_token))
+
+    def _window(self, first_token: bool) -> deque:
+        return self._first_token_latencies if first_token else self._latencies
+
+    def _errors_tripped(self) -> bool:
+        if len(self._outcomes) < self.min_requests:
+            return False
+        failures = self._outcomes.count(False)
+        return failures / len(self._outcomes) >= self.error_rate_threshold
+
+    def _latency_tripped(self, first_token: bool) -> bool:
+        if self.latency_threshold_seconds is None or self.samples(first_token) < self.min_requests:
+            return False
+        return self.latency(self.latency_percentile, first_token) > self.latency_threshold_seconds
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.probing = False
+        self.times_opened += 1
+
+    def _close(self):
+        self.state = CLOSED
+        self.probing = False
+        self._outcomes.clear()
+        self._latencies.clear()
+        self._first_token_latencies.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "times_opened": self.times_opened,
+            "window": len(self._outcomes),
+            "error_rate": self._outcomes.count(False) / len(self._outcomes) if self._outcomes else 0.0,
+        }
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """Whether an upstream error says something about the deployment's health.
+
+    Client mistakes (4xx other than 408/429) are the caller's problem and must
+    not open the circuit.
+    """
+    status = getattr(error, "status_code", None)
+    if not isinstance(status, int):
+        return True
+    return status >= 500 or status in (408, 429)
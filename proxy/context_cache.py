@@ -0,0 +1,288 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from proxy.log import log
+from proxy.rate_limit import estimate_tokens
+from proxy.serialization import dumps, dumps_sorted
+
+# Upstream statuses meaning a cached-content handle was not accepted: the model
+# doesn't support caching, the prefix is below its minimum, or the handle expired
+REJECTED_STATUSES = {400, 403, 404}
+
+
+def split_prefix(messages: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Leading system messages (cacheable as a system instruction) and the rest of the conversation."""
+    i = 0
+    while i < len(messages) and messages[i].get("role") == "system":
+        i += 1
+    return messages[:i], messages[i:]
+
+
+def message_text(message: Dict[str, Any]) -> str:
+    content = message.get("content")
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def gemini_tools(model: str, tools: Optional[List[Dict[str, Any]]]) -> Optional[List[Dict[str, Any]]]:
+    """OpenAI tool definitions in the Gemini format, converted the way litellm converts them per request."""
+    if not tools:
+        return None
+    from litellm.utils import get_optional_params
+
+    return get_optional_params(model=model.split("/", 1)[-1], custom_llm_provider="vertex_ai", tools=tools)["tools"]
+
+
+def is_rejected(e: Exception) -> bool:
+    return getattr(e, "status_code", None) in REJECTED_STATUSES
+
+
+class CachedContent:
+    __slots__ = ("name", "model", "location", "expires_at", "uses", "refreshing")
+
+    def __init__(self, name: str, model: str, location: str, expires_at: float):
+        self.name = name
+        self.model = model
+        self.location = location
+        self.expires_at = expires_at
+        self.uses = 0
+        self.refreshing = False
+
+
+class VertexCachedContents:
+    """Minimal REST client for Vertex AI `cachedContents`.
+
+    `api_base` points it at a local stand-in (benchmarks/fake_upstream.py)
+    instead of `https://{location}-aiplatform.googleapis.com`.
+    """
+
+    def __init__(self, http: Callable[[], httpx.AsyncClient], get_token: Callable[[], Awaitable[str]],
+                 project: str, api_base: Optional[str] = None, api_version: str = "v1beta1"):
+        self.http = http
+        self.get_token = get_token
+        self.project = project
+        self.api_base = api_base.rstrip("/") if api_base else None
+        self.api_version = api_version
+
+    def _url(self, location: str, path: str) -> str:
+        base = self.api_base or f"https://{location}-aiplatform.googleapis.com"
+        return f"{base}/{self.api_version}/{path}"
+
+    async def _request(self, method: str, location: str, path: str, body: Optional[Dict[str, Any]] = None):
+        headers = {"Authorization": f"Bearer {await self.get_token()}", "Content-Type": "application/json"}
+        response = await self.http().request(method, self._url(location, path), headers=headers,
+                                             content=dumps(body) if body is not None else None)
+        if response.status_code >= 400:
+            raise httpx.HTTPStatusError(f"cachedContents {method} returned {response.status_code}: {response.text}",
+                                        request=response.request, response=response)
+        return response.json() if response.content else {}
+
+    async def create(self, model: str, location: str, system: List[Dict[str, Any]],
+                     tools: Optional[List[Dict[str, Any]]], ttl_seconds: float, display_name: str) -> str:
+        parent = f"projects/{self.project}/locations/{location}"
+        body: Dict[str, Any] = {
+            "model": f"{parent}/publishers/google/models/{model.split('/', 1)[-1]}",
+            "displayName": display_name,
+            "ttl": f"{int(ttl_seconds)}s",
+        }
+        if system:
+            body["systemInstruction"] = {"parts": [{"text": "\n".join(message_text(m) for m in system)}]}
+        converted = gemini_tools(model, tools)
+        if converted:
+            body["tools"] = converted
+        return (await self._request("POST", location, f"{parent}/cachedContents", body))["name"]
+
+    async def update_ttl(self, name: str, location: str, ttl_seconds: float):
+        await self._request("PATCH", location, name, {"ttl": f"{int(ttl_seconds)}s"})
+
+    async def delete(self, name: str, location: str):
+        await self._request("DELETE", location, name)
+
+
+class ContextCache:
+    """Reuses Vertex cached content for long system prompts and tool schemas repeated across requests.
+
+    A prefix (leading system messages plus tool definitions) is keyed by a
+    content hash. Once the same prefix above `min_prefix_tokens` has been
+    seen `min_repeats` times, a cached-content handle is created for it in
+    the background; later requests send only the rest of the conversation
+    plus the handle. Handles close to expiry get their TTL extended, the
+    least recently used ones beyond `max_entries` are deleted, and a model
+    whose handle creation is rejected is left uncached for
+    `unsupported_retry_seconds`. Requests never wait on any of this.
+    """
+
+    def __init__(self, client: VertexCachedContents, enabled: bool = False, min_prefix_tokens: int = 4096,
+                 min_repeats: int = 2, ttl_seconds: float = 3600, refresh_before_seconds: float = 600,
+                 max_entries: int = 100, unsupported_retry_seconds: float = 3600,
+                 model_settings: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.client = client
+        self.enabled = enabled
+        self.min_prefix_tokens = min_prefix_tokens
+        self.min_repeats = min_repeats
+        self.ttl_seconds = ttl_seconds
+        self.refresh_before_seconds = refresh_before_seconds
+        self.max_entries = max_entries
+        self.unsupported_retry_seconds = unsupported_retry_seconds
+        self.model_settings = model_settings or {}
+        self.entries: "OrderedDict[str, CachedContent]" = OrderedDict()
+        self._seen: "OrderedDict[str, int]" = OrderedDict()
+        self._creating: Dict[str, asyncio.Task] = {}
+        self._unsupported: Dict[str, float] = {}  # model -> time.monotonic() to retry at
+        self._tasks = set()
+
+        self.hits = 0
+        self.created = 0
+        self.refreshed = 0
+        self.evicted = 0
+        self.invalidated = 0
+        self.create_failures = 0
+
+    def applies(self, model_name: str, model: str) -> bool:
+        if not model.startswith("vertex_ai/") or "gemini" not in model:
+            return False
+        if not self.model_settings.get(model_name, {}).get("enabled", self.enabled):
+            return False
+        retry_at = self._unsupported.get(model)
+        return retry_at is None or retry_at <= time.monotonic()
+
+    def prepare(self, model_name: str, model: str, location: str, messages: List[Dict[str, Any]],
+                tools: Optional[List[Dict[str, Any]]] = None) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+        """(cached-content name, messages still to send) when a live handle covers the prefix, else None."""
+        if not self.applies(model_name, model):
+            return None
+        system, rest = split_prefix(messages)
+        if not rest or not (system or tools):
+            return None
+        min_tokens = int(self.model_settings.get(model_name, {}).get("min_prefix_tokens", self.min_prefix_tokens))
+        if estimate_tokens(system, None) + len(dumps(tools or [])) // 4 < min_tokens:
+            return None
+
+        key = self.prefix_key(model, location, system, tools)
+        now = time.monotonic()
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry.expires_at > now:
+                self.entries.move_to_end(key)
+                entry.uses += 1
+                self.hits += 1
+                if entry.expires_at - now < self.refresh_before_seconds and not entry.refreshing:
+                    entry.refreshing = True
+                    self._spawn(self._refresh(key, entry))
+                return entry.name, rest
+            del self.entries[key]
+
+        seen = self._seen.pop(key, 0) + 1
+        self._seen[key] = seen
+        while len(self._seen) > self.max_entries * 10:
+            self._seen.popitem(last=False)
+        if seen >= self.min_repeats and key not in self._creating:
+            self._creating[key] = self._spawn(self._create(key, model, location, system, tools))
+        return None
+
+    @staticmethod
+    def prefix_key(model: str, location: str, system: List[Dict[str, Any]],
+                   tools: Optional[List[Dict[str, Any]]]) -> str:
+        return hashlib.sha256(dumps_sorted([model, location, system, tools or []])).hexdigest()
+
+    def invalidate(self, name: str):
+        """Forget a handle upstream refused, e.g. one that expired or was deleted."""
+        for key, entry in list(self.entries.items()):
+            if entry.name == name:
+                del self.entries[key]
+                self.invalidated += 1
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _create(self, key: str, model: str, location: str, system: List[Dict[str, Any]],
+                      tools: Optional[List[Dict[str, Any]]]):
+        try:
+            name = await self.client.create(model, location, system, tools, self.ttl_seconds, display_name=key[:32])
+        except Exception as e:
+            self.create_failures += 1
+            status = getattr(getattr(e, "response", None), "status_code", None)
+            if status in REJECTED_STATUSES:
+                # Not supported for this model (or prefix); stop trying for a while
+                self._unsupported[model] = time.monotonic() + self.unsupported_retry_seconds
+            log.warning("context_cache_create_failed", model=model, location=location, status_code=status,
+                        error=str(e))
+            return
+        finally:
+            self._creating.pop(key, None)
+
+        self.created += 1
+        self.entries[key] = CachedContent(name, model, location, time.monotonic() + self.ttl_seconds)
+        self._seen.pop(key, None)
+        log.info("context_cache_created", model=model, location=location, name=name)
+        while len(self.entries) > self.max_entries:
+            _, evicted = self.entries.popitem(last=False)
+            self.evicted += 1
+            self._spawn(self._delete(evicted))
+
+    async def _refresh(self, key: str, entry: CachedContent):
+        try:
+            await self.client.update_ttl(entry.name, entry.location, self.ttl_seconds)
+            entry.expires_at = time.monotonic() + self.ttl_seconds
+            self.refreshed += 1
+        except Exception as e:
+            log.warning("context_cache_refresh_failed", name=entry.name, error=str(e))
+            if self.entries.get(key) is entry:
+                del self.entries[key]
+        finally:
+            entry.refreshing = False
+
+    async def _delete(self, entry: CachedContent):
+        try:
+            await self.client.delete(entry.name, entry.location)
+        except Exception as e:
+            # Vertex removes it at expiry anyway
+            log.warning("context_cache_delete_failed", name=entry.name, error=str(e))
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        self._tasks.clear()
+        self._creating.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "created": self.created,
+            "refreshed": self.refreshed,
+            "evicted": self.evicted,
+            "invalidated": self.invalidated,
+            "create_failures": self.create_failures,
+            "unsupported_models": sorted(self._unsupported),
+        }
+
+
+def context_cache_from_config(config: Dict[str, Any], http: Callable[[], httpx.AsyncClient],
+                              get_token: Callable[[], Awaitable[str]]) -> ContextCache:
+    settings = config.get("context_cache") or {}
+    client = VertexCachedContents(http, get_token, config["general_settings"]["vertex_project"],
+                                  api_base=settings.get("api_base"))
+    return ContextCache(
+        client,
+        enabled=settings.get("enabled", False),
+        min_prefix_tokens=int(settings.get("min_prefix_tokens", 4096)),
+        min_repeats=int(settings.get("min_repeats", 2)),
+        ttl_seconds=float(settings.get("ttl_seconds", 3600)),
+        refresh_before_seconds=float(settings.get("refresh_before_seconds", 600)),
+        max_entries=int(settings.get("max_entries", 100)),
+        unsupported_retry_seconds=float(settings.get("unsupported_retry_seconds", 3600)),
+        model_settings={
+            entry["model_name"]: entry["context_cache"]
+            for entry in config.get("model_list") or [] if entry.get("context_cache")
+        },
+    )
@@ -0,0 +1,193 @@
+import asyncio
+import base64
+import hashlib
+from array import array
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from proxy.cache import ResponseCache
+from proxy.serialization import dumps_sorted
+
+# (texts, params) -> (one vector per text, prompt tokens for the whole call)
+EmbedBatch = Callable[[List[str], Dict[str, Any]], Awaitable[Tuple[List[List[float]], int]]]
+
+
+def embedding_key(model: str, text: str, params: Dict[str, Any]) -> str:
+    """Content hash of one input; params such as `dimensions` change the vector, so they are part of it."""
+    digest = hashlib.sha256(model.encode())
+    digest.update(b"\0" + dumps_sorted(params) + b"\0")
+    digest.update(text.encode())
+    return digest.hexdigest()
+
+
+def pack(vector: List[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def unpack(data: bytes) -> List[float]:
+    values = array("f")
+    values.frombytes(data)
+    return values.tolist()
+
+
+def encode_base64(vector: List[float]) -> str:
+    """OpenAI's `encoding_format: base64`: little-endian float32s."""
+    return base64.b64encode(pack(vector)).decode()
+
+
+class MicroBatcher:
+    """Merges concurrent embedding calls for one model into batched upstream calls.
+
+    The first text to arrive opens a batch that is sent after
+    `max_wait_seconds`, or as soon as it holds `max_batch_size` texts.
+    Identical texts in a batch are sent once. The upstream token count is
+    split back across callers in proportion to text length.
+    """
+
+    def __init__(self, embed_batch: EmbedBatch, params: Dict[str, Any], max_batch_size: int = 64,
+                 max_wait_seconds: float = 0.01):
+        self.embed_batch = embed_batch
+        self.params = params
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+        self.batches = 0
+        self.texts = 0
+        self.deduplicated = 0
+
+    async def embed(self, texts: List[str]) -> List[Tuple[List[float], float]]:
+        """(vector, share of prompt tokens) for each text, in order."""
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            waiters = self._pending.get(text)
+            if waiters is None:
+                self._pending[text] = [future]
+            else:
+                waiters.append(future)
+                self.deduplicated += 1
+            futures.append(future)
+            if len(self._pending) >= self.max_batch_size:
+                self._flush()
+        if self._pending and self._timer is None:
+            self._timer = loop.call_later(self.max_wait_seconds, self._flush)
+        return list(await asyncio.gather(*futures))
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        task = asyncio.create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: Dict[str, List[asyncio.Future]]):
+        texts = list(batch)
+        self.batches += 1
+        self.texts += len(texts)
+        try:
+            vectors, prompt_tokens = await self.embed_batch(texts, self.params)
+            if len(vectors) != len(texts):
+                raise ValueError(f"Upstream returned {len(vectors)} embeddings for {len(texts)} inputs")
+        except BaseException as e:
+            for waiters in batch.values():
+                for future in waiters:
+                    if not future.done():
+                        future.set_exception(e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return
+
+        total_chars = sum(len(t) for t in texts) or 1
+        for text, vector in zip(texts, vectors):
+            waiters = batch[text]
+            # Callers sharing a text split its tokens
+            share = prompt_tokens * len(text) / total_chars / len(waiters)
+            for future in waiters:
+                if not future.done():
+                    future.set_result((vector, share))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"batches": self.batches, "texts": self.texts, "deduplicated": self.deduplicated,
+                "pending": len(self._pending)}
+
+
+class EmbeddingService:
+    """Content-hash cache in front of per-(model, params) micro-batchers."""
+
+    def __init__(self, embed_batch: Callable[[str, List[str], Dict[str, Any]], Awaitable[Tuple[List[List[float]], int]]],
+                 cache: ResponseCache, ttl_seconds: float = 86400, max_batch_size: int = 64,
+                 max_wait_seconds: float = 0.01, model_settings: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.embed_batch = embed_batch
+        self.cache = cache
+        self.ttl_seconds = ttl_seconds
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.model_settings = model_settings or {}
+        self.batchers: Dict[Tuple[str, bytes], MicroBatcher] = {}
+
+    def lookup(self, model: str, texts: List[str], params: Dict[str, Any]) -> Tuple[List[Optional[List[float]]], List[int]]:
+        """Cached vectors (None where missing) and the indexes still to fetch."""
+        vectors: List[Optional[List[float]]] = []
+        missing = []
+        for i, text in enumerate(texts):
+            cached = self.cache.get(embedding_key(model, text, params))
+            vectors.append(unpack(cached) if cached is not None else None)
+            if cached is None:
+                missing.append(i)
+        return vectors, missing
+
+    async def fetch(self, model: str, texts: List[str], params: Dict[str, Any]) -> List[Tuple[List[float], float]]:
+        results = await self._batcher(model, params).embed(texts)
+        for text, (vector, _) in zip(texts, results):
+            self.cache.set(embedding_key(model, text, params), pack(vector), self.ttl_seconds)
+        return results
+
+    def _batcher(self, model: str, params: Dict[str, Any]) -> MicroBatcher:
+        key = (model, dumps_sorted(params))
+        batcher = self.batchers.get(key)
+        if batcher is None:
+            settings = self.model_settings.get(model, {})
+            embed_batch = lambda texts, params: self.embed_batch(model, texts, params)
+            batcher = self.batchers[key] = MicroBatcher(
+                embed_batch, params,
+                max_batch_size=int(settings.get("max_batch_size", self.max_batch_size)),
+                max_wait_seconds=float(settings.get("max_wait_ms", self.max_wait_seconds * 1000)) / 1000,
+            )
+        return batcher
+
+    def stats(self) -> Dict[str, Any]:
+        batches = sum(b.batches for b in self.batchers.values())
+        texts = sum(b.texts for b in self.batchers.values())
+        return {
+            "batches": batches,
+            "texts": texts,
+            "mean_batch_size": texts / batches if batches else 0.0,
+            "deduplicated": sum(b.deduplicated for b in self.batchers.values()),
+            "cache": self.cache.stats(),
+        }
+
+
+def embeddings_from_config(config: Dict[str, Any], embed_batch) -> EmbeddingService:
+    settings = config.get("embeddings") or {}
+    cache_settings = settings.get("cache") or {}
+    return EmbeddingService(
+        embed_batch,
+        ResponseCache(
+            max_entries=int(cache_settings.get("max_entries", 100000)),
+            max_bytes=int(cache_settings.get("max_bytes", 256 * 1024 * 1024)),
+        ),
+        ttl_seconds=float(cache_settings.get("ttl_seconds", 86400)),
+        max_batch_size=int(settings.get("max_batch_size", 64)),
+        max_wait_seconds=float(settings.get("max_wait_ms", 10)) / 1000,
+        model_settings={
+            entry["model_name"]: entry["embeddings"]
+            for entry in config.get("model_list") or [] if entry.get("embeddings")
+        },
+    )
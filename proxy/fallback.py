@@ -0,0 +1,45 @@
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from proxy.admission import AdmissionRejected
+from proxy.retry import RETRYABLE_STATUS_CODES
+from proxy.router import ModelGroup, NoHealthyDeploymentError
+
+
+def fallback_reason(error: BaseException) -> Optional[str]:
+    """Why `error` should move the request to the next model, or None when it should reach the client."""
+    if isinstance(error, asyncio.TimeoutError):
+        return "ttft_budget"
+    if isinstance(error, NoHealthyDeploymentError):
+        return "circuit_open"
+    if isinstance(error, AdmissionRejected):
+        return "overloaded"
+    if getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES:
+        return "error"
+    return None
+
+
+async def complete_with_fallbacks(chain: List[ModelGroup], call: Callable[[ModelGroup], Awaitable[Any]],
+                                  ttft_budget_seconds: Optional[float] = None,
+                                  on_fallback: Optional[Callable[[ModelGroup, ModelGroup, str, Exception], None]] = None
+                                  ) -> Tuple[Any, ModelGroup]:
+    """Await `call(group)` along the chain until one answers; returns (result, the group that served it).
+
+    A model is skipped when it fails with a retryable error, has every circuit
+    open, is over its admission limits, or hasn't answered within
+    `ttft_budget_seconds` (the first chunk for streams, the whole response
+    otherwise), in which case its call is cancelled. The last model in the
+    chain has no budget, and its error is the one raised.
+    """
+    for position, group in enumerate(chain):
+        last = position == len(chain) - 1
+        try:
+            if ttft_budget_seconds is None or last:
+                return await call(group), group
+            return await asyncio.wait_for(call(group), ttft_budget_seconds), group
+        except Exception as e:
+            reason = fallback_reason(e)
+            if last or reason is None:
+                raise
+            if on_fallback is not None:
+                on_fallback(group, chain[position + 1], reason, e)
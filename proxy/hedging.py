@@ -0,0 +1,86 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Optional
+
+from proxy.budget import RatioBudget
+from proxy.router import Deployment
+
+
+async def _discard(result: Any):
+    # A losing stream still holds its deployment until the relay generator finishes
+    if hasattr(result, "aclose"):
+        try:
+            await result.__anext__()
+        except (StopAsyncIteration, Exception):
+            pass
+        finally:
+            await result.aclose()
+
+
+class Hedger:
+    """Sends a backup request to another deployment when the first one is slow.
+
+    The hedge fires once the primary has been waiting longer than the
+    `percentile` of its recent first-token latency (for calls that don't
+    stream, of its recent response time), and only while the budget
+    allows: extra calls stay under `max_extra_ratio` of traffic. Whichever call
+    answers first wins and the other is cancelled.
+    """
+
+    def __init__(self, percentile: float = 0.95, min_samples: int = 20, max_extra_ratio: float = 0.05,
+                 min_delay_seconds: float = 0.05):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay_seconds = min_delay_seconds
+        self.budget = RatioBudget(ratio=max_extra_ratio, max_tokens=max(1.0, 100 * max_extra_ratio))
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def delay_for(self, deployment: Deployment, stream: bool = True) -> Optional[float]:
+        if deployment.breaker.samples(first_token=stream) < self.min_samples:
+            return None
+        return max(self.min_delay_seconds, deployment.breaker.latency(self.percentile, first_token=stream))
+
+    async def run(self, primary: Callable[[], Awaitable[Any]],
+                  secondary: Callable[[], Optional[Awaitable[Any]]], delay: float) -> Any:
+        self.budget.deposit()
+        first = asyncio.create_task(primary())
+        tasks = [first]
+        winner = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not self.budget.try_spend():
+                winner = first
+                return await first
+
+            backup = secondary()
+            if backup is None:
+                winner = first
+                return await first
+            tasks.append(asyncio.ensure_future(backup))
+            self.hedged += 1
+
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        if task is not first:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+
+        finally:
+            for task in tasks:
+                if task is winner:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled() and task.exception() is None:
+                    # Both answered in the same tick; release the loser
+                    asyncio.ensure_future(_discard(task.result()))
+
+    def stats(self):
+        return {"hedged": self.hedged, "hedge_wins": self.hedge_wins, **self.budget.stats()}
@@ -0,0 +1,230 @@
+import asyncio
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from proxy.log import log
+
+VERTEX_ORIGIN = "https://{region}-aiplatform.googleapis.com"
+OLLAMA_DEFAULT_BASE = "http://localhost:11434"
+
+
+def origin_of(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def deployment_origin(model: str, api_base: Optional[str] = None, region: Optional[str] = None) -> Optional[str]:
+    """Scheme, host and port a deployment's calls go to, or None when litellm picks it."""
+    if api_base:
+        return origin_of(api_base)
+    if model.startswith("vertex_ai/") and region:
+        return VERTEX_ORIGIN.format(region=region)
+    if model.startswith("ollama/"):
+        return origin_of(os.environ.get("OLLAMA_API_BASE") or OLLAMA_DEFAULT_BASE)
+    return None
+
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class UpstreamTransport(httpx.AsyncHTTPTransport):
+    """One upstream's own connection pool; reports how long each request waited for a usable connection.
+
+    The wait runs from the request reaching the pool until its headers are
+    sent, so it includes DNS, TCP and TLS setup when no idle connection was
+    available. `rewrite`, when set, may replace each request before it is sent.
+    """
+
+    def __init__(self, origin: str, on_wait: Optional[Callable[[str, float], None]] = None,
+                 rewrite: Optional[Callable[[httpx.Request], httpx.Request]] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.origin = origin
+        self.http2 = bool(kwargs.get("http2"))
+        self.on_wait = on_wait
+        self.rewrite = rewrite
+        self.last_used = time.monotonic()
+        self.requests = 0
+        self.wait_seconds = 0.0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.rewrite is not None:
+            request = self.rewrite(request)
+        self.last_used = time.monotonic()
+        self.requests += 1
+        started = time.perf_counter()
+        waiting = True
+
+        async def trace(event: str, info: Dict[str, Any]):
+            nonlocal waiting
+            if waiting and event.endswith("send_request_headers.started"):
+                waiting = False
+                waited = time.perf_counter() - started
+                self.wait_seconds += waited
+                if self.on_wait is not None:
+                    self.on_wait(self.origin, waited)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        return await super().handle_async_request(request)
+
+    def stats(self) -> Dict[str, Any]:
+        connections = self._pool.connections
+        idle = sum(1 for c in connections if c.is_idle())
+        active = sum(1 for c in connections if not c.is_idle() and not c.is_closed())
+        return {"active": active, "idle": idle, "requests": self.requests,
+                "wait_seconds_total": round(self.wait_seconds, 6)}
+
+
+class UpstreamHTTPClient:
+    """One httpx.AsyncClient shared by every upstream call in the worker, with a pool per upstream.
+
+    Each origin in `origins` (a Vertex region, an Ollama host, an api_base)
+    gets its own transport, so a slow or saturated upstream can't take
+    another's connections. After start, each pool opens `prewarm_connections`
+    connections in the background, and pools idle for `keepalive_ping_seconds`
+    are pinged with a HEAD request so their connections outlive quiet periods.
+    Other hosts share the default pool. HTTP/2 is used for HTTPS upstreams when
+    `http2` is set and the `h2` package is installed.
+
+    litellm is imported by `attach_litellm()`, not at startup: it is the
+    slowest import in the app.
+    """
+
+    def __init__(self, max_connections: int = 500, max_keepalive_connections: int = 100,
+                 keepalive_expiry: float = 30.0, timeout: float = 600.0, origins: Iterable[str] = (),
+                 pool_max_connections: Optional[int] = None, pool_max_keepalive_connections: Optional[int] = None,
+                 pool_keepalive_expiry: Optional[float] = None, http2: bool = False, prewarm_connections: int = 0,
+                 keepalive_ping_seconds: Optional[float] = None, prewarm_timeout: float = 5.0):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.pool_limits = httpx.Limits(
+            max_connections=pool_max_connections or max_connections,
+            max_keepalive_connections=pool_max_keepalive_connections or max_keepalive_connections,
+            keepalive_expiry=pool_keepalive_expiry or keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(timeout, connect=10.0)
+        self.origins = sorted(set(origins))
+        self.http2 = http2
+        self.prewarm_connections = prewarm_connections
+        self.keepalive_ping_seconds = keepalive_ping_seconds
+        self.prewarm_timeout = prewarm_timeout
+        self.on_wait: Optional[Callable[[str, float], None]] = None
+        # Per-origin request rewrites, such as the Ollama scheduler's keep_alive
+        self.request_hooks: Dict[str, Callable[[httpx.Request], httpx.Request]] = {}
+        self.transports: Dict[str, UpstreamTransport] = {}
+        self.client: httpx.AsyncClient = None
+        self.handler = None  # litellm AsyncHTTPHandler for Vertex AI and Ollama
+        self.pings = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        http2 = self.http2 and http2_available()
+        if self.http2 and not http2:
+            log.warning("http2_unavailable", reason="the h2 package is not installed; using HTTP/1.1")
+        self.transports = {
+            origin: UpstreamTransport(origin, on_wait=self.on_wait, rewrite=self.request_hooks.get(origin),
+                                      limits=self.pool_limits, http2=http2 and origin.startswith("https://"))
+            for origin in self.origins
+        }
+        self.client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout,
+                                        mounts={origin: transport for origin, transport in self.transports.items()})
+        if self.transports and (self.prewarm_connections or self.keepalive_ping_seconds):
+            self._task = asyncio.create_task(self._keep_warm())
+
+    async def attach_litellm(self):
+        """Route litellm's upstream calls through the shared pools; called once litellm is imported."""
+        import litellm
+        from litellm.llms.custom_httpx.http_handler import AsyncHTTPHandler
+
+        # OpenAI-compatible providers pick up the module-level session
+        litellm.aclient_session = self.client
+
+        # Vertex AI and Ollama calls take an AsyncHTTPHandler; point it at the shared pools
+        self.handler = AsyncHTTPHandler(timeout=self.timeout)
+        await self.handler.client.aclose()
+        self.handler.client = self.client
+
+    def completion_kwargs(self, model: str) -> dict:
+        if self.handler is not None and model.startswith(("vertex_ai/", "ollama/")):
+            return {"client": self.handler}
+        return {}
+
+    async def prewarm(self, origin: str, connections: int) -> int:
+        """Open up to `connections` connections to `origin` with concurrent HEAD requests; returns how many answered."""
+        if self.transports[origin].http2:
+            # One HTTP/2 connection multiplexes every request
+            connections = 1
+        results = await asyncio.gather(
+            *(self.client.head(origin + "/", timeout=self.prewarm_timeout) for _ in range(connections)),
+            return_exceptions=True,
+        )
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            log.warning("upstream_prewarm_failed", upstream=origin, failed=len(errors), error=str(errors[0]))
+        return connections - len(errors)
+
+    async def _keep_warm(self):
+        started = time.perf_counter()
+        if self.prewarm_connections:
+            opened = await asyncio.gather(*(self.prewarm(origin, self.prewarm_connections) for origin in self.transports))
+            log.info("upstream_pools_prewarmed", upstreams=len(self.transports), connections=sum(opened),
+                     seconds=round(time.perf_counter() - started, 3))
+        if not self.keepalive_ping_seconds:
+            return
+        while True:
+            await asyncio.sleep(self.keepalive_ping_seconds)
+            now = time.monotonic()
+            idle = [origin for origin, transport in self.transports.items()
+                    if now - transport.last_used >= self.keepalive_ping_seconds]
+            if idle:
+                self.pings += len(idle)
+                await asyncio.gather(*(self.prewarm(origin, max(1, self.prewarm_connections)) for origin in idle))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {origin: transport.stats() for origin, transport in self.transports.items()}
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.handler is not None:
+            import litellm
+
+            if litellm.aclient_session is self.client:
+                litellm.aclient_session = None
+        if self.client is not None:
+            await self.client.aclose()
+        self.client = None
+        self.handler = None
+
+
+def upstream_client_from_config(config: Dict[str, Any], origins: Iterable[str] = ()) -> UpstreamHTTPClient:
+    general = config.get("general_settings") or {}
+    pools = config.get("upstream_pools") or {}
+    enabled = pools.get("enabled", True)
+    return UpstreamHTTPClient(
+        max_connections=int(general.get("http_max_connections", 500)),
+        max_keepalive_connections=int(general.get("http_max_keepalive_connections", 100)),
+        origins=origins if enabled else (),
+        pool_max_connections=pools.get("max_connections"),
+        pool_max_keepalive_connections=pools.get("max_keepalive_connections"),
+        pool_keepalive_expiry=pools.get("keepalive_expiry_seconds"),
+        http2=bool(pools.get("http2", False)),
+        prewarm_connections=int(pools.get("prewarm_connections", 0)),
+        keepalive_ping_seconds=pools.get("keepalive_ping_seconds"),
+    )
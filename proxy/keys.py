@@ -0,0 +1,25 @@
+import hashlib
+from typing import Any, Dict
+
+from proxy.serialization import dumps_sorted
+
+# Fields that change how a response is delivered, not what it contains
+DELIVERY_FIELDS = {"stream", "stream_options", "user"}
+
+FINGERPRINT_PREFIX = "sha256:"
+
+
+def canonical_key(payload: Dict[str, Any]) -> str:
+    """Stable hash of a chat request: key order, whitespace and unset fields don't matter."""
+    normalized = {k: v for k, v in payload.items() if v is not None and k not in DELIVERY_FIELDS}
+    return hashlib.sha256(dumps_sorted(normalized)).hexdigest()
+
+
+def key_fingerprint(api_key: str) -> str:
+    """Stands in for an API key wherever it is kept: batch files, rate-limit buckets, sampling rules.
+
+    Idempotent, so a fingerprint can be passed where a key is expected.
+    """
+    if api_key.startswith(FINGERPRINT_PREFIX):
+        return api_key
+    return FINGERPRINT_PREFIX + hashlib.sha256(api_key.encode()).hexdigest()
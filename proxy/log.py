@@ -0,0 +1,191 @@
+import asyncio
+import contextvars
+import json
+import random
+import sys
+import time
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, TextIO
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+PAYLOAD_MODES = {"redact", "truncate", "full"}
+SECRET_FIELDS = {"api_key", "authorization", "secret_key", "password", "token"}
+
+current_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_request_id", default=None)
+# Whether current_request_id came from the client's X-Request-ID rather than being made here
+request_id_from_client: contextvars.ContextVar[bool] = contextvars.ContextVar("request_id_from_client", default=False)
+
+
+class StructuredLogger:
+    """JSON-lines logger that keeps stdout writes off the request path.
+
+    Calls only filter by level and sample rate, shrink the fields and append
+    the record to a bounded queue; a background task serializes and writes
+    batches on a worker thread. Records beyond `max_queue` are dropped and
+    counted. Before `start()` (scripts, tests) records are written directly.
+    """
+
+    def __init__(self, stream: TextIO = sys.stdout, level: str = "info",
+                 sample_rates: Optional[Dict[str, float]] = None, payload_mode: str = "redact",
+                 max_field_chars: int = 500, max_queue: int = 10000, flush_interval: float = 0.5):
+        self.stream = stream
+        self._queue: Deque[Dict[str, Any]] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self.configure(level, sample_rates, payload_mode, max_field_chars, max_queue, flush_interval)
+
+    def configure(self, level: str = "info", sample_rates: Optional[Dict[str, float]] = None,
+                  payload_mode: str = "redact", max_field_chars: int = 500, max_queue: int = 10000,
+                  flush_interval: float = 0.5):
+        if payload_mode not in PAYLOAD_MODES:
+            raise ValueError(f"payload_mode must be one of {sorted(PAYLOAD_MODES)}")
+        self.level = LEVELS[level]
+        self.sample_rates = {name: 1.0 for name in LEVELS}
+        self.sample_rates.update(sample_rates or {})
+        self.payload_mode = payload_mode
+        self.max_field_chars = max_field_chars
+        self.max_queue = max_queue
+        self.flush_interval = flush_interval
+
+    # Hot path
+
+    def debug(self, event: str, **fields):
+        self.log("debug", event, **fields)
+
+    def info(self, event: str, **fields):
+        self.log("info", event, **fields)
+
+    def warning(self, event: str, **fields):
+        self.log("warning", event, **fields)
+
+    def error(self, event: str, **fields):
+        self.log("error", event, **fields)
+
+    def log(self, level: str, event: str, **fields):
+        if LEVELS[level] < self.level:
+            return
+        rate = self.sample_rates.get(level, 1.0)
+        if rate < 1.0 and random.random() >= rate:
+            return
+        record = {"ts": time.time(), "level": level, "event": event}
+        request_id = current_request_id.get()
+        if request_id is not None:
+            record["request_id"] = request_id
+        for key, value in fields.items():
+            record[key] = self._field(key, value)
+
+        if self._task is None:
+            self._write([record])
+        elif len(self._queue) >= self.max_queue:
+            self.dropped += 1
+        else:
+            self._queue.append(record)
+
+    def payload(self, messages: Iterable[Dict[str, Any]]) -> Any:
+        """Messages as they should appear in logs: sizes only, truncated, or in full."""
+        if self.payload_mode == "full":
+            return list(messages)
+        if self.payload_mode == "truncate":
+            return [{**m, "content": self._truncate(m.get("content"))} for m in messages]
+        return [{"role": m.get("role"), "chars": len(m.get("content") or "")} for m in messages]
+
+    def _field(self, key: str, value: Any) -> Any:
+        if key in SECRET_FIELDS:
+            return "[redacted]"
+        if isinstance(value, str):
+            return self._truncate(value)
+        return value
+
+    def _truncate(self, value: Any) -> Any:
+        if isinstance(value, str) and len(value) > self.max_field_chars:
+            return value[:self.max_field_chars] + f"...[{len(value) - self.max_field_chars} chars truncated]"
+        return value
+
+    # Background writer
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._write_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._queue:
+            await asyncio.to_thread(self._write, self._take())
+
+    async def _write_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self._queue:
+                await asyncio.to_thread(self._write, self._take())
+
+    def _take(self) -> List[Dict[str, Any]]:
+        return [self._queue.popleft() for _ in range(len(self._queue))]
+
+    def _write(self, records: List[Dict[str, Any]]):
+        lines = "".join(json.dumps(r, default=str, separators=(",", ":")) + "\n" for r in records)
+        try:
+            self.stream.write(lines)
+            self.stream.flush()
+        except (OSError, ValueError):
+            self.dropped += len(records)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queue_depth": len(self._queue), "dropped": self.dropped}
+
+
+log = StructuredLogger()
+
+
+def configure_from_config(config: Dict[str, Any]):
+    settings = config.get("logging") or {}
+    log.configure(
+        level=settings.get("level", "info"),
+        sample_rates=settings.get("sample_rates"),
+        payload_mode=settings.get("payload_mode", "redact"),
+        max_field_chars=int(settings.get("max_field_chars", 500)),
+        max_queue=int(settings.get("max_queue", 10000)),
+        flush_interval=float(settings.get("flush_interval_seconds", 0.5)),
+    )
+
+
+class RequestIdMiddleware:
+    """Pure ASGI middleware giving every request an ID for logs, traces and the X-Request-ID header.
+
+    An incoming X-Request-ID is reused so IDs can be followed across services.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request_id = None
+        for name, value in scope.get("headers") or []:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:128]
+                break
+        from_client = request_id is not None
+        request_id = request_id or uuid.uuid4().hex
+        token = current_request_id.set(request_id)
+        client_token = request_id_from_client.set(from_client)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []),
+                                                  (b"x-request-id", request_id.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request_id.reset(token)
+            request_id_from_client.reset(client_token)
@@ -0,0 +1,368 @@
+import asyncio
+import contextvars
+import json
+import math
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from proxy.log import log
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+OVERHEAD_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+GAUGE_MERGES = ("sum", "max", "min")
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+
+    def labels(self, *values: Any):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"type": self.kind, "help": self.documentation, "labelnames": list(self.labelnames),
+                "samples": [[list(k), self._dump(c)] for k, c in self._children.items()]}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def _dump(self, child: _CounterChild):
+        return child.value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _dump(self, child: _HistogramChild):
+        return [child.counts, child.sum]
+
+    def snapshot(self) -> Dict[str, Any]:
+        data = super().snapshot()
+        data["buckets"] = list(self.buckets)
+        return data
+
+
+class MetricsRegistry:
+    """Counters and histograms rendered in the Prometheus text format.
+
+    Recording is a dict lookup plus an integer add on the event loop, with no
+    locks. With several workers, each one periodically writes a snapshot to
+    `multiprocess_dir` and a scrape of any worker merges all of them; gauges
+    only count workers that are still alive, combined by their `merge` rule.
+    """
+
+    def __init__(self, multiprocess_dir: Optional[str] = None, flush_interval: float = 5.0):
+        self.metrics: Dict[str, _Metric] = {}
+        self.gauge_callbacks: List[Tuple[str, str, Tuple[str, ...], Callable[[], Dict[Tuple, float]], str]] = []
+        self.multiprocess_dir = multiprocess_dir
+        self.flush_interval = flush_interval
+        self._task: Optional[asyncio.Task] = None
+        if multiprocess_dir:
+            os.makedirs(multiprocess_dir, exist_ok=True)
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.metrics.setdefault(name, Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.metrics.setdefault(name, Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str],
+              collect: Callable[[], Dict[Tuple, float]], merge: str = "sum"):
+        """Register a gauge read from `collect()` at scrape time: {label values: value}.
+
+        `merge` combines the workers' values: "sum" for what each worker holds
+        on its own, like queued requests; "max" or "min" for state the workers
+        share or each keep a copy of, like a shared cache's size.
+        """
+        if merge not in GAUGE_MERGES:
+            raise ValueError(f"merge must be one of {GAUGE_MERGES}")
+        self.gauge_callbacks.append((name, documentation, tuple(labelnames), collect, merge))
+
+    def snapshot(self) -> Dict[str, Any]:
+        data = {name: metric.snapshot() for name, metric in self.metrics.items()}
+        for name, documentation, labelnames, collect, merge in self.gauge_callbacks:
+            data[name] = {"type": "gauge", "help": documentation, "labelnames": list(labelnames), "merge": merge,
+                          "samples": [[[str(v) for v in k], float(value)] for k, value in collect().items()]}
+        return data
+
+    # Multi-worker aggregation
+
+    async def start(self):
+        if self.multiprocess_dir:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.multiprocess_dir:
+            self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                log.warning("metrics_flush_failed", error=str(e))
+
+    def flush(self):
+        path = os.path.join(self.multiprocess_dir, f"{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def _worker_snapshots(self) -> Iterable[Tuple[bool, Dict[str, Any]]]:
+        yield True, self.snapshot()
+        if not self.multiprocess_dir:
+            return
+        own = f"{os.getpid()}.json"
+        for name in os.listdir(self.multiprocess_dir):
+            if not name.endswith(".json") or name == own:
+                continue
+            try:
+                with open(os.path.join(self.multiprocess_dir, name)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            yield _pid_alive(int(name[:-5])) if name[:-5].isdigit() else False, data
+
+    def collect(self) -> Dict[str, Any]:
+        """Merge the snapshots of every worker: counters and histograms add, live gauges follow their merge rule."""
+        merged: Dict[str, Any] = {}
+        for alive, snapshot in self._worker_snapshots():
+            for name, metric in snapshot.items():
+                if metric["type"] == "gauge" and not alive:
+                    continue
+                target = merged.setdefault(name, {**metric, "samples": {}})
+                for labels, value in metric["samples"]:
+                    key = tuple(labels)
+                    current = target["samples"].get(key)
+                    if metric["type"] == "histogram":
+                        if current is None:
+                            target["samples"][key] = [list(value[0]), value[1]]
+                        else:
+                            current[0] = [a + b for a, b in zip(current[0], value[0])]
+                            current[1] += value[1]
+                    elif current is None:
+                        target["samples"][key] = value
+                    elif metric.get("merge") == "max":
+                        target["samples"][key] = max(current, value)
+                    elif metric.get("merge") == "min":
+                        target["samples"][key] = min(current, value)
+                    else:
+                        target["samples"][key] = current + value
+        return merged
+
+    def render(self) -> str:
+        lines = []
+        for name, metric in sorted(self.collect().items()):
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            labelnames = metric["labelnames"]
+            for labels, value in metric["samples"].items():
+                if metric["type"] == "histogram":
+                    counts, total = value
+                    cumulative = 0
+                    for bound, count in zip(metric["buckets"] + [math.inf], counts):
+                        cumulative += count
+                        le = "+Inf" if bound == math.inf else repr(float(bound))
+                        lines.append(f"{name}_bucket{_labels(labelnames, labels, le)} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labelnames, labels)} {total}")
+                    lines.append(f"{name}_count{_labels(labelnames, labels)} {cumulative}")
+                else:
+                    lines.append(f"{name}{_labels(labelnames, labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def clear_snapshots(multiprocess_dir: Optional[str]):
+    """Remove the worker snapshots left in `multiprocess_dir` by earlier runs.
+
+    The launcher calls this before starting the workers, so counters start
+    from zero each run while those of workers exiting during it still count.
+    """
+    if not multiprocess_dir or not os.path.isdir(multiprocess_dir):
+        return
+    for name in os.listdir(multiprocess_dir):
+        if name.endswith((".json", ".json.tmp")):
+            try:
+                os.remove(os.path.join(multiprocess_dir, name))
+            except FileNotFoundError:
+                pass
+
+
+def _labels(names: List[str], values: Tuple[str, ...], le: Optional[str] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class RequestTimings:
+    """Per-request timing and labels, filled in by the handler and read by MetricsMiddleware."""
+
+    __slots__ = ("started", "model", "stream", "dispatch_seconds", "error_class")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.model = "unknown"
+        self.stream = False
+        self.dispatch_seconds = 0.0
+        self.error_class: Optional[str] = None
+
+
+current_timings: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar(
+    "current_timings", default=None)
+
+
+@contextmanager
+def dispatch_timer():
+    """Count the enclosed queueing, retries and upstream calls as dispatch time, whether they succeed or not."""
+    timings = current_timings.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings.dispatch_seconds += time.perf_counter() - started
+
+
+def error_class(e: Exception) -> str:
+    """Coarse error classes for the errors_total counter."""
+    if isinstance(e, (asyncio.TimeoutError, TimeoutError)):
+        return "timeout"
+    return status_error_class(getattr(e, "status_code", None))
+
+
+def status_error_class(status: Optional[int]) -> str:
+    if status in (408, 504):
+        return "timeout"
+    if status == 429:
+        return "rate_limited"
+    if status == 503:
+        return "unavailable"
+    if status is not None and 400 <= status < 500:
+        return "client_error"
+    if status is not None and status >= 500:
+        return "upstream_error"
+    return "internal"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware timing whole requests, up to the last byte of the body.
+
+    Only paths in `paths` are timed. Total minus the time spent in routing,
+    queues and upstream calls (`RequestTimings.dispatch_seconds`) is the
+    proxy's own overhead: request parsing, cache lookups, normalization and
+    serialization.
+    """
+
+    def __init__(self, app, registry: MetricsRegistry, paths: Iterable[str]):
+        self.app = app
+        self.paths = set(paths)
+        self.requests = registry.counter(
+            "proxy_requests_total", "Requests by model and HTTP status.", ("model", "status"))
+        self.errors = registry.counter(
+            "proxy_errors_total", "Failed requests by model and error class.", ("model", "error_class"))
+        self.total = registry.histogram(
+            "proxy_request_duration_seconds", "Total request latency, to the last byte.", ("model", "stream"))
+        self.overhead = registry.histogram(
+            "proxy_overhead_seconds", "Time spent in the proxy itself, excluding queues and upstream calls.",
+            ("model",), buckets=OVERHEAD_BUCKETS)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_timings.reset(token)
+            elapsed = time.perf_counter() - timings.started
+            self.requests.labels(timings.model, status).inc()
+            if status >= 400:
+                self.errors.labels(timings.model, timings.error_class or status_error_class(status)).inc()
+            self.total.labels(timings.model, "true" if timings.stream else "false").observe(elapsed)
+            if not timings.stream:
+                self.overhead.labels(timings.model).observe(max(0.0, elapsed - timings.dispatch_seconds))
+
@@ -0,0 +1,298 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import httpx
+
+from proxy.admission import AdmissionRejected
+from proxy.http_client import deployment_origin
+from proxy.router import Router
+from proxy.serialization import dumps, loads
+
+OLLAMA_PATHS = ("/api/generate", "/api/chat")
+
+
+class AIMDLimit:
+    """Concurrency limit grown additively while latency holds and cut multiplicatively when it doesn't.
+
+    Latency is compared with the lowest of the last `window` samples: one
+    above `tolerance` times that baseline, or a failed call, multiplies the
+    limit by `decrease` (at most once per `limit` completions, so one burst of
+    slow calls counts once). Otherwise the limit grows by 1/limit per
+    completion, about one slot per round of calls, but only while it is
+    actually the bottleneck. Streams' first-token latencies keep a baseline
+    of their own, apart from whole responses.
+    """
+
+    def __init__(self, initial: int = 1, min_limit: int = 1, max_limit: int = 8, decrease: float = 0.5,
+                 tolerance: float = 2.0, window: int = 50):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease = decrease
+        self.tolerance = tolerance
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.first_token_samples: Deque[float] = deque(maxlen=window)
+        self._since_decrease = 0
+
+    @property
+    def current(self) -> int:
+        return max(self.min_limit, min(self.max_limit, int(self.limit)))
+
+    def observe(self, latency: Optional[float], ok: bool = True, saturated: bool = True, first_token: bool = False):
+        self._since_decrease += 1
+        congested = not ok
+        if ok and latency is not None:
+            samples = self.first_token_samples if first_token else self.samples
+            samples.append(latency)
+            congested = latency > self.tolerance * min(samples)
+        if congested:
+            if self._since_decrease >= self.current:
+                self.limit = max(float(self.min_limit), self.limit * self.decrease)
+                self._since_decrease = 0
+        elif saturated:
+            self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+
+
+class OllamaLane:
+    """One model's view of its host's scheduler, used as the deployment's limiter."""
+
+    def __init__(self, scheduler: "OllamaScheduler", model: str):
+        self.scheduler = scheduler
+        self.model = model
+
+    async def acquire(self):
+        await self.scheduler.acquire(self.model)
+
+    def release(self):
+        self.scheduler.release(self.model)
+
+    def observe(self, latency: Optional[float], ok: bool = True, first_token: bool = False):
+        self.scheduler.observe(self.model, latency, ok, first_token)
+
+
+class OllamaScheduler:
+    """Admission for one Ollama server, grouping queued requests by model.
+
+    Ollama runs a few requests at a time for each loaded model and unloads
+    models that go idle, so interleaving models makes it load and unload them
+    over and over. Here at most `max_active_models` models are served at once.
+    Requests for other models queue, grouped by model, and once an active model
+    has nothing queued or in flight, the model whose oldest request has waited
+    longest takes its place. So that a busy model can't starve the rest, once
+    another model's request has waited `max_wait_seconds` the active models
+    stop taking new requests and are swapped out as soon as they drain.
+
+    Each model's concurrency follows an AIMDLimit on the latency the router
+    measures (first chunk for streams, the whole response otherwise, each
+    against its own baseline). Models
+    asked for at least `hot_requests_per_minute` get `keep_alive` added to
+    their requests, so Ollama keeps them loaded between bursts.
+    """
+
+    def __init__(self, host: str, max_active_models: int = 1, max_wait_seconds: float = 10.0,
+                 max_queue: int = 200, queue_timeout_seconds: float = 60.0, initial_concurrency: int = 1,
+                 min_concurrency: int = 1, max_concurrency: int = 8, decrease: float = 0.5,
+                 latency_tolerance: float = 2.0, keep_alive: Optional[str] = "30m",
+                 hot_requests_per_minute: float = 6.0):
+        self.host = host
+        self.max_active_models = max_active_models
+        self.max_wait_seconds = max_wait_seconds
+        self.max_queue = max_queue
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.keep_alive = keep_alive
+        self.hot_requests_per_minute = hot_requests_per_minute
+        self._limit_settings = {"initial": initial_concurrency, "min_limit": min_concurrency,
+                                "max_limit": max_concurrency, "decrease": decrease, "tolerance": latency_tolerance}
+
+        self.active: List[str] = []
+        self.limits: Dict[str, AIMDLimit] = {}
+        self.in_flight: Dict[str, int] = {}
+        self.queues: Dict[str, Deque[Tuple[asyncio.Future, float]]] = {}
+        self._recent: Dict[str, Deque[float]] = {}
+        self._recently_active: Deque[str] = deque(maxlen=max_active_models)
+
+        self.switches = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+
+    def lane(self, model: str) -> OllamaLane:
+        self.limits.setdefault(model, AIMDLimit(**self._limit_settings))
+        self.in_flight.setdefault(model, 0)
+        self.queues.setdefault(model, deque())
+        self._recent.setdefault(model, deque())
+        return OllamaLane(self, model)
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    # Admission
+
+    async def acquire(self, model: str):
+        self._note_request(model)
+        queue = self.queues[model]
+        if not queue and self._can_admit(model, time.monotonic()):
+            self._admit(model)
+            return
+
+        if self.queued >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise AdmissionRejected(f"Too many requests queued for Ollama at {self.host}", 429,
+                                    self.queue_timeout_seconds)
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append((waiter, time.monotonic()))
+        self._dispatch()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout_seconds)
+        except asyncio.TimeoutError:
+            self.rejected_timeout += 1
+            raise AdmissionRejected(
+                f"Timed out after {self.queue_timeout_seconds}s waiting for Ollama at {self.host} to serve {model}",
+                503, self.queue_timeout_seconds,
+            )
+        except BaseException:
+            # Cancelled while waiting; if a slot was already handed over, give it back
+            if waiter.done() and not waiter.cancelled():
+                self.release(model)
+            raise
+        finally:
+            for entry in queue:
+                if entry[0] is waiter:
+                    queue.remove(entry)
+                    break
+            self._dispatch()
+
+    def release(self, model: str):
+        self.in_flight[model] -= 1
+        self._dispatch()
+
+    def observe(self, model: str, latency: Optional[float], ok: bool = True, first_token: bool = False):
+        limit = self.limits[model]
+        # Called before release, so the finished call still counts as in flight
+        saturated = bool(self.queues[model]) or self.in_flight[model] >= limit.current
+        limit.observe(latency, ok, saturated, first_token)
+
+    def _admit(self, model: str):
+        if model not in self.active:
+            self._activate(model)
+        self.in_flight[model] += 1
+        self.admitted += 1
+
+    def _activate(self, model: str):
+        self.active.append(model)
+        # Going idle and back to the same model costs Ollama nothing
+        if model not in self._recently_active:
+            self.switches += 1
+            self._recently_active.append(model)
+
+    def _starving(self, now: float) -> bool:
+        return any(queue and model not in self.active and now - queue[0][1] >= self.max_wait_seconds
+                   for model, queue in self.queues.items())
+
+    def _can_admit(self, model: str, now: float) -> bool:
+        if self.in_flight[model] >= self.limits[model].current or self._starving(now):
+            return False
+        if model in self.active:
+            return True
+        return len(self.active) < self.max_active_models and not any(
+            queue for other, queue in self.queues.items() if other != model and other not in self.active)
+
+    def _dispatch(self):
+        starving = self._starving(time.monotonic())
+        # Retire drained models; while another model is starving, retire every idle one
+        retired = [model for model in self.active
+                   if not self.in_flight[model] and (starving or not self.queues[model])]
+        self.active = [model for model in self.active if model not in retired]
+
+        # Longest-waiting first, but a model just retired goes behind the ones it kept waiting
+        waiting = sorted((model in retired, queue[0][1], model) for model, queue in self.queues.items()
+                         if queue and model not in self.active)
+        activated = [model for _, _, model in waiting[:max(0, self.max_active_models - len(self.active))]]
+        for model in activated:
+            self._activate(model)
+
+        for model in self.active:
+            # While another model is starving, only the models that just got their turn admit
+            if starving and model not in activated:
+                continue
+            queue = self.queues[model]
+            while queue and self.in_flight[model] < self.limits[model].current:
+                waiter, _ = queue.popleft()
+                if waiter.done():
+                    continue
+                waiter.set_result(None)
+                self.in_flight[model] += 1
+                self.admitted += 1
+
+    # keep_alive
+
+    def _note_request(self, model: str):
+        recent = self._recent[model]
+        now = time.monotonic()
+        recent.append(now)
+        while recent and now - recent[0] > 60.0:
+            recent.popleft()
+
+    def is_hot(self, model: str) -> bool:
+        recent = self._recent.get(model)
+        return bool(recent) and len(recent) >= self.hot_requests_per_minute
+
+    def with_keep_alive(self, request: httpx.Request) -> httpx.Request:
+        """Add keep_alive to generate and chat calls for hot models; litellm's ollama provider can't send it."""
+        if (self.keep_alive is None or request.method != "POST"
+                or not request.url.path.endswith(OLLAMA_PATHS)):
+            return request
+        try:
+            body = loads(request.content)
+        except (httpx.RequestNotRead, ValueError):
+            return request
+        if not isinstance(body, dict) or "keep_alive" in body or not self.is_hot(body.get("model")):
+            return request
+        body["keep_alive"] = self.keep_alive
+        headers = [(k, v) for k, v in request.headers.raw if k.lower() != b"content-length"]
+        return httpx.Request(request.method, request.url, headers=headers, content=dumps(body),
+                             extensions=request.extensions)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": list(self.active),
+            "switches": self.switches,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "models": {model: {"limit": self.limits[model].current, "in_flight": self.in_flight[model],
+                               "queued": len(self.queues[model]), "hot": self.is_hot(model)}
+                       for model in self.limits},
+        }
+
+
+SCHEDULER_FIELDS = {"max_active_models", "max_wait_seconds", "max_queue", "queue_timeout_seconds",
+                    "initial_concurrency", "min_concurrency", "max_concurrency", "decrease", "latency_tolerance",
+                    "keep_alive", "hot_requests_per_minute"}
+
+
+def ollama_schedulers_from_config(config: Dict[str, Any], router: Router) -> Dict[str, OllamaScheduler]:
+    """One scheduler per Ollama host, set as the limiter of every `ollama/` deployment on it.
+
+    Replaces any deployment_max_concurrency limiter on those deployments; the
+    model-level admission limits still apply in front of it.
+    """
+    settings = config.get("ollama_scheduler") or {}
+    if not settings.get("enabled", True):
+        return {}
+    options = {k: v for k, v in settings.items() if k in SCHEDULER_FIELDS}
+    schedulers: Dict[str, OllamaScheduler] = {}
+    for deployment in router.deployments.values():
+        if not deployment.model.startswith("ollama/"):
+            continue
+        host = deployment_origin(deployment.model, deployment.default_params.get("api_base"))
+        scheduler = schedulers.get(host)
+        if scheduler is None:
+            scheduler = schedulers[host] = OllamaScheduler(host, **options)
+        # Lanes are keyed by Ollama's own model name, the one in request bodies
+        deployment.limiter = scheduler.lane(deployment.model.split("/", 1)[1])
+    return schedulers
@@ -0,0 +1,181 @@
+import json
+import math
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from proxy.keys import key_fingerprint
+from proxy.serialization import loads
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+class TokenBucket:
+    """Classic token bucket refilled lazily on access, so every operation is O(1)."""
+
+    def __init__(self, per_minute: float, now: Optional[float] = None):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` tokens are available, 0 if they are now."""
+        self._refill(now)
+        # Requests bigger than the whole bucket are let through once it is full
+        needed = min(amount, self.capacity) - self.tokens
+        return needed / self.rate if needed > 0 else 0.0
+
+    def charge(self, amount: float):
+        # May go negative: usage above the estimate is paid back from future refills
+        self.tokens -= amount
+
+
+class Reservation:
+    def __init__(self, buckets: List[TokenBucket], estimated_tokens: int, shared=None, shared_keys=()):
+        self.token_buckets = buckets
+        self.estimated_tokens = estimated_tokens
+        self.shared = shared  # SharedBuckets holding shared_keys when quotas span workers
+        self.shared_keys = list(shared_keys)
+
+
+def estimate_tokens(messages: List[Dict[str, Any]], max_tokens: Optional[int] = None) -> int:
+    """Rough prompt + completion token estimate (~4 characters per token), no tokenizer needed."""
+    chars = 0
+    for message in messages:
+        content = message.get("content")
+        chars += len(content) if isinstance(content, str) else len(json.dumps(content, default=str))
+    return chars // 4 + 4 * len(messages) + (max_tokens or 0)
+
+
+class RateLimiter:
+    """Requests/minute and tokens/minute buckets per API key and per model.
+
+    All bucket checks and charges for one request happen without awaiting,
+    so on the event loop they are atomic and need no locks. With `shared`
+    (a SharedBuckets), balances live in the shared store instead and each
+    request is checked and charged in one transaction across all workers.
+    """
+
+    def __init__(self, config: Dict[str, Any], shared=None):
+        settings = config.get("rate_limits") or {}
+        self.enabled = settings.get("enabled", True)
+        self.default_key_limits = settings.get("default_key") or {}
+        # Keys are only held as fingerprints, so batch jobs can be limited without storing the key
+        self.key_limits = {key_fingerprint(key): limits for key, limits in (settings.get("keys") or {}).items()}
+        self.model_limits = {
+            entry["model_name"]: entry["rate_limits"]
+            for entry in config.get("model_list") or [] if entry.get("rate_limits")
+        }
+        self._buckets: Dict[Tuple[str, str, str], TokenBucket] = {}
+        self.shared = shared
+        self.rejected = 0
+
+    def _bucket(self, scope: str, name: str, kind: str, limits: Dict[str, Any]) -> Optional[TokenBucket]:
+        limit = limits.get(kind)
+        if not limit:
+            return None
+        key = (scope, name, kind)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(limit)
+        return bucket
+
+    def acquire(self, api_key: str, model: str, estimated_tokens: int) -> Optional[Reservation]:
+        """Charge one request; `api_key` may be the key or its key_fingerprint."""
+        if not self.enabled:
+            return None
+
+        api_key = key_fingerprint(api_key)
+        key_limits = self.key_limits.get(api_key, self.default_key_limits)
+        model_limits = self.model_limits.get(model, {})
+        scopes = (("key", api_key, key_limits), ("model", model, model_limits))
+        if self.shared is not None:
+            return self._acquire_shared(scopes, model, estimated_tokens)
+        request_buckets = [b for scope, name, limits in scopes if (b := self._bucket(scope, name, "rpm", limits))]
+        token_buckets = [b for scope, name, limits in scopes if (b := self._bucket(scope, name, "tpm", limits))]
+
+        now = time.monotonic()
+        wait = max(
+            [b.wait_time(1, now) for b in request_buckets] +
+            [b.wait_time(estimated_tokens, now) for b in token_buckets] +
+            [0.0]
+        )
+        if wait > 0:
+            self.rejected += 1
+            raise RateLimitExceeded(f"Rate limit exceeded for {model}", wait)
+
+        for bucket in request_buckets:
+            bucket.charge(1)
+        for bucket in token_buckets:
+            bucket.charge(estimated_tokens)
+        return Reservation(token_buckets, estimated_tokens)
+
+    def _acquire_shared(self, scopes, model: str, estimated_tokens: int) -> Reservation:
+        requests = []
+        token_keys = []
+        for scope, name, limits in scopes:
+            for kind, amount in (("rpm", 1), ("tpm", estimated_tokens)):
+                if limits.get(kind):
+                    key = f"{scope}:{name}:{kind}"
+                    requests.append((key, float(limits[kind]), amount))
+                    if kind == "tpm":
+                        token_keys.append(key)
+
+        wait = self.shared.take(requests) if requests else 0.0
+        if wait > 0:
+            self.rejected += 1
+            raise RateLimitExceeded(f"Rate limit exceeded for {model}", wait)
+        return Reservation([], estimated_tokens, self.shared, token_keys)
+
+    def stats(self) -> Dict[str, Any]:
+        buckets = len(self.shared) if self.shared is not None else len(self._buckets)
+        return {"rejected": self.rejected, "buckets": buckets}
+
+    @staticmethod
+    def reconcile(reservation: Optional[Reservation], usage: Optional[Dict[str, Any]]):
+        """Correct the token buckets once the real usage is known."""
+        if reservation is None or not usage:
+            return
+        actual = usage.get("total_tokens")
+        if actual is None:
+            return
+        for bucket in reservation.token_buckets:
+            bucket.charge(actual - reservation.estimated_tokens)
+        if reservation.shared is not None and reservation.shared_keys:
+            reservation.shared.charge(reservation.shared_keys, actual - reservation.estimated_tokens)
+        reservation.estimated_tokens = actual
+
+    @staticmethod
+    def refund(reservation: Optional[Reservation]):
+        """Give back the tokens held for a request whose upstream call failed before producing any."""
+        RateLimiter.reconcile(reservation, {"total_tokens": 0})
+
+
+async def reconcile_stream(stream: AsyncIterator[bytes], reservation: Optional[Reservation]) -> AsyncIterator[bytes]:
+    """Pass SSE frames through, reconciling the reservation from the trailing usage chunk."""
+    async for frame in stream:
+        if reservation is not None and b'"usage":{' in frame:
+            try:
+                RateLimiter.reconcile(reservation, loads(frame[len(b"data: "):]).get("usage"))
+            except ValueError:
+                pass
+        yield frame
+
+
+def api_key_from_header(authorization: Optional[str]) -> str:
+    if not authorization:
+        return "anonymous"
+    scheme, _, token = authorization.partition(" ")
+    return token.strip() if scheme.lower() == "bearer" and token.strip() else authorization.strip()
@@ -0,0 +1,112 @@
+import asyncio
+import random
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Optional
+
+from proxy.budget import RatioBudget
+
+# Throttling, overload and transient gateway failures; other 4xx are the caller's mistake
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Seconds from a Retry-After header on the error or its upstream response, if any."""
+    headers = getattr(error, "headers", None) or getattr(getattr(error, "response", None), "headers", None) or {}
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: Exception) -> bool:
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES
+
+
+class RetryPolicy:
+    """Retries retryable upstream errors with capped exponential backoff and full jitter.
+
+    The wait before retry `n` is uniform in [0, min(max_delay, base_delay * 2**(n-1))],
+    raised to the upstream's Retry-After when it asks for longer. A retry is only
+    made while it can still start before `deadline_seconds` from the first attempt,
+    and while the process-wide budget allows: retries stay under `budget_ratio` of
+    requests, so an upstream outage cannot turn into a retry storm.
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay_seconds: float = 0.25, max_delay_seconds: float = 5.0,
+                 deadline_seconds: float = 30.0, budget_ratio: float = 0.1, max_retry_after_seconds: float = 10.0):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay_seconds = base_delay_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.deadline_seconds = deadline_seconds
+        self.max_retry_after_seconds = max_retry_after_seconds
+        self.budget = RatioBudget(ratio=budget_ratio, max_tokens=max(1.0, 100 * budget_ratio))
+        self.outcomes = Counter()
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay_seconds, self.base_delay_seconds * 2 ** (attempt - 1)))
+
+    def next_delay(self, error: Exception, attempt: int, elapsed: float, deadline_seconds: Optional[float] = None):
+        """(seconds to wait, None) before the next attempt, or (None, reason) to give up."""
+        if not is_retryable(error):
+            return None, "not_retryable"
+        if attempt >= self.max_attempts:
+            return None, "attempts_exhausted"
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None and retry_after > self.max_retry_after_seconds:
+            return None, "retry_after_too_long"
+        delay = max(self.backoff(attempt), retry_after or 0.0)
+        if deadline_seconds is None or deadline_seconds > self.deadline_seconds:
+            deadline_seconds = self.deadline_seconds
+        if elapsed + delay >= deadline_seconds:
+            return None, "deadline"
+        if not self.budget.try_spend():
+            return None, "budget_exhausted"
+        return delay, None
+
+    async def run(self, call: Callable[[int], Awaitable[Any]],
+                  on_outcome: Optional[Callable[[str, Exception, int, Optional[float]], None]] = None,
+                  deadline_seconds: Optional[float] = None) -> Any:
+        """Await `call(attempt)` until it succeeds or a retry is not allowed; the last error is raised.
+
+        `deadline_seconds`, e.g. what is left of the request's own deadline,
+        tightens the policy's deadline for this call.
+
+        `on_outcome(outcome, error, attempt, delay)` sees every failed attempt of a
+        retryable error: "retried" with the wait, or the reason for giving up.
+        """
+        self.budget.deposit()
+        started = time.monotonic()
+        attempt = 1
+        while True:
+            try:
+                return await call(attempt)
+            except Exception as e:
+                delay, reason = self.next_delay(e, attempt, time.monotonic() - started, deadline_seconds)
+                outcome = reason or "retried"
+                if outcome != "not_retryable":
+                    self.outcomes[outcome] += 1
+                    if on_outcome is not None:
+                        on_outcome(outcome, e, attempt, delay)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stats(self):
+        return {**self.outcomes, "budget": self.budget.stats()}
+
+
+def retry_policy_from_config(config: dict) -> Optional[RetryPolicy]:
+    settings = dict(config.get("retries") or {})
+    if not settings.pop("enabled", True):
+        return None
+    return RetryPolicy(**settings)
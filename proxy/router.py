@@ -0,0 +1,190 @@
+import bisect
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from proxy.circuit_breaker import CircuitBreaker
+
+ROUTING_STRATEGIES = ("weighted", "least-outstanding")
+
+# litellm_params keys that describe the deployment rather than the call
+DEPLOYMENT_KEYS = {"model", "model_id", "weight"}
+
+
+class UnknownModelError(LookupError):
+    pass
+
+
+class NoHealthyDeploymentError(LookupError):
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"Every deployment of `{model}` is failing, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class Deployment:
+    def __init__(self, model_name: str, litellm_params: Dict[str, Any], index: int,
+                 breaker_settings: Optional[Dict[str, Any]] = None):
+        self.model_name = model_name
+        self.model = litellm_params["model"]
+        self.model_id = litellm_params.get("model_id")
+        self.id = f"{model_name}#{index}"
+        self.weight = float(litellm_params.get("weight", 1.0))
+        self.default_params = {k: v for k, v in litellm_params.items() if k not in DEPLOYMENT_KEYS}
+        self.is_vertex = self.model.startswith("vertex_ai/")
+        self.region = litellm_params.get("vertex_location")
+        self.breaker = CircuitBreaker(**(breaker_settings or {}))
+        self.limiter = None  # ConcurrencyLimiter or OllamaLane, attached at startup
+        self.outstanding = 0
+
+    async def acquire(self):
+        if self.limiter is not None:
+            await self.limiter.acquire()
+        self.outstanding += 1
+        self.breaker.before_call()
+
+    def release(self):
+        self.outstanding -= 1
+        self.breaker.release_probe()
+        if self.limiter is not None:
+            self.limiter.release()
+
+    def record_success(self, latency: float, first_token: bool = False):
+        self.breaker.record_success(latency, first_token)
+        if self.limiter is not None:
+            self.limiter.observe(latency, first_token=first_token)
+
+    def record_failure(self):
+        self.breaker.record_failure()
+        if self.limiter is not None:
+            self.limiter.observe(None, ok=False)
+
+
+class ModelGroup:
+    """All deployments serving one public model name."""
+
+    def __init__(self, name: str, strategy: str):
+        if strategy not in ROUTING_STRATEGIES:
+            raise ValueError(f"Unknown routing strategy {strategy!r}, expected one of {ROUTING_STRATEGIES}")
+        self.name = name
+        self.strategy = strategy
+        self.deployments: List[Deployment] = []
+        # Models tried in order when this one fails or is slower than fallback_ttft_seconds
+        self.fallbacks: List[str] = []
+        self.fallback_ttft_seconds: Optional[float] = None
+        # Deadline for requests without a shorter X-Request-Timeout; None uses general_settings
+        self.request_timeout_seconds: Optional[float] = None
+        self._cumulative_weights: List[float] = []
+
+    def add(self, deployment: Deployment):
+        self.deployments.append(deployment)
+        total = self._cumulative_weights[-1] if self._cumulative_weights else 0.0
+        self._cumulative_weights.append(total + max(deployment.weight, 0.0))
+
+    def pick(self, exclude: Optional[Deployment] = None) -> Optional[Deployment]:
+        """Choose a deployment whose circuit allows traffic.
+
+        Raises NoHealthyDeploymentError when every circuit is open; returns
+        None when the only healthy deployment is the excluded one.
+        """
+        healthy = [d for d in self.deployments if d.breaker.allow()]
+        if not healthy:
+            retry_after = min(d.breaker.retry_after() for d in self.deployments)
+            raise NoHealthyDeploymentError(self.name, retry_after)
+
+        candidates = [d for d in healthy if d is not exclude]
+        if not candidates:
+            return None
+        if len(candidates) == 1:
+            return candidates[0]
+        if self.strategy == "least-outstanding":
+            return min(candidates, key=lambda d: d.outstanding)
+        if len(candidates) == len(self.deployments):
+            point = random.random() * self._cumulative_weights[-1]
+            return self.deployments[bisect.bisect_right(self._cumulative_weights, point)]
+        return random.choices(candidates, weights=[d.weight for d in candidates])[0]
+
+
+class Router:
+    """Lookup table from model names and aliases to deployments, compiled once from model_list.
+
+    Vertex AI entries without an explicit `vertex_location` get one deployment
+    per entry in `vertex_locations`.
+    """
+
+    def __init__(self, model_list: List[Dict[str, Any]], routing_strategy: str = "weighted",
+                 vertex_locations: Optional[List[str]] = None,
+                 breaker_settings: Optional[Dict[str, Any]] = None):
+        self.groups: Dict[str, ModelGroup] = {}
+        self.deployments: Dict[str, Deployment] = {}
+        self._table: Dict[str, ModelGroup] = {}
+
+        for entry in model_list or []:
+            name = entry["model_name"]
+            group = self.groups.get(name)
+            if group is None:
+                group = self.groups[name] = ModelGroup(name, entry.get("routing_strategy", routing_strategy))
+                self._table[name] = group
+
+            params = entry["litellm_params"]
+            if vertex_locations and params["model"].startswith("vertex_ai/") and "vertex_location" not in params:
+                expanded = [{**params, "vertex_location": location} for location in vertex_locations]
+            else:
+                expanded = [params]
+            for deployment_params in expanded:
+                deployment = Deployment(name, deployment_params, len(group.deployments), breaker_settings)
+                group.add(deployment)
+                self.deployments[deployment.id] = deployment
+
+            if entry.get("fallbacks"):
+                group.fallbacks = list(entry["fallbacks"])
+            if entry.get("fallback_ttft_seconds") is not None:
+                group.fallback_ttft_seconds = float(entry["fallback_ttft_seconds"])
+            if entry.get("request_timeout_seconds") is not None:
+                group.request_timeout_seconds = float(entry["request_timeout_seconds"])
+
+            for alias in entry.get("aliases") or []:
+                if self._table.get(alias, group) is not group:
+                    raise ValueError(f"Alias {alias!r} is claimed by both {self._table[alias].name} and {name}")
+                self._table[alias] = group
+
+        for group in self.groups.values():
+            for fallback in group.fallbacks:
+                if fallback not in self._table:
+                    raise ValueError(f"Fallback {fallback!r} of {group.name} is not a model_list entry or alias")
+
+        created = int(time.time())
+        self.models_response = {
+            "object": "list",
+            "data": [
+                {"id": name, "object": "model", "created": created, "owned_by": name.split("/", 1)[0]}
+                for name in self.groups
+            ],
+        }
+
+    def resolve(self, model: str) -> ModelGroup:
+        group = self._table.get(model)
+        if group is None:
+            raise UnknownModelError(f"The model `{model}` does not exist")
+        return group
+
+    def fallback_chain(self, group: ModelGroup) -> List[ModelGroup]:
+        """The group followed by its fallbacks, each model once."""
+        chain = [group]
+        for name in group.fallbacks:
+            fallback = self._table[name]
+            if fallback not in chain:
+                chain.append(fallback)
+        return chain
+
+    def pick(self, model: str) -> Deployment:
+        return self.resolve(model).pick()
+
+
+def router_from_config(config: Dict[str, Any]) -> Router:
+    settings = config.get("router_settings") or {}
+    return Router(
+        config.get("model_list") or [],
+        settings.get("routing_strategy", "weighted"),
+        vertex_locations=config.get("general_settings", {}).get("vertex_locations"),
+        breaker_settings=config.get("circuit_breaker"),
+    )
@@ -0,0 +1,74 @@
+import json
+from typing import Any, Dict, List, Literal, Optional, Union
+
+from pydantic import BaseModel, ConfigDict, Field
+
+try:
+    import orjson
+except ImportError:  # optional; the standard library encoder is used instead
+    orjson = None
+
+JSON_MEDIA_TYPE = "application/json"
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=str, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def dumps_sorted(obj: Any) -> bytes:
+    """Deterministic encoding (sorted keys) for hashing."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=str, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+class ChatCompletionRequest(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    model: str = Field(default="vertex_ai/gemini-1.5-pro")
+    messages: List[Dict[str, Any]]
+    temperature: Optional[float] = 0.7
+    tools: Optional[List[Dict[str, Any]]] = None
+    tool_choice: Optional[Union[str, Dict[str, Any]]] = None
+    stream: Optional[bool] = False
+
+
+class EmbeddingRequest(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    model: str
+    input: Union[str, List[str]]
+    encoding_format: Literal["float", "base64"] = "float"
+    dimensions: Optional[int] = None
+    user: Optional[str] = None
+
+
+def parse_chat_request(body: bytes) -> ChatCompletionRequest:
+    """Parse and validate in one pass (pydantic-core reads the JSON directly); raises ValidationError."""
+    return ChatCompletionRequest.model_validate_json(body)
+
+
+def normalize_completion(response: Any, model: str) -> Dict[str, Any]:
+    """Turn a litellm ModelResponse into an OpenAI `chat.completion` dict in a single pass."""
+    data = response.model_dump() if hasattr(response, "model_dump") else response
+    if not isinstance(data, dict):
+        return data
+    data.setdefault("model", model)
+    data.setdefault("object", "chat.completion")
+    for choice in data.get("choices") or ():
+        choice.setdefault("finish_reason", "stop")
+        message = choice.get("message")
+        if message is not None:
+            message.setdefault("role", "assistant")
+    return data
+
+
+def first_content(data: Dict[str, Any]) -> Optional[str]:
+    choices = data.get("choices") or ()
+    return (choices[0].get("message") or {}).get("content") if choices else None
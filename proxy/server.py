@@ -0,0 +1,71 @@
+"""Process launcher: `python -m proxy.server [--workers N]`, or `... batch IN OUT`.
+
+Only config.yaml is read here. uvicorn starts each worker with the spawn
+method, which re-runs the parent's `__main__` module before importing
+`main:app`; keeping the parent this small lets workers come up (and answer
+uvicorn's health pings) without building the whole app twice.
+"""
+import argparse
+import os
+import sys
+from typing import Any, Dict, Optional
+
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_config() -> Dict[str, Any]:
+    with open(os.getenv("CONFIG_PATH", "config.yaml"), "r") as config_file:
+        return yaml.safe_load(config_file)
+
+
+def worker_count(config: Dict[str, Any], requested: Optional[int] = None) -> int:
+    """--workers, else $SERVER_WORKERS, else general_settings.server_workers, else one per CPU."""
+    configured = os.getenv("SERVER_WORKERS") or (config.get("general_settings") or {}).get("server_workers")
+    return requested or int(configured or os.cpu_count() or 1)
+
+
+def main(argv=None):
+    config = load_config()
+    parser = argparse.ArgumentParser(description="Vertex AI Proxy")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes (default: $SERVER_WORKERS or general_settings.server_workers, else the CPU count)")
+    subcommands = parser.add_subparsers(dest="command")
+    batch_parser = subcommands.add_parser("batch", help="Run a JSONL file of chat requests and exit")
+    batch_parser.add_argument("input", help="JSONL file of {custom_id, body} requests")
+    batch_parser.add_argument("output", help="JSONL results file; custom_ids already in it are skipped")
+    batch_parser.add_argument("--concurrency", type=int,
+                              default=int((config.get("batch_settings") or {}).get("concurrency", 16)))
+    args = parser.parse_args(argv)
+
+    if args.command == "batch":
+        import asyncio
+
+        sys.path.insert(0, ROOT)
+        from main import run_batch_file
+
+        asyncio.run(run_batch_file(args.input, args.output, args.concurrency))
+        return
+
+    import uvicorn
+
+    from proxy.log import log
+    from proxy.metrics import clear_snapshots
+
+    # Snapshots from an earlier run would add its counters to this one's
+    clear_snapshots((config.get("metrics") or {}).get("multiprocess_dir"))
+
+    workers = worker_count(config, args.workers)
+    if workers > 1 and not (config.get("shared_state") or {}).get("path"):
+        log.warning("per_worker_state", workers=workers,
+                    detail="set shared_state.path to share the cache, rate limits and breakers")
+
+    # uvicorn only starts several workers from an import string; each one imports main itself
+    uvicorn.run("main:app", app_dir=ROOT, host=args.host, port=args.port, workers=workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+import asyncio
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from proxy.circuit_breaker import CLOSED, OPEN
+from proxy.log import log
+from proxy.rate_limit import TokenBucket
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL,
+                                  expires_at REAL NOT NULL, used_at REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS cache_used_at ON cache (used_at);
+CREATE TABLE IF NOT EXISTS cache_totals (id INTEGER PRIMARY KEY CHECK (id = 0), entries INTEGER NOT NULL,
+                                         bytes INTEGER NOT NULL);
+INSERT OR IGNORE INTO cache_totals VALUES (0, 0, 0);
+CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS breakers (deployment TEXT PRIMARY KEY, open_until REAL NOT NULL, worker INTEGER NOT NULL);
+"""
+
+
+class SharedStore:
+    """SQLite file shared by the worker processes on one host.
+
+    The database runs in WAL mode and every operation is one short
+    transaction, so workers read concurrently and only writers take turns.
+    Calls are synchronous: on a local disk they take tens of microseconds,
+    less than handing them to a thread. Since they run on the event loop, a
+    writer waits at most `busy_timeout` for another worker's lock; callers
+    then fail open (see `failed`) instead of stalling or failing the request.
+    Times stored here are wall-clock (`time.time()`), since monotonic clocks
+    mean nothing across restarts.
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 0.05):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._db: Optional[sqlite3.Connection] = None
+        self._pid = None
+        self.errors = 0
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        # One connection per process; a forked worker must not reuse its parent's
+        if self._db is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=OFF")
+            db.executescript(SCHEMA)
+            self._db, self._pid = db, os.getpid()
+        return self._db
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        db = self.db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+            db.execute("COMMIT")
+        except BaseException:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            raise
+
+    def failed(self, operation: str, error: sqlite3.Error):
+        """Record a shared operation skipped because the database was locked or unavailable."""
+        self.errors += 1
+        log.warning("shared_state_unavailable", operation=operation, error=str(error))
+
+    def close(self):
+        if self._db is not None and self._pid == os.getpid():
+            self._db.close()
+        self._db = None
+
+
+class SharedResponseCache:
+    """ResponseCache with its entries in a SharedStore, so every worker sees every entry.
+
+    Same interface and bounds; least recently used entries are evicted.
+    Hits don't write: their use times, and expired entries found by lookups,
+    are written with the next `set` or once `flush_every` have piled up. If
+    the database is busy, a lookup is a miss and a `set` is skipped. Hit and
+    miss counts are per process.
+    """
+
+    def __init__(self, store: SharedStore, max_entries: int = 10000, max_bytes: int = 256 * 1024 * 1024,
+                 flush_every: int = 100):
+        self.store = store
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.flush_every = flush_every
+        self._used: Dict[str, float] = {}  # key -> last hit, not yet written
+        self._expired: Set[str] = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            row = self.store.db.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            self.store.failed("cache_get", e)
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+
+        value, expires_at = row
+        now = time.time()
+        if expires_at <= now:
+            self._expired.add(key)
+            self._used.pop(key, None)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._used[key] = now
+        if len(self._used) >= self.flush_every:
+            try:
+                with self.store.transaction() as db:
+                    self._flush(db)
+            except sqlite3.Error as e:
+                self.store.failed("cache_touch", e)
+                if len(self._used) >= 10 * self.flush_every:
+                    # Only eviction order depends on these; don't let them grow without bound
+                    self._used.clear()
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: bytes, ttl: float):
+        if len(value) > self.max_bytes:
+            return
+        try:
+            self._set(key, value, ttl)
+        except sqlite3.Error as e:
+            self.store.failed("cache_set", e)
+
+    def _flush(self, db: sqlite3.Connection):
+        for expired in self._expired:
+            row = db.execute("SELECT expires_at FROM cache WHERE key = ?", (expired,)).fetchone()
+            # Another worker may have stored a fresh entry since
+            if row is not None and row[0] <= time.time():
+                self._remove(db, expired)
+        db.executemany("UPDATE cache SET used_at = ? WHERE key = ?", ((t, k) for k, t in self._used.items()))
+        self._expired.clear()
+        self._used.clear()
+
+    def _set(self, key: str, value: bytes, ttl: float):
+        now = time.time()
+        with self.store.transaction() as db:
+            self._flush(db)
+            self._remove(db, key)
+            db.execute("INSERT INTO cache VALUES (?, ?, ?, ?, ?)", (key, value, len(value), now + ttl, now))
+            db.execute("UPDATE cache_totals SET entries = entries + 1, bytes = bytes + ?", (len(value),))
+
+            entries, total_bytes = db.execute("SELECT entries, bytes FROM cache_totals").fetchone()
+            while entries > self.max_entries or total_bytes > self.max_bytes:
+                oldest, size = db.execute("SELECT key, size FROM cache ORDER BY used_at LIMIT 1").fetchone()
+                self._remove(db, oldest)
+                entries, total_bytes = entries - 1, total_bytes - size
+                self.evictions += 1
+
+    @staticmethod
+    def _remove(db: sqlite3.Connection, key: str):
+        row = db.execute("DELETE FROM cache WHERE key = ? RETURNING size", (key,)).fetchone()
+        if row is not None:
+            db.execute("UPDATE cache_totals SET entries = entries - 1, bytes = bytes - ?", (row[0],))
+
+    def __len__(self) -> int:
+        return self.store.db.execute("SELECT entries FROM cache_totals").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        entries, total_bytes = self.store.db.execute("SELECT entries, bytes FROM cache_totals").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class SharedBuckets:
+    """Token bucket balances kept in a SharedStore, so quotas hold across all workers.
+
+    When the database is busy, requests are let through uncharged, and usage
+    corrections are kept and written with the next successful take.
+    """
+
+    def __init__(self, store: SharedStore):
+        self.store = store
+        self._pending: Dict[str, float] = {}  # key -> tokens still to charge
+
+    def take(self, requests: List[Tuple[str, float, float]]) -> float:
+        """Charge `amount` from each (key, per_minute, amount) bucket, all or nothing.
+
+        Returns 0 when charged, else the seconds until every bucket could pay.
+        """
+        try:
+            return self._take(requests)
+        except sqlite3.Error as e:
+            self.store.failed("rate_limit", e)
+            return 0.0
+
+    def _take(self, requests: List[Tuple[str, float, float]]) -> float:
+        now = time.time()
+        with self.store.transaction() as db:
+            self._charge_pending(db)
+            buckets = []
+            for key, per_minute, amount in requests:
+                bucket = TokenBucket(per_minute, now)
+                row = db.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    bucket.tokens, bucket.updated = row
+                buckets.append((key, bucket, amount))
+
+            wait = max([bucket.wait_time(amount, now) for _, bucket, amount in buckets] + [0.0])
+            if wait <= 0:
+                for key, bucket, amount in buckets:
+                    bucket.charge(amount)
+                    db.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)",
+                               (key, bucket.tokens, bucket.updated))
+        self._pending.clear()
+        return wait
+
+    def charge(self, keys: List[str], amount: float):
+        for key in keys:
+            self._pending[key] = self._pending.get(key, 0.0) + amount
+        try:
+            with self.store.transaction() as db:
+                self._charge_pending(db)
+        except sqlite3.Error as e:
+            self.store.failed("rate_limit_charge", e)
+            return
+        self._pending.clear()
+
+    def _charge_pending(self, db: sqlite3.Connection):
+        # The caller clears _pending once the transaction has committed
+        db.executemany("UPDATE buckets SET tokens = tokens - ? WHERE key = ?",
+                       ((amount, key) for key, amount in self._pending.items()))
+
+    def __len__(self) -> int:
+        return self.store.db.execute("SELECT count(*) FROM buckets").fetchone()[0]
+
+
+class BreakerSync:
+    """Shares circuit breaker openings between workers.
+
+    Every `interval` seconds, a breaker this worker opened is published with
+    its reopen time, and breakers other workers opened are opened here for
+    the remainder of their cooldown. Each worker still probes and closes on
+    its own.
+    """
+
+    def __init__(self, store: SharedStore, deployments: Dict[str, Any], interval: float = 1.0):
+        self.store = store
+        self.deployments = deployments
+        self.interval = interval
+        self.worker = os.getpid()
+        self._published: Dict[str, float] = {}  # deployment id -> opened_at last published or adopted
+        self._task: Optional[asyncio.Task] = None
+        self.adopted = 0
+
+    async def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.sync()
+            except sqlite3.Error as e:
+                log.warning("breaker_sync_failed", error=str(e))
+
+    def sync(self):
+        now = time.time()
+        with self.store.transaction() as db:
+            for deployment_id, deployment in self.deployments.items():
+                breaker = deployment.breaker
+                if breaker.state == OPEN and self._published.get(deployment_id) != breaker.opened_at:
+                    db.execute("INSERT OR REPLACE INTO breakers VALUES (?, ?, ?)",
+                               (deployment_id, now + breaker.retry_after(), self.worker))
+                    self._published[deployment_id] = breaker.opened_at
+            rows = db.execute("SELECT deployment, open_until FROM breakers WHERE worker != ? AND open_until > ?",
+                              (self.worker, now)).fetchall()
+
+        for deployment_id, open_until in rows:
+            deployment = self.deployments.get(deployment_id)
+            if deployment is None or deployment.breaker.state != CLOSED:
+                continue
+            deployment.breaker.open_for(open_until - now)
+            self._published[deployment_id] = deployment.breaker.opened_at
+            self.adopted += 1
+            log.warning("circuit_opened_by_peer", deployment=deployment_id, seconds=round(open_until - now, 1))
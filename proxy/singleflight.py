@@ -0,0 +1,165 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+
+class _Flight:
+    def __init__(self):
+        self.task: asyncio.Task = None
+        self.waiters = 0
+
+
+class _Broadcast:
+    """Replays every chunk of one upstream stream to any number of subscribers."""
+
+    def __init__(self, source: AsyncIterator[Any], on_close: Callable[[], None]):
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._on_close = on_close
+        self._changed = asyncio.Event()
+        self._pump_task = asyncio.create_task(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[Any]):
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self._close()
+
+    def _close(self):
+        if not self.done:
+            self.done = True
+            self._on_close()
+            self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator[Any]:
+        self.subscribers += 1
+        index = 0
+        try:
+            while True:
+                if index < len(self.chunks):
+                    yield self.chunks[index]
+                    index += 1
+                elif self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                else:
+                    await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                # Nobody is listening any more, stop pulling from upstream
+                self.error = RuntimeError("upstream stream was abandoned by all subscribers")
+                self._pump_task.cancel()
+                self._close()
+
+
+class SingleFlight:
+    """Collapse concurrent identical requests into one upstream call.
+
+    Callers with the same key share a single in-flight call and all receive its
+    result or its exception; streamed calls fan the same chunks out to every
+    caller. Once `max_waiters` callers share a key, further callers make their
+    own call instead of piling on.
+    """
+
+    def __init__(self, max_waiters: int = 100):
+        self.max_waiters = max_waiters
+        self._calls: Dict[str, _Flight] = {}
+        self._streams: Dict[str, _Flight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.overflow = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self._join(self._calls, key, fn)
+        if flight is None:
+            return await fn()
+        try:
+            # Shield so one caller going away doesn't cancel the call for the others
+            return await asyncio.shield(flight.task)
+        finally:
+            self._leave(self._calls, key, flight)
+
+    async def stream(self, key: str, fn: Callable[[], Awaitable[AsyncIterator[Any]]]) -> AsyncIterator[Any]:
+        """Like `do` for calls that return an async iterator.
+
+        Callers joining while the stream is in progress first get the chunks
+        already relayed, then the rest as they arrive.
+        """
+        flight = self._join(self._streams, key, fn)
+        if flight is None:
+            return await fn()
+        try:
+            broadcast = await asyncio.shield(flight.task)
+        except BaseException:
+            self._leave(self._streams, key, flight)
+            raise
+        return self._subscribe(key, flight, broadcast)
+
+    async def _subscribe(self, key: str, flight: _Flight, broadcast: _Broadcast) -> AsyncIterator[Any]:
+        try:
+            async for chunk in broadcast.subscribe():
+                yield chunk
+        finally:
+            self._leave(self._streams, key, flight)
+
+    def _join(self, flights: Dict[str, _Flight], key: str, fn) -> Optional[_Flight]:
+        flight = flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            flights[key] = flight
+            flight.task = asyncio.create_task(self._run(flights, key, flight, fn))
+            # Mark the outcome as seen even if every waiter has gone away
+            flight.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+            self.leaders += 1
+        elif flight.waiters >= self.max_waiters:
+            self.overflow += 1
+            return None
+        else:
+            self.coalesced += 1
+        flight.waiters += 1
+        return flight
+
+    async def _run(self, flights: Dict[str, _Flight], key: str, flight: _Flight, fn) -> Any:
+        try:
+            result = await fn()
+        except BaseException:
+            self._forget(flights, key, flight)
+            raise
+
+        if flights is self._streams:
+            # Streams stay joinable until the upstream is exhausted
+            return _Broadcast(result, on_close=lambda: self._forget(flights, key, flight))
+
+        self._forget(flights, key, flight)
+        return result
+
+    def _leave(self, flights: Dict[str, _Flight], key: str, flight: _Flight):
+        flight.waiters -= 1
+        if flight.waiters == 0 and not flight.task.done():
+            flight.task.cancel()
+            self._forget(flights, key, flight)
+
+    @staticmethod
+    def _forget(flights: Dict[str, _Flight], key: str, flight: _Flight):
+        # Later callers for this key start a fresh call
+        if flights.get(key) is flight:
+            del flights[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._calls) + len(self._streams),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "overflow": self.overflow,
+        }
@@ -0,0 +1,61 @@
+from typing import Any, AsyncIterator, Callable, Dict
+
+from proxy.serialization import dumps
+
+SSE_DONE = b"data: [DONE]\n\n"
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    # Stop nginx / Cloud Run front ends from buffering the event stream
+    "X-Accel-Buffering": "no",
+}
+
+
+def sse_frame(data: Dict[str, Any]) -> bytes:
+    return b"data: " + dumps(data) + b"\n\n"
+
+
+def chunk_to_dict(chunk: Any, model: str) -> Dict[str, Any]:
+    """Turn a litellm stream chunk into an OpenAI `chat.completion.chunk` dict."""
+    data = chunk.model_dump() if hasattr(chunk, "model_dump") else dict(chunk)
+    data.setdefault("model", model)
+    data["object"] = "chat.completion.chunk"
+    # litellm echoes the request's stream_options onto every chunk
+    data.pop("stream_options", None)
+    for choice in data.get("choices") or []:
+        delta = choice.get("delta")
+        if delta is not None:
+            # litellm fills unset delta fields with None; OpenAI omits them
+            choice["delta"] = {k: v for k, v in delta.items() if v is not None}
+    if data.get("usage") and not any(c.get("delta") or c.get("finish_reason") for c in data.get("choices") or []):
+        # The trailing usage chunk carries no choices in the OpenAI format
+        data["choices"] = []
+    return data
+
+
+def is_empty_chunk(chunk: Dict[str, Any]) -> bool:
+    """A converted chunk with nothing for the client, like the empty one litellm sends after finish_reason."""
+    return not chunk.get("usage") and not any(c.get("delta") or c.get("finish_reason")
+                                              for c in chunk.get("choices") or [])
+
+
+async def release_when_done(stream: AsyncIterator[Any], release: Callable[[], None]) -> AsyncIterator[Any]:
+    try:
+        async for item in stream:
+            yield item
+    finally:
+        release()
+
+
+async def close_upstream(stream: Any):
+    """Close an abandoned litellm stream's upstream response now, instead of whenever it is collected."""
+    source = getattr(stream, "completion_stream", stream)
+    source = getattr(source, "streaming_response", source)
+    aclose = getattr(source, "aclose", None)
+    if aclose is None:
+        return
+    try:
+        await aclose()
+    except Exception:
+        pass
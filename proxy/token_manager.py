@@ -0,0 +1,148 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from proxy.log import log
+
+CLOUD_PLATFORM_SCOPE = "https://www.googleapis.com/auth/cloud-platform"
+
+
+def default_credentials(scopes=(CLOUD_PLATFORM_SCOPE,)) -> Tuple[Any, Any]:
+    """Application default credentials and a transport to refresh them with.
+
+    Imported here rather than at module level: google-auth and requests are
+    only needed once the first token is fetched.
+    """
+    import requests
+    from google.auth import default
+    from google.auth.transport.requests import Request
+
+    credentials, _ = default(scopes=list(scopes))
+    return credentials, Request(session=requests.Session())
+
+
+class TokenManager:
+    """Keeps a Google access token fresh in the background.
+
+    The hot path only reads the cached token. A background task refreshes it
+    `refresh_skew` seconds before expiry, and every refresh, background or
+    on-demand, goes through one lock so concurrent callers never trigger
+    duplicate OAuth round trips.
+
+    With `discover` instead of credentials, discovery (which may query the
+    metadata server) is deferred to the first refresh, so `start()` never
+    delays serving.
+
+    `on_refresh(seconds, error)` is called after every refresh attempt, with
+    the exception if it failed.
+    """
+
+    def __init__(self, credentials=None, request=None, refresh_skew: float = 300.0, retry_interval: float = 10.0,
+                 discover: Optional[Callable[[], Tuple[Any, Any]]] = None,
+                 on_refresh: Optional[Callable[[float, Optional[Exception]], None]] = None):
+        self.credentials = credentials
+        self.request = request
+        self.discover = discover
+        self.refresh_skew = refresh_skew
+        self.retry_interval = retry_interval
+        self.on_refresh = on_refresh
+        self._token: Optional[str] = None
+        self._expires_at = 0.0  # time.monotonic() deadline
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.refresh_seconds_total = 0.0
+        self.last_refresh_seconds = 0.0
+        self.last_error: Optional[str] = None
+
+    async def start(self):
+        # The first refresh happens in the background loop; callers that need a
+        # token before then wait for it in get_token()
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    @property
+    def ready(self) -> bool:
+        return self._token is not None and time.monotonic() < self._expires_at
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def get_token(self) -> str:
+        # Hot path: no I/O while the cached token has not actually expired
+        if self._token is not None and time.monotonic() < self._expires_at:
+            return self._token
+        await self.refresh()
+        return self._token
+
+    async def refresh(self, force: bool = False):
+        async with self._lock:
+            # Another caller may have refreshed while this one waited for the lock
+            if not force and self._token is not None and time.monotonic() < self._expires_at - self.refresh_skew:
+                return
+
+            started = time.perf_counter()
+            error = None
+            try:
+                if self.credentials is None:
+                    self.credentials, self.request = await asyncio.to_thread(self.discover)
+                # google-auth refreshes over blocking HTTP, so keep it off the event loop
+                await asyncio.to_thread(self.credentials.refresh, self.request)
+            except Exception as e:
+                error = e
+                self.refresh_failures += 1
+                self.last_error = str(e)
+                raise
+            finally:
+                self.last_refresh_seconds = time.perf_counter() - started
+                self.refresh_seconds_total += self.last_refresh_seconds
+                if self.on_refresh is not None:
+                    self.on_refresh(self.last_refresh_seconds, error)
+
+            self.refreshes += 1
+            self.last_error = None
+            self._token = self.credentials.token
+            self._expires_at = time.monotonic() + self._seconds_until_expiry()
+
+    def _seconds_until_expiry(self) -> float:
+        expiry = self.credentials.expiry
+        if expiry is None:
+            return float("inf")
+        # google-auth reports expiry as a naive UTC datetime
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return (expiry - now).total_seconds()
+
+    def _seconds_until_refresh(self) -> float:
+        if self._token is None:
+            return 0.0
+        return self._expires_at - self.refresh_skew - time.monotonic()
+
+    async def _refresh_loop(self):
+        while True:
+            delay = self._seconds_until_refresh()
+            if delay > 0:
+                await asyncio.sleep(min(delay, 3600.0))
+                continue
+            try:
+                await self.refresh()
+            except Exception as e:
+                log.error("credential_refresh_failed", initial=self.refreshes == 0, error=str(e))
+                await asyncio.sleep(self.retry_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "refresh_seconds_total": self.refresh_seconds_total,
+            "last_refresh_seconds": self.last_refresh_seconds,
+            "seconds_until_expiry": max(0.0, self._expires_at - time.monotonic()) if self._token else 0.0,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,245 @@
+import asyncio
+import contextvars
+import hashlib
+import random
+import threading
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from proxy.keys import key_fingerprint
+from proxy.log import log
+
+PAYLOAD_MODES = {"truncate", "hash", "none"}
+
+
+class Trace:
+    """One sampled request; generations recorded while it is current attach to it."""
+
+    __slots__ = ("id", "name", "started", "input", "metadata")
+
+    def __init__(self, name: str, input: Any = None, metadata: Optional[Dict[str, Any]] = None,
+                 id: Optional[str] = None):
+        self.id = id or uuid.uuid4().hex
+        self.name = name
+        self.started = datetime.now(timezone.utc)
+        self.input = input
+        self.metadata = metadata or {}
+
+
+current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("current_trace", default=None)
+
+
+class LazyLangfuse:
+    """Langfuse client built on first use, on the export thread.
+
+    Importing langfuse and constructing its client take a noticeable part of
+    a cold start; traces are only exported after requests have been served.
+    """
+
+    def __init__(self, **settings):
+        self.settings = settings
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                from langfuse import Langfuse
+
+                self._client = Langfuse(**self.settings)
+            return self._client
+
+    def trace(self, **event):
+        return self.client.trace(**event)
+
+    def generation(self, **event):
+        return self.client.generation(**event)
+
+    def flush(self):
+        if self._client is not None:
+            self._client.flush()
+
+
+class TraceExporter:
+    """Sampled, batched Langfuse export that never blocks a request.
+
+    Requests only make a sampling decision and append an event to a bounded
+    queue; payloads are truncated or hashed before they are queued. A
+    background task hands batches to the Langfuse client on a worker thread.
+    When the queue is full new events are dropped and counted.
+    """
+
+    def __init__(self, langfuse, enabled: bool = True, sample_rate: float = 1.0,
+                 model_sample_rates: Optional[Dict[str, float]] = None,
+                 key_sample_rates: Optional[Dict[str, float]] = None,
+                 max_queue: int = 10000, batch_size: int = 100, flush_interval: float = 1.0,
+                 payload_mode: str = "truncate", max_payload_chars: int = 2000):
+        if payload_mode not in PAYLOAD_MODES:
+            raise ValueError(f"payload_mode must be one of {sorted(PAYLOAD_MODES)}")
+        self.langfuse = langfuse
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.model_sample_rates = model_sample_rates or {}
+        self.key_sample_rates = {key_fingerprint(key): rate for key, rate in (key_sample_rates or {}).items()}
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.payload_mode = payload_mode
+        self.max_payload_chars = max_payload_chars
+        self._queue: Deque[Tuple[str, Dict[str, Any]]] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.sampled = 0
+        self.sampled_out = 0
+        self.queued = 0
+        self.dropped = 0
+        self.exported = 0
+        self.export_failures = 0
+
+    # Hot path
+
+    def start_trace(self, name: str, model: str, api_key: Optional[str], input: Any = None,
+                    metadata: Optional[Dict[str, Any]] = None, trace_id: Optional[str] = None) -> Optional[Trace]:
+        """Head-based sampling: returns a Trace to make current, or None when not sampled.
+
+        Passing the request ID as `trace_id` lets log lines be looked up in Langfuse.
+        """
+        if not self.enabled:
+            return None
+        rate = min(self.model_sample_rates.get(model, self.sample_rate),
+                   self.key_sample_rates.get(key_fingerprint(api_key) if api_key else None, 1.0))
+        if rate < 1.0 and random.random() >= rate:
+            self.sampled_out += 1
+            return None
+        self.sampled += 1
+        return Trace(name, self.payload(input), metadata, trace_id)
+
+    def end_trace(self, trace: Optional[Trace], output: Any = None, **fields):
+        if trace is None:
+            return
+        self._put("trace", {
+            "id": trace.id, "name": trace.name, "timestamp": trace.started,
+            "input": trace.input, "output": self.payload(output),
+            "metadata": {**trace.metadata, **fields.pop("metadata", {})}, **fields,
+        })
+
+    def generation(self, trace: Optional[Trace] = None, input: Any = None, output: Any = None, **fields):
+        """Record a generation on `trace` (default: the current one); a no-op when not sampled."""
+        trace = trace or current_trace.get()
+        if trace is None:
+            return
+        self._put("generation", {
+            "id": uuid.uuid4().hex, "trace_id": trace.id,
+            "input": self.payload(input), "output": self.payload(output), **fields,
+        })
+
+    def _put(self, kind: str, event: Dict[str, Any]):
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            return
+        self._queue.append((kind, event))
+        self.queued += 1
+        if self._wakeup is not None and len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def payload(self, value: Any) -> Any:
+        """Truncate or hash message contents and strings so large contexts never reach the queue."""
+        if value is None or self.payload_mode == "none":
+            return None
+        if isinstance(value, str):
+            return self._text(value)
+        if isinstance(value, list):
+            return [self.payload(v) for v in value]
+        if isinstance(value, dict):
+            return {k: self.payload(v) if k in ("content", "arguments") or isinstance(v, (list, dict)) else v
+                    for k, v in value.items()}
+        return value
+
+    def _text(self, text: str) -> str:
+        if self.payload_mode == "hash":
+            return "sha256:" + hashlib.sha256(text.encode()).hexdigest()
+        if len(text) > self.max_payload_chars:
+            return text[:self.max_payload_chars] + f"...[{len(text) - self.max_payload_chars} chars truncated]"
+        return text
+
+    # Background export
+
+    async def start(self):
+        if self.enabled:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._export_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._queue:
+            await asyncio.to_thread(self._export, self._take_batch())
+        if self.enabled:
+            await asyncio.to_thread(self.langfuse.flush)
+
+    async def _export_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._queue:
+                await asyncio.to_thread(self._export, self._take_batch())
+
+    def _take_batch(self) -> List[Tuple[str, Dict[str, Any]]]:
+        return [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+
+    def _export(self, batch: List[Tuple[str, Dict[str, Any]]]):
+        for kind, event in batch:
+            try:
+                if kind == "trace":
+                    self.langfuse.trace(**event)
+                else:
+                    self.langfuse.generation(**event)
+                self.exported += 1
+            except Exception as e:
+                self.export_failures += 1
+                log.warning("trace_export_failed", error=str(e))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": len(self._queue),
+            "sampled": self.sampled,
+            "sampled_out": self.sampled_out,
+            "queued": self.queued,
+            "dropped": self.dropped,
+            "exported": self.exported,
+            "export_failures": self.export_failures,
+        }
+
+
+def exporter_from_config(langfuse, config: Dict[str, Any]) -> TraceExporter:
+    settings = config.get("tracing") or {}
+    model_sample_rates = {
+        entry["model_name"]: float(entry["tracing"]["sample_rate"])
+        for entry in config.get("model_list") or []
+        if (entry.get("tracing") or {}).get("sample_rate") is not None
+    }
+    key_sample_rates = {key: float(value["sample_rate"]) for key, value in (settings.get("keys") or {}).items()}
+    return TraceExporter(
+        langfuse,
+        enabled=settings.get("enabled", True),
+        sample_rate=float(settings.get("sample_rate", 1.0)),
+        model_sample_rates=model_sample_rates,
+        key_sample_rates=key_sample_rates,
+        max_queue=int(settings.get("max_queue", 10000)),
+        batch_size=int(settings.get("batch_size", 100)),
+        flush_interval=float(settings.get("flush_interval_seconds", 1.0)),
+        payload_mode=settings.get("payload_mode", "truncate"),
+        max_payload_chars=int(settings.get("max_payload_chars", 2000)),
+    )
@@ -0,0 +1,70 @@
+import asyncio
+import importlib
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from proxy.log import log
+
+Step = Callable[[], Union[Any, Awaitable[Any]]]
+
+
+def import_module(name: str) -> Step:
+    return lambda: importlib.import_module(name)
+
+
+class Warmup:
+    """Startup work that runs after the port is bound instead of before.
+
+    Steps run in order from a background task started with the app; plain
+    functions (typically imports) run on a worker thread so the event loop
+    keeps answering liveness checks meanwhile. Code that needs a step's
+    result awaits `wait()`, so a request arriving early is delayed rather
+    than failed. A failed step is logged and counted; `ready` stays false.
+    """
+
+    def __init__(self, steps: List[Tuple[str, Step]]):
+        self.steps = steps
+        self.durations: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self.done = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def wait(self):
+        # Fast path once warm: no await needed
+        if not self.done.is_set():
+            await self.start()
+            await self.done.wait()
+
+    async def close(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    @property
+    def ready(self) -> bool:
+        return self.done.is_set() and not self.errors
+
+    async def _run(self):
+        for name, step in self.steps:
+            started = time.perf_counter()
+            try:
+                if asyncio.iscoroutinefunction(step):
+                    await step()
+                else:
+                    await asyncio.to_thread(step)
+            except Exception as e:
+                self.errors[name] = str(e)
+                log.error("warmup_step_failed", step=name, error=str(e))
+            self.durations[name] = round(time.perf_counter() - started, 3)
+        self.done.set()
+        log.info("warmup_done", **{f"{name}_seconds": seconds for name, seconds in self.durations.items()})
+
+    def stats(self) -> Dict[str, Any]:
+        return {"done": self.done.is_set(), "step_seconds": dict(self.durations), "errors": dict(self.errors)}
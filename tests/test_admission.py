@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from proxy.admission import AdmissionController, AdmissionRejected, ConcurrencyLimiter
+from proxy.router import Router
+
+
+def test_queue_full_rejects_with_429():
+    async def run():
+        limiter = ConcurrencyLimiter("m", max_concurrency=1, max_queue=1, queue_timeout_seconds=1)
+        await limiter.acquire()
+        queued = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await limiter.acquire()
+        limiter.release()
+        await queued
+        return limiter, rejected.value
+
+    limiter, rejected = asyncio.run(run())
+    assert rejected.status_code == 429
+    assert rejected.headers == {"Retry-After": "1"}
+    assert limiter.stats()["rejected_queue_full"] == 1
+    assert limiter.active == 1 and limiter.queued == 0
+
+
+def test_queue_deadline_rejects_with_503():
+    async def run():
+        limiter = ConcurrencyLimiter("m", max_concurrency=1, max_queue=10, queue_timeout_seconds=0.02)
+        await limiter.acquire()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await limiter.acquire()
+        return limiter, rejected.value
+
+    limiter, rejected = asyncio.run(run())
+    assert rejected.status_code == 503
+    assert limiter.rejected_timeout == 1 and limiter.queued == 0
+    assert limiter.max_wait_seconds >= 0.02
+
+
+def test_slots_are_handed_over_in_fifo_order():
+    order = []
+
+    async def worker(limiter, name):
+        async with limiter.slot():
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        limiter = ConcurrencyLimiter("m", max_concurrency=1, max_queue=10)
+        await asyncio.gather(*(worker(limiter, i) for i in range(5)))
+        return limiter
+
+    limiter = asyncio.run(run())
+    assert order == [0, 1, 2, 3, 4]
+    assert limiter.active == 0 and limiter.admitted == 5
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def run():
+        limiter = ConcurrencyLimiter("m", max_concurrency=1, max_queue=10)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        limiter.release()
+        return limiter
+
+    limiter = asyncio.run(run())
+    assert limiter.active == 0 and limiter.queued == 0
+
+
+def test_controller_applies_model_overrides_and_deployment_limits():
+    config = {
+        "admission": {"max_concurrency": 50, "max_queue": 100, "deployment_max_concurrency": 20},
+        "model_list": [
+            {"model_name": "ollama/mistral:latest", "litellm_params": {"model": "ollama/mistral:latest"},
+             "admission": {"max_concurrency": 2}},
+        ],
+    }
+    controller = AdmissionController(config)
+    router = Router(config["model_list"])
+    controller.attach(router)
+
+    assert controller.limiter("ollama/mistral:latest").max_concurrency == 2
+    assert controller.limiter("ollama/mistral:latest").max_queue == 100
+    assert router.deployments["ollama/mistral:latest#0"].limiter.max_concurrency == 20
+    assert AdmissionController({"admission": {"enabled": False}}).limiter("m") is None
@@ -0,0 +1,126 @@
+import asyncio
+import json
+
+from fastapi import HTTPException
+
+from proxy.batch import BatchManager, BatchRunner, scan_output
+from proxy.keys import key_fingerprint
+from proxy.log import current_request_id
+
+
+def write_input(path, count):
+    with open(path, "w") as f:
+        for i in range(count):
+            body = {"model": "m", "messages": [{"role": "user", "content": str(i)}]}
+            f.write(json.dumps({"custom_id": f"req-{i}", "method": "POST", "url": "/v1/chat/completions", "body": body}) + "\n")
+
+
+def read_output(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_runs_with_bounded_concurrency(tmp_path):
+    write_input(tmp_path / "in.jsonl", 50)
+    active = peak = 0
+
+    async def execute(body, api_key):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.001)
+        active -= 1
+        return {"id": "chatcmpl", "choices": [{"message": {"content": body["messages"][0]["content"]}}]}
+
+    runner = BatchRunner(execute, concurrency=4)
+    asyncio.run(runner.run(str(tmp_path / "in.jsonl"), str(tmp_path / "out.jsonl")))
+
+    results = read_output(tmp_path / "out.jsonl")
+    assert peak == 4
+    assert sorted(r["custom_id"] for r in results) == sorted(f"req-{i}" for i in range(50))
+    assert all(r["response"]["body"]["choices"][0]["message"]["content"] == r["custom_id"][4:] for r in results)
+    assert runner.counts() == {"total": 50, "completed": 50, "failed": 0}
+
+
+def test_resume_skips_completed_and_truncates_partial_line(tmp_path):
+    write_input(tmp_path / "in.jsonl", 5)
+    output = tmp_path / "out.jsonl"
+    with open(output, "w") as f:
+        f.write(json.dumps({"custom_id": "req-0", "response": {"status_code": 200}}) + "\n")
+        f.write(json.dumps({"custom_id": "req-1", "response": {"status_code": 500}}) + "\n")
+        f.write('{"custom_id": "req-2", "resp')
+    calls = []
+
+    async def execute(body, api_key):
+        calls.append(body["messages"][0]["content"])
+        return {"id": "x"}
+
+    runner = BatchRunner(execute)
+    asyncio.run(runner.run(str(tmp_path / "in.jsonl"), str(output)))
+
+    assert sorted(calls) == ["2", "3", "4"]
+    assert [r["custom_id"] for r in read_output(output)][:2] == ["req-0", "req-1"]
+    assert runner.counts() == {"total": 5, "completed": 4, "failed": 1}
+    assert len(scan_output(str(output))[0]) == 5
+
+
+def test_retries_rate_limits_and_reports_errors(tmp_path):
+    write_input(tmp_path / "in.jsonl", 2)
+    with open(tmp_path / "in.jsonl", "a") as f:
+        f.write("not json\n")
+    attempts = {}
+
+    async def execute(body, api_key):
+        content = body["messages"][0]["content"]
+        attempts[content] = attempts.get(content, 0) + 1
+        if content == "0" and attempts[content] < 3:
+            raise HTTPException(status_code=429, detail="slow down", headers={"Retry-After": "0"})
+        if content == "1":
+            raise HTTPException(status_code=400, detail="bad request")
+        return {"id": "ok"}
+
+    runner = BatchRunner(execute, api_key="sha256:k")
+    asyncio.run(runner.run(str(tmp_path / "in.jsonl"), str(tmp_path / "out.jsonl")))
+
+    results = {r["custom_id"]: r for r in read_output(tmp_path / "out.jsonl")}
+    assert attempts == {"0": 3, "1": 1}
+    assert results["req-0"]["response"]["status_code"] == 200
+    assert results["req-1"]["response"]["status_code"] == 400
+    assert results[None]["error"]["code"] == "invalid_request"
+    assert runner.counts() == {"total": 3, "completed": 1, "failed": 2}
+
+
+def test_manager_runs_batch_to_completion(tmp_path):
+    write_input(tmp_path / "in.jsonl", 3)
+    seen_keys = set()
+    seen_request_ids = set()
+
+    async def execute(body, api_key):
+        seen_keys.add(api_key)
+        seen_request_ids.add(current_request_id.get())
+        return {"id": "ok"}
+
+    async def upload():
+        yield (tmp_path / "in.jsonl").read_bytes()
+
+    async def run():
+        manager = BatchManager(str(tmp_path / "store"), execute, progress_interval=0.01)
+        file = await manager.save_file(upload(), "in.jsonl")
+        # Created from within a request, but not run as part of it
+        current_request_id.set("creator-req")
+        batch = manager.create_batch(file["id"], authorization="Bearer k")
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if manager.batch(batch["id"])["status"] == "completed":
+                break
+        await manager.close()
+        return manager, manager.batch(batch["id"])
+
+    manager, batch = asyncio.run(run())
+    assert batch["status"] == "completed"
+    assert batch["request_counts"] == {"total": 3, "completed": 3, "failed": 0}
+    assert "_authorization" not in batch and seen_keys == {key_fingerprint("k")}
+    assert seen_request_ids == {None}
+    # The key itself never reaches the disk
+    assert not any(b"Bearer k" in path.read_bytes() for path in (tmp_path / "store").iterdir() if path.is_file())
+    assert len(read_output(manager.file_path(batch["output_file_id"]))) == 3
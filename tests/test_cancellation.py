@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+import pytest
+
+from proxy.cancellation import (ClientDisconnected, CompletionEstimator, DeadlineExceeded, cancel_on_disconnect,
+                                cancellation_reason, current_deadline, request_timeout, within_deadline)
+
+
+def test_request_timeout_header_only_shortens_the_default():
+    assert request_timeout("5", 120) == 5
+    assert request_timeout("600", 120) == 120
+    assert request_timeout("soon", 120) == 120
+    assert request_timeout("5", None) == 5
+    assert request_timeout(None, None) is None
+
+
+def test_deadline_cancels_the_call():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(cancellation_reason())
+            raise
+
+    async def run():
+        current_deadline.set(time.monotonic() + 0.01)
+        await within_deadline(slow())
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(run())
+    assert cancelled == ["deadline"]
+
+
+def test_disconnect_cancels_the_call_and_a_finished_call_returns():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(cancellation_reason())
+            raise
+
+    async def quick():
+        return "answer"
+
+    async def run():
+        disconnected = asyncio.Event()
+
+        async def receive():
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        assert await cancel_on_disconnect(receive, quick()) == "answer"
+        asyncio.get_running_loop().call_later(0.01, disconnected.set)
+        with pytest.raises(ClientDisconnected):
+            await cancel_on_disconnect(receive, slow())
+
+    asyncio.run(run())
+    assert cancelled == ["client_disconnect"]
+
+
+def test_work_cancelled_on_the_requests_behalf_has_no_reason():
+    reasons = []
+
+    async def loser():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            reasons.append(cancellation_reason())
+            raise
+
+    async def hedged():
+        # Like a hedge: the slower call is cancelled but the request carries on
+        task = asyncio.ensure_future(loser())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return "answer"
+
+    async def run():
+        current_deadline.set(time.monotonic() + 5)
+        return await within_deadline(hedged())
+
+    assert asyncio.run(run()) == "answer"
+    assert reasons == [None]
+
+
+def test_estimator_tracks_mean_completion_tokens():
+    estimator = CompletionEstimator(alpha=0.5)
+    assert estimator.saved("m") == 0
+    estimator.observe("m", 100)
+    estimator.observe("m", 200)
+    assert estimator.saved("m") == 150
+    assert estimator.saved("m", generated=40) == 110
+    assert estimator.saved("m", generated=400) == 0
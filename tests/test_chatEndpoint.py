@@ -0,0 +1,220 @@
+import importlib
+import json
+import os
+import sys
+import time
+
+import litellm
+import pytest
+import yaml
+from fastapi.testclient import TestClient
+
+CONFIG = {
+    "model_list": [
+        {"model_name": "local", "litellm_params": {"model": "ollama/local", "api_base": "http://127.0.0.1:9"}},
+        {"model_name": "primary", "litellm_params": {"model": "ollama/primary", "api_base": "http://127.0.0.1:9"},
+         "fallbacks": ["local"], "cache": {"enabled": True}},
+    ],
+    "general_settings": {"vertex_project": "test", "vertex_location": "us-central1"},
+    "retries": {"base_delay_seconds": 0.001, "max_delay_seconds": 0.001},
+    "rate_limits": {"keys": {"sk-small": {"tpm": 1000}}},
+    "response_cache": {"enabled": False},
+    "upstream_pools": {"enabled": False},
+    "logging": {"level": "error"},
+    "tracing": {"enabled": False},
+}
+
+
+@pytest.fixture(scope="module")
+def app(tmp_path_factory):
+    path = tmp_path_factory.mktemp("config") / "config.yaml"
+    path.write_text(yaml.safe_dump(CONFIG))
+    previous = os.environ.get("CONFIG_PATH")
+    os.environ["CONFIG_PATH"] = str(path)
+    try:
+        sys.modules.pop("main", None)
+        main = importlib.import_module("main")
+    finally:
+        if previous is None:
+            os.environ.pop("CONFIG_PATH")
+        else:
+            os.environ["CONFIG_PATH"] = previous
+    with TestClient(main.app) as client:
+        yield main, client
+    sys.modules.pop("main", None)
+
+
+def chunk(delta, finish_reason=None, usage=None):
+    data = {"id": "chatcmpl-1", "created": 1, "model": "local",
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+    if usage is not None:
+        data["usage"] = usage
+    return data
+
+
+def stub_stream(monkeypatch, chunks, error=None):
+    async def acompletion(**kwargs):
+        async def stream():
+            for item in chunks:
+                yield item
+            if error is not None:
+                raise error
+        return stream()
+    monkeypatch.setattr(litellm, "acompletion", acompletion)
+
+
+def events(response):
+    frames = [line[len("data: "):] for line in response.text.split("\n\n") if line]
+    return [frame if frame == "[DONE]" else json.loads(frame) for frame in frames]
+
+
+def post(client, body, **headers):
+    return client.post("/v1/chat/completions", json={"model": "local", "messages": [{"role": "user", "content": "hi"}],
+                                                     **body}, headers=headers)
+
+
+def test_stream_frames_usage_and_done(app, monkeypatch):
+    main, client = app
+    usage = {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5}
+    stub_stream(monkeypatch, [
+        chunk({"role": "assistant", "content": "Hel"}),
+        chunk({"content": "lo", "tool_calls": None}),
+        chunk({}, finish_reason="stop"),
+        # litellm follows finish_reason with an empty chunk, then the usage chunk
+        chunk({}),
+        {**chunk({}), "usage": usage},
+    ])
+
+    response = post(client, {"stream": True})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text.endswith("data: [DONE]\n\n")
+
+    received = events(response)
+    assert received[-1] == "[DONE]"
+    chunks = received[:-1]
+    assert [c["choices"][0]["delta"] for c in chunks[:3]] == [{"role": "assistant", "content": "Hel"},
+                                                              {"content": "lo"}, {}]
+    assert chunks[2]["choices"][0]["finish_reason"] == "stop"
+    assert all(c["object"] == "chat.completion.chunk" and c["model"] == "local" for c in chunks)
+    # No empty chunk in between; usage comes last with no choices
+    assert len(chunks) == 4
+    assert chunks[3]["choices"] == [] and chunks[3]["usage"] == usage
+
+
+def test_stream_error_after_first_chunk_is_reported_in_band(app, monkeypatch):
+    main, client = app
+    stub_stream(monkeypatch, [chunk({"role": "assistant", "content": "Hel"})], error=RuntimeError("upstream reset"))
+
+    response = post(client, {"stream": True})
+    assert response.status_code == 200
+    received = events(response)
+    assert received[0]["choices"][0]["delta"]["content"] == "Hel"
+    assert received[-1] == {"error": {"message": "upstream reset", "type": "upstream_error"}}
+    assert "[DONE]" not in received
+
+
+class Throttled(Exception):
+    status_code = 429
+
+
+def test_throttled_upstream_is_retried_on_backoff_and_client_gets_retry_after(app, monkeypatch):
+    main, client = app
+    calls = []
+
+    async def acompletion(**kwargs):
+        calls.append(time.monotonic())
+        raise Throttled("slow down")
+    monkeypatch.setattr(litellm, "acompletion", acompletion)
+
+    response = post(client, {})
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "1"
+    # Without an upstream Retry-After the retries wait out the configured backoff, not a second each
+    assert len(calls) > 1
+    assert calls[-1] - calls[0] < 0.5
+
+
+class BadRequest(Exception):
+    status_code = 400
+
+
+def test_failed_upstream_call_refunds_the_token_reservation(app, monkeypatch):
+    main, client = app
+
+    async def acompletion(**kwargs):
+        raise BadRequest("invalid argument")
+    monkeypatch.setattr(litellm, "acompletion", acompletion)
+
+    # Each request reserves most of sk-small's 1000 tokens/minute; without a refund the second is throttled
+    for stream in (False, False, True, True):
+        response = post(client, {"stream": stream, "max_tokens": 900}, authorization="Bearer sk-small")
+        assert response.status_code == 400
+
+
+def test_token_refresh_metrics_are_exported(app):
+    main, client = app
+    main.token_manager.on_refresh(0.2, None)
+    main.token_manager.on_refresh(0.3, RuntimeError("metadata server unavailable"))
+    text = client.get("/metrics").text
+    assert 'proxy_token_refreshes_total{outcome="success"} 1.0' in text
+    assert 'proxy_token_refreshes_total{outcome="failure"} 1.0' in text
+    assert "proxy_token_refresh_seconds_count 2" in text
+    assert "\nproxy_token_seconds_until_expiry " in text
+
+
+def test_fallback_responses_are_not_cached(app, monkeypatch):
+    main, client = app
+    primary_up = False
+
+    async def acompletion(**kwargs):
+        model = kwargs["model"].split("/", 1)[1]
+        if model == "primary" and not primary_up:
+            raise Throttled("overloaded")
+        return {"id": "chatcmpl-1", "created": 1, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": f"from {model}"}}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 2, "total_tokens": 3}}
+    monkeypatch.setattr(litellm, "acompletion", acompletion)
+
+    body = {"model": "primary", "temperature": 0}
+    response = post(client, body)
+    assert response.json()["model"] == "local"
+    assert response.headers["x-cache"] == "MISS"
+
+    # Once the primary recovers its own answer is served, not the fallback's from the cache
+    primary_up = True
+    response = post(client, body)
+    assert response.json()["choices"][0]["message"]["content"] == "from primary"
+    assert response.headers["x-cache"] == "MISS"
+    assert post(client, body).headers["x-cache"] == "HIT"
+
+
+def test_each_batch_line_gets_its_own_request_id(app, monkeypatch):
+    main, client = app
+    request_ids = []
+
+    async def acompletion(**kwargs):
+        request_ids.append(main.current_request_id.get())
+        return {"id": "chatcmpl-1", "created": 1, "model": "local",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}}
+    monkeypatch.setattr(litellm, "acompletion", acompletion)
+
+    body = {"model": "local", "messages": [{"role": "user", "content": "hi"}]}
+    for _ in range(2):
+        assert client.portal.call(main.execute_batch_request, body)["choices"][0]["message"]["content"] == "ok"
+    assert len(set(request_ids)) == 2 and None not in request_ids
+
+
+def test_failed_embeddings_call_refunds_the_token_reservation(app, monkeypatch):
+    main, client = app
+
+    async def aembedding(**kwargs):
+        raise BadRequest("invalid argument")
+    monkeypatch.setattr(litellm, "aembedding", aembedding)
+
+    # ~900 tokens of input each, against sk-small's 1000 tokens/minute
+    for _ in range(2):
+        response = client.post("/v1/embeddings", json={"model": "local", "input": "x" * 3600},
+                               headers={"authorization": "Bearer sk-small"})
+        assert response.status_code == 400
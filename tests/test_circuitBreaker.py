@@ -0,0 +1,150 @@
+import asyncio
+import time
+
+from proxy.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, is_upstream_failure
+from proxy.hedging import Hedger
+from proxy.router import Router
+
+
+class UpstreamError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+def test_opens_on_error_rate_and_recovers_after_probe():
+    breaker = CircuitBreaker(min_requests=4, error_rate_threshold=0.5, cooldown_seconds=0.05)
+    for ok in (True, False, True, False):
+        breaker.record_success(0.1) if ok else breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN and not breaker.allow()
+
+    breaker.record_success(0.1)
+    assert breaker.state == CLOSED and breaker.allow()
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker(min_requests=1, cooldown_seconds=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN and breaker.times_opened == 2
+
+
+def test_cancelled_probe_lets_the_next_call_probe():
+    router = Router([{"model_name": "m", "litellm_params": {"model": "vertex_ai/m"}}],
+                    breaker_settings={"min_requests": 1, "cooldown_seconds": 0.01})
+    deployment = router.resolve("m").deployments[0]
+    deployment.breaker.record_failure()
+    time.sleep(0.02)
+
+    async def probe():
+        await deployment.acquire()
+        try:
+            await asyncio.sleep(10)
+        finally:
+            deployment.release()
+
+    async def run():
+        task = asyncio.create_task(probe())
+        await asyncio.sleep(0)
+        assert deployment.breaker.state == HALF_OPEN and not deployment.breaker.allow()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert deployment.breaker.state == HALF_OPEN and deployment.breaker.allow()
+    deployment.breaker.before_call()
+    deployment.breaker.record_success(0.1)
+    assert deployment.breaker.state == CLOSED
+
+
+def test_opens_on_latency_percentile():
+    breaker = CircuitBreaker(min_requests=5, latency_threshold_seconds=2.0, latency_percentile=0.5)
+    for latency in (0.5, 3.0, 3.0, 0.5, 3.0):
+        breaker.record_success(latency)
+    assert breaker.state == OPEN
+
+
+def test_first_token_and_response_latency_are_kept_apart():
+    breaker = CircuitBreaker(min_requests=3, latency_threshold_seconds=2.0)
+    for _ in range(3):
+        breaker.record_success(0.2, first_token=True)
+        breaker.record_success(5.0)
+    assert breaker.latency(0.9, first_token=True) == 0.2
+    assert breaker.latency(0.9) == 5.0
+    # The slow responses trip the breaker on their own
+    assert breaker.state == OPEN
+
+    hedger = Hedger(min_samples=3)
+    router = Router([{"model_name": "m", "litellm_params": {"model": "vertex_ai/m"}}])
+    deployment = router.resolve("m").deployments[0]
+    for _ in range(3):
+        deployment.record_success(0.2, first_token=True)
+    assert hedger.delay_for(deployment, stream=True) == 0.2
+    assert hedger.delay_for(deployment, stream=False) is None
+
+
+def test_client_errors_do_not_count_as_upstream_failures():
+    assert not is_upstream_failure(UpstreamError(400))
+    assert is_upstream_failure(UpstreamError(429))
+    assert is_upstream_failure(UpstreamError(503))
+    assert is_upstream_failure(TimeoutError())
+
+
+def _warm_router(latency):
+    router = Router([{"model_name": "m", "litellm_params": {"model": "vertex_ai/m"}}],
+                    vertex_locations=["us-central1", "us-east4"])
+    for deployment in router.resolve("m").deployments:
+        for _ in range(20):
+            deployment.breaker.record_success(latency, first_token=True)
+    return router
+
+
+def test_hedge_fires_for_slow_primary_and_cancels_loser():
+    router = _warm_router(0.02)
+    primary, secondary = router.resolve("m").deployments
+    hedger = Hedger(percentile=0.95, min_samples=20, max_extra_ratio=1.0)
+    cancelled = []
+
+    async def call(deployment, latency):
+        try:
+            await asyncio.sleep(latency)
+            return deployment.region
+        except asyncio.CancelledError:
+            cancelled.append(deployment.region)
+            raise
+
+    async def run():
+        delay = hedger.delay_for(primary)
+        result = await hedger.run(lambda: call(primary, 1.0), lambda: call(secondary, 0.01), delay)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == "us-east4"
+    assert cancelled == ["us-central1"]
+    assert hedger.stats()["hedged"] == 1 and hedger.stats()["hedge_wins"] == 1
+
+
+def test_hedge_budget_caps_extra_calls():
+    router = _warm_router(0.001)
+    primary, secondary = router.resolve("m").deployments
+    hedger = Hedger(min_samples=20, max_extra_ratio=0.1, min_delay_seconds=0.001)
+    hedger.budget.tokens = 0
+
+    async def call(latency):
+        await asyncio.sleep(latency)
+        return latency
+
+    async def run():
+        for _ in range(20):
+            await hedger.run(lambda: call(0.01), lambda: call(0.0), hedger.delay_for(primary))
+
+    asyncio.run(run())
+    # 20 requests at a 10% budget buy two hedges
+    assert hedger.hedged == 2
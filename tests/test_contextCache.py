@@ -0,0 +1,116 @@
+import asyncio
+
+import httpx
+
+from proxy.context_cache import ContextCache, split_prefix
+
+MODEL = "vertex_ai/gemini-1.5-pro-002"
+SYSTEM = {"role": "system", "content": "You are a records assistant. " * 200}
+
+
+class FakeClient:
+    """Records cached-content calls the way the local stand-in does."""
+
+    def __init__(self, create_status=None):
+        self.create_status = create_status
+        self.created = []
+        self.refreshed = []
+        self.deleted = []
+
+    async def create(self, model, location, system, tools, ttl_seconds, display_name):
+        await asyncio.sleep(0)
+        if self.create_status is not None:
+            response = httpx.Response(self.create_status, request=httpx.Request("POST", "http://stand-in"))
+            raise httpx.HTTPStatusError("rejected", request=response.request, response=response)
+        self.created.append((model, location, len(system), tools))
+        return f"projects/p/locations/{location}/cachedContents/{len(self.created)}"
+
+    async def update_ttl(self, name, location, ttl_seconds):
+        self.refreshed.append(name)
+
+    async def delete(self, name, location):
+        self.deleted.append(name)
+
+
+def conversation(question):
+    return [SYSTEM, {"role": "user", "content": question}]
+
+
+def test_repeated_long_prefix_is_cached_and_reused():
+    client = FakeClient()
+    cache = ContextCache(client, enabled=True, min_prefix_tokens=1000, min_repeats=2)
+
+    async def run():
+        assert cache.prepare("gemini", MODEL, "us-central1", conversation("q1")) is None
+        assert cache.prepare("gemini", MODEL, "us-central1", conversation("q2")) is None
+        await asyncio.sleep(0.01)  # handle is created in the background
+        name, rest = cache.prepare("gemini", MODEL, "us-central1", conversation("q3"))
+        assert rest == [{"role": "user", "content": "q3"}]
+        assert cache.prepare("gemini", MODEL, "us-central1", conversation("q4"))[0] == name
+        # Other regions get their own handle
+        assert cache.prepare("gemini", MODEL, "europe-west1", conversation("q5")) is None
+
+    asyncio.run(run())
+    assert client.created == [(MODEL, "us-central1", 1, None)]
+    assert cache.stats()["hits"] == 2
+
+
+def test_short_prefixes_and_unsupported_models_are_sent_inline():
+    client = FakeClient()
+    cache = ContextCache(client, enabled=True, min_prefix_tokens=1000, min_repeats=1)
+
+    async def run():
+        short = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "hi"}]
+        assert cache.prepare("gemini", MODEL, "us-central1", short) is None
+        assert cache.prepare("claude", "vertex_ai/claude-3-sonnet", "us-central1", conversation("q")) is None
+        assert cache.prepare("mistral", "ollama/mistral:latest", "us-central1", conversation("q")) is None
+        await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert client.created == []
+
+
+def test_rejected_creation_disables_model_for_a_while():
+    client = FakeClient(create_status=400)
+    cache = ContextCache(client, enabled=True, min_prefix_tokens=1000, min_repeats=1)
+
+    async def run():
+        assert cache.prepare("gemini", MODEL, "us-central1", conversation("q1")) is None
+        await asyncio.sleep(0.01)
+        assert not cache.applies("gemini", MODEL)
+        assert cache.prepare("gemini", MODEL, "us-central1", conversation("q2")) is None
+
+    asyncio.run(run())
+    assert cache.stats()["create_failures"] == 1
+    assert cache.stats()["unsupported_models"] == [MODEL]
+
+
+def test_refresh_eviction_and_invalidation():
+    client = FakeClient()
+    cache = ContextCache(client, enabled=True, min_prefix_tokens=1000, min_repeats=1, ttl_seconds=100,
+                         refresh_before_seconds=1000, max_entries=1)
+    other = {"role": "system", "content": "You are a billing assistant. " * 200}
+
+    async def run():
+        cache.prepare("gemini", MODEL, "us-central1", conversation("q"))
+        await asyncio.sleep(0.01)
+        name, _ = cache.prepare("gemini", MODEL, "us-central1", conversation("q"))
+        await asyncio.sleep(0.01)
+        assert client.refreshed == [name]
+
+        cache.prepare("gemini", MODEL, "us-central1", [other, {"role": "user", "content": "q"}])
+        await asyncio.sleep(0.01)
+        assert client.deleted == [name]
+
+        (newest,) = [entry.name for entry in cache.entries.values()]
+        cache.invalidate(newest)
+        assert cache.prepare("gemini", MODEL, "us-central1", [other, {"role": "user", "content": "q"}]) is None
+
+    asyncio.run(run())
+    assert cache.stats()["evicted"] == 1 and cache.stats()["invalidated"] == 1
+
+
+def test_split_prefix():
+    system, rest = split_prefix([SYSTEM, SYSTEM, {"role": "user", "content": "q"}, SYSTEM])
+    assert len(system) == 2 and len(rest) == 2
+    assert split_prefix([{"role": "user", "content": "q"}]) == ([], [{"role": "user", "content": "q"}])
@@ -0,0 +1,111 @@
+import asyncio
+import base64
+from array import array
+
+import pytest
+
+from proxy.cache import ResponseCache
+from proxy.embeddings import EmbeddingService, MicroBatcher, embeddings_from_config, encode_base64
+
+
+class FakeUpstream:
+    def __init__(self, fail: bool = False):
+        self.calls = []
+        self.fail = fail
+
+    async def __call__(self, texts, params):
+        self.calls.append(list(texts))
+        await asyncio.sleep(0)
+        if self.fail:
+            raise RuntimeError("upstream down")
+        return [[float(len(text)), 0.5] for text in texts], 10 * len(texts)
+
+
+def test_concurrent_calls_share_one_batch():
+    upstream = FakeUpstream()
+    batcher = MicroBatcher(upstream, {}, max_batch_size=64, max_wait_seconds=0.01)
+
+    async def run():
+        return await asyncio.gather(batcher.embed(["a"]), batcher.embed(["bb", "ccc"]), batcher.embed(["dddd"]))
+
+    first, second, third = asyncio.run(run())
+    assert upstream.calls == [["a", "bb", "ccc", "dddd"]]
+    assert first[0][0] == [1.0, 0.5]
+    assert [vector for vector, _ in second] == [[2.0, 0.5], [3.0, 0.5]]
+    # 40 tokens split across callers by text length
+    assert sum(share for _, share in first + second + third) == pytest.approx(40)
+    assert third[0][1] == pytest.approx(16)
+
+
+def test_full_batch_is_sent_without_waiting():
+    upstream = FakeUpstream()
+    batcher = MicroBatcher(upstream, {}, max_batch_size=2, max_wait_seconds=60)
+
+    async def run():
+        return await asyncio.wait_for(batcher.embed(["a", "b", "c", "d"]), timeout=1)
+
+    results = asyncio.run(run())
+    assert upstream.calls == [["a", "b"], ["c", "d"]]
+    assert len(results) == 4
+    assert batcher.stats()["batches"] == 2
+
+
+def test_identical_texts_are_sent_once():
+    upstream = FakeUpstream()
+    batcher = MicroBatcher(upstream, {}, max_wait_seconds=0.001)
+
+    async def run():
+        return await asyncio.gather(batcher.embed(["same", "other"]), batcher.embed(["same"]))
+
+    first, second = asyncio.run(run())
+    assert upstream.calls == [["same", "other"]]
+    assert first[0][0] == second[0][0]
+    assert first[0][1] == second[0][1] == pytest.approx(20 * 4 / 9 / 2)
+    assert batcher.deduplicated == 1
+
+
+def test_upstream_error_reaches_every_caller():
+    batcher = MicroBatcher(FakeUpstream(fail=True), {}, max_wait_seconds=0.001)
+
+    async def run():
+        return await asyncio.gather(batcher.embed(["a"]), batcher.embed(["b"]), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_cached_texts_skip_upstream():
+    calls = []
+
+    async def embed_batch(model, texts, params):
+        calls.append((model, list(texts), params))
+        return [[0.25 * len(text)] for text in texts], len(texts)
+
+    service = EmbeddingService(embed_batch, ResponseCache(), max_wait_seconds=0.001)
+
+    async def run():
+        vectors, missing = service.lookup("m", ["x", "yy"], {})
+        assert missing == [0, 1]
+        await service.fetch("m", ["x", "yy"], {})
+        vectors, missing = service.lookup("m", ["x", "yy", "zzz"], {})
+        assert vectors[:2] == [[0.25], [0.5]] and vectors[2] is None
+        assert missing == [2]
+        # Parameters that change the vector are part of the key
+        assert service.lookup("m", ["x"], {"dimensions": 256})[1] == [0]
+
+    asyncio.run(run())
+    assert calls == [("m", ["x", "yy"], {})]
+
+
+def test_config_and_base64_encoding():
+    service = embeddings_from_config({
+        "embeddings": {"max_batch_size": 16, "max_wait_ms": 5, "cache": {"ttl_seconds": 60}},
+        "model_list": [{"model_name": "e", "embeddings": {"max_batch_size": 250}}],
+    }, embed_batch=None)
+    assert service.max_batch_size == 16 and service.max_wait_seconds == 0.005
+    assert service._batcher("e", {}).max_batch_size == 250
+    assert service._batcher("other", {}).max_batch_size == 16
+
+    decoded = array("f")
+    decoded.frombytes(base64.b64decode(encode_base64([0.5, -1.0])))
+    assert decoded.tolist() == [0.5, -1.0]
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from proxy.fallback import complete_with_fallbacks
+from proxy.router import NoHealthyDeploymentError, Router
+
+MODEL_LIST = [
+    {"model_name": "vertex_ai/gemini-1.5-pro", "litellm_params": {"model": "vertex_ai/gemini-1.5-pro"}},
+    {"model_name": "vertex_ai/gemini-1.5-flash", "litellm_params": {"model": "vertex_ai/gemini-1.5-flash"}},
+    {"model_name": "ollama/mistral:latest", "litellm_params": {"model": "ollama/mistral:latest"}},
+]
+
+
+def chain():
+    router = Router(MODEL_LIST)
+    return [router.resolve(entry["model_name"]) for entry in MODEL_LIST]
+
+
+def test_walks_the_chain_on_errors_and_open_circuits():
+    pro, flash, mistral = groups = chain()
+    fallbacks = []
+
+    async def call(group):
+        if group is pro:
+            raise HTTPException(status_code=503)
+        if group is flash:
+            raise NoHealthyDeploymentError(group.name, 30)
+        return "answer"
+
+    result, served = asyncio.run(complete_with_fallbacks(
+        groups, call, on_fallback=lambda group, fallback, reason, error: fallbacks.append((fallback.name, reason))))
+    assert (result, served) == ("answer", mistral)
+    assert fallbacks == [(flash.name, "error"), (mistral.name, "circuit_open")]
+
+
+def test_slow_model_is_cancelled_after_the_ttft_budget():
+    pro, flash, _ = chain()
+    cancelled = []
+
+    async def call(group):
+        if group is pro:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(group.name)
+                raise
+        return group.name
+
+    result, served = asyncio.run(complete_with_fallbacks([pro, flash], call, ttft_budget_seconds=0.01))
+    assert served is flash
+    assert cancelled == [pro.name]
+
+
+def test_client_errors_and_the_last_model_error_reach_the_caller():
+    pro, flash, _ = chain()
+
+    async def call(group):
+        raise HTTPException(status_code=400 if group is pro else 503)
+
+    with pytest.raises(HTTPException) as rejected:
+        asyncio.run(complete_with_fallbacks([pro, flash], call))
+    assert rejected.value.status_code == 400
+
+    with pytest.raises(HTTPException) as failed:
+        asyncio.run(complete_with_fallbacks([flash, flash], call))
+    assert failed.value.status_code == 503
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from proxy.metrics import (MetricsMiddleware, MetricsRegistry, clear_snapshots, current_timings, dispatch_timer,
+                           error_class)
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency.", ("model",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        latency.labels("m").observe(value)
+    registry.counter("requests_total", "Requests.", ("model",)).labels('a"b').inc()
+
+    text = registry.render()
+    assert 'latency_seconds_bucket{model="m",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{model="m",le="1.0"} 3' in text
+    assert 'latency_seconds_bucket{model="m",le="+Inf"} 4' in text
+    assert 'latency_seconds_count{model="m"} 4' in text
+    assert 'requests_total{model="a\\"b"} 1.0' in text
+
+
+def test_merges_worker_snapshots(tmp_path):
+    def worker():
+        registry = MetricsRegistry(multiprocess_dir=str(tmp_path))
+        registry.counter("requests_total", "Requests.", ("model",)).labels("m").inc(2)
+        registry.histogram("latency_seconds", "Latency.", (), buckets=(1.0,)).labels().observe(0.5)
+        registry.gauge("queued", "Queued.", (), lambda: {(): 3})
+        return registry
+
+    # A worker that has exited: its counters still count, its gauges don't
+    with open(tmp_path / "999999999.json", "w") as f:
+        json.dump(worker().snapshot(), f)
+    registry = worker()
+
+    merged = registry.collect()
+    assert merged["requests_total"]["samples"][("m",)] == 4.0
+    assert merged["latency_seconds"]["samples"][()] == [[2, 0], 1.0]
+    assert merged["queued"]["samples"][()] == 3.0
+
+    registry.flush()
+    assert os.path.exists(tmp_path / f"{os.getpid()}.json")
+
+
+def test_live_gauges_merge_by_their_rule(tmp_path):
+    def worker(entries, expiry):
+        registry = MetricsRegistry(multiprocess_dir=str(tmp_path))
+        registry.gauge("queued", "Queued.", (), lambda: {(): 3})
+        registry.gauge("shared_entries", "Entries in a shared cache.", (), lambda: {(): entries}, merge="max")
+        registry.gauge("token_expiry", "Seconds left.", (), lambda: {(): expiry}, merge="min")
+        return registry
+
+    # Another live worker: the parent process stands in for it
+    with open(tmp_path / f"{os.getppid()}.json", "w") as f:
+        json.dump(worker(10, 3300).snapshot(), f)
+    merged = worker(12, 3000).collect()
+    assert merged["queued"]["samples"][()] == 6.0
+    assert merged["shared_entries"]["samples"][()] == 12.0
+    assert merged["token_expiry"]["samples"][()] == 3000.0
+
+    with pytest.raises(ValueError):
+        MetricsRegistry().gauge("bad", "Bad.", (), dict, merge="avg")
+
+
+def test_clear_snapshots_drops_earlier_runs(tmp_path):
+    registry = MetricsRegistry(multiprocess_dir=str(tmp_path))
+    counter = registry.counter("requests_total", "Requests.")
+    counter.labels().inc(10)
+    # A worker from an earlier run that has since exited
+    with open(tmp_path / "999999999.json", "w") as f:
+        json.dump(registry.snapshot(), f)
+    (tmp_path / "999999998.json.tmp").write_text("{")
+    (tmp_path / "notes.txt").write_text("kept")
+
+    clear_snapshots(str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == ["notes.txt"]
+    assert registry.collect()["requests_total"]["samples"][()] == 10.0
+    clear_snapshots(str(tmp_path / "missing"))
+
+
+def test_middleware_records_overhead_and_errors():
+    registry = MetricsRegistry()
+
+    async def app(scope, receive, send):
+        timings = current_timings.get()
+        timings.model = "m"
+        timings.dispatch_seconds = 0.05
+        await asyncio.sleep(0.06)
+        status = 200 if scope["path"] == "/v1/chat/completions" else 429
+        await send({"type": "http.response.start", "status": status, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    async def send(message):
+        pass
+
+    async def run(path):
+        middleware = MetricsMiddleware(app, registry, paths=["/v1/chat/completions", "/limited"])
+        await middleware({"type": "http", "path": path}, None, send)
+
+    asyncio.run(run("/v1/chat/completions"))
+    asyncio.run(run("/limited"))
+
+    merged = registry.collect()
+    assert merged["proxy_requests_total"]["samples"] == {("m", "200"): 1.0, ("m", "429"): 1.0}
+    assert merged["proxy_errors_total"]["samples"] == {("m", "rate_limited"): 1.0}
+    overhead = merged["proxy_overhead_seconds"]["samples"][("m",)]
+    assert sum(overhead[0]) == 2 and 0.005 < overhead[1] < 0.1
+    assert merged["proxy_request_duration_seconds"]["samples"][("m", "false")][1] > 0.1
+
+
+def test_failed_dispatch_is_not_counted_as_overhead():
+    registry = MetricsRegistry()
+
+    async def app(scope, receive, send):
+        current_timings.get().model = "m"
+        try:
+            with dispatch_timer():
+                # Queueing, a retry's backoff, then an upstream failure
+                await asyncio.sleep(0.1)
+                raise ConnectionError("upstream went away")
+        except ConnectionError:
+            await send({"type": "http.response.start", "status": 500, "headers": []})
+            await send({"type": "http.response.body", "body": b"{}"})
+
+    async def send(message):
+        pass
+
+    middleware = MetricsMiddleware(app, registry, paths=["/v1/chat/completions"])
+    asyncio.run(middleware({"type": "http", "path": "/v1/chat/completions"}, None, send))
+
+    merged = registry.collect()
+    assert merged["proxy_errors_total"]["samples"] == {("m", "upstream_error"): 1.0}
+    assert merged["proxy_overhead_seconds"]["samples"][("m",)][1] < 0.05
+
+
+def test_error_class():
+    class Upstream(Exception):
+        status_code = 502
+
+    assert error_class(Upstream()) == "upstream_error"
+    assert error_class(asyncio.TimeoutError()) == "timeout"
+    assert error_class(ValueError()) == "internal"
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from proxy.router import NoHealthyDeploymentError, Router, UnknownModelError
+
+MODEL_LIST = [
+    {"model_name": "vertex_ai/gemini-1.5-pro", "aliases": ["gemini-1.5-pro"],
+     "litellm_params": {"model": "vertex_ai/gemini-1.5-pro", "vertex_location": "us-central1", "weight": 3}},
+    {"model_name": "vertex_ai/gemini-1.5-pro",
+     "litellm_params": {"model": "vertex_ai/gemini-1.5-pro", "vertex_location": "europe-west4", "weight": 1}},
+    {"model_name": "vertex_ai/claude-3-sonnet",
+     "litellm_params": {"model": "vertex_ai/claude-3-sonnet", "model_id": "claude-3-sonnet@latest", "max_tokens": 1024}},
+]
+
+
+def test_aliases_and_default_params():
+    router = Router(MODEL_LIST)
+    assert router.resolve("gemini-1.5-pro") is router.resolve("vertex_ai/gemini-1.5-pro")
+
+    claude = router.pick("vertex_ai/claude-3-sonnet")
+    assert claude.model_id == "claude-3-sonnet@latest"
+    assert claude.default_params == {"max_tokens": 1024}
+    assert claude.is_vertex
+
+
+def test_unknown_model_is_rejected():
+    with pytest.raises(UnknownModelError):
+        Router(MODEL_LIST).resolve("gpt-4o")
+
+
+def test_weighted_selection_follows_weights():
+    router = Router(MODEL_LIST, routing_strategy="weighted")
+    picks = [router.pick("vertex_ai/gemini-1.5-pro").default_params["vertex_location"] for _ in range(4000)]
+    share = picks.count("us-central1") / len(picks)
+    assert 0.7 < share < 0.8
+
+
+def test_least_outstanding_selection():
+    router = Router(MODEL_LIST, routing_strategy="least-outstanding")
+    first = router.pick("vertex_ai/gemini-1.5-pro")
+    asyncio.run(first.acquire())
+    second = router.pick("vertex_ai/gemini-1.5-pro")
+    assert second is not first
+    asyncio.run(second.acquire())
+    asyncio.run(second.acquire())
+    assert router.pick("vertex_ai/gemini-1.5-pro") is first
+
+
+def test_models_response_lists_each_model_once():
+    ids = [m["id"] for m in Router(MODEL_LIST).models_response["data"]]
+    assert ids == ["vertex_ai/gemini-1.5-pro", "vertex_ai/claude-3-sonnet"]
+
+
+def test_vertex_locations_expand_into_regional_deployments():
+    model_list = [
+        {"model_name": "vertex_ai/gemini-1.5-flash", "litellm_params": {"model": "vertex_ai/gemini-1.5-flash"}},
+        {"model_name": "ollama/mistral:latest", "litellm_params": {"model": "ollama/mistral:latest"}},
+    ]
+    router = Router(model_list, vertex_locations=["us-central1", "us-east4"])
+    assert [d.region for d in router.resolve("vertex_ai/gemini-1.5-flash").deployments] == ["us-central1", "us-east4"]
+    assert len(router.resolve("ollama/mistral:latest").deployments) == 1
+
+
+def test_open_circuits_are_skipped():
+    router = Router(MODEL_LIST, breaker_settings={"min_requests": 2, "cooldown_seconds": 60})
+    group = router.resolve("vertex_ai/gemini-1.5-pro")
+    broken, healthy = group.deployments
+    broken.breaker.record_failure()
+    broken.breaker.record_failure()
+
+    assert all(group.pick() is healthy for _ in range(20))
+    assert group.pick(exclude=healthy) is None
+
+    healthy.breaker.record_failure()
+    healthy.breaker.record_failure()
+    with pytest.raises(NoHealthyDeploymentError) as error:
+        group.pick()
+    assert 0 < error.value.retry_after <= 60
+
+
+def test_fallback_chain_resolves_aliases_and_rejects_unknown_models():
+    model_list = [{**MODEL_LIST[0], "fallbacks": ["vertex_ai/claude-3-sonnet", "gemini-1.5-pro"]}, *MODEL_LIST[1:]]
+    router = Router(model_list)
+    chain = router.fallback_chain(router.resolve("gemini-1.5-pro"))
+    assert [group.name for group in chain] == ["vertex_ai/gemini-1.5-pro", "vertex_ai/claude-3-sonnet"]
+
+    with pytest.raises(ValueError):
+        Router([{**MODEL_LIST[0], "fallbacks": ["gpt-4o"]}])
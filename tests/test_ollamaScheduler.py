@@ -0,0 +1,117 @@
+import asyncio
+
+import httpx
+
+from proxy.ollama import AIMDLimit, OllamaScheduler
+from proxy.serialization import dumps, loads
+
+
+def test_queued_requests_are_served_model_by_model():
+    async def run():
+        scheduler = OllamaScheduler("http://ollama:11434", initial_concurrency=2, max_concurrency=2)
+        lanes = {model: scheduler.lane(model) for model in ("mistral", "llama3")}
+        served = []
+
+        async def call(model):
+            await lanes[model].acquire()
+            served.append(model)
+            await asyncio.sleep(0.01)
+            lanes[model].release()
+
+        await asyncio.gather(*(call(model) for model in ["mistral", "llama3"] * 4))
+        return served, scheduler.switches
+
+    served, switches = asyncio.run(run())
+    assert served == ["mistral"] * 4 + ["llama3"] * 4
+    assert switches == 2
+
+
+def test_a_busy_model_cannot_starve_the_others():
+    async def run():
+        scheduler = OllamaScheduler("http://ollama:11434", max_wait_seconds=0.05)
+        mistral, llama3 = scheduler.lane("mistral"), scheduler.lane("llama3")
+        stop = asyncio.Event()
+
+        async def busy():
+            while not stop.is_set():
+                await mistral.acquire()
+                await asyncio.sleep(0.005)
+                mistral.release()
+
+        workers = [asyncio.create_task(busy()) for _ in range(3)]
+        await asyncio.sleep(0.02)
+        started = asyncio.get_running_loop().time()
+        await asyncio.wait_for(llama3.acquire(), 1)
+        waited = asyncio.get_running_loop().time() - started
+        llama3.release()
+        stop.set()
+        await asyncio.gather(*workers)
+        return waited, scheduler
+
+    waited, scheduler = asyncio.run(run())
+    assert 0.05 <= waited < 0.2
+    assert all(in_flight == 0 for in_flight in scheduler.in_flight.values())
+
+
+def test_limit_grows_while_latency_holds_and_halves_when_it_rises():
+    limit = AIMDLimit(initial=1, max_limit=8)
+    for _ in range(20):
+        limit.observe(0.1)
+    assert limit.current == 6
+    limit.observe(0.5)
+    assert limit.current == 3
+    # A burst of slow calls or failures counts once per round of `limit` calls
+    limit.observe(0.5)
+    limit.observe(None, ok=False)
+    assert limit.current == 3
+    limit.observe(None, ok=False)
+    assert limit.current == 1
+    # Unsaturated calls don't grow it
+    limit.observe(0.1, saturated=False)
+    assert limit.current == 1
+
+
+def test_cancelled_waiter_leaves_no_slot_behind():
+    async def run():
+        scheduler = OllamaScheduler("http://ollama:11434")
+        lane = scheduler.lane("mistral")
+        await lane.acquire()
+        waiter = asyncio.create_task(lane.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        lane.release()
+        return scheduler.in_flight["mistral"], scheduler.queued, scheduler.active
+
+    assert asyncio.run(run()) == (0, 0, [])
+
+
+def test_hot_models_get_keep_alive():
+    scheduler = OllamaScheduler("http://ollama:11434", keep_alive="30m", hot_requests_per_minute=2)
+    scheduler.lane("mistral")
+    scheduler.lane("llama3")
+    for _ in range(2):
+        scheduler._note_request("mistral")
+
+    def send(model, path="/api/generate"):
+        request = httpx.Request("POST", "http://ollama:11434" + path, content=dumps({"model": model, "prompt": "hi"}))
+        return scheduler.with_keep_alive(request)
+
+    hot = send("mistral")
+    assert loads(hot.content)["keep_alive"] == "30m"
+    assert int(hot.headers["content-length"]) == len(hot.content)
+    assert "keep_alive" not in loads(send("llama3").content)
+    assert "keep_alive" not in loads(send("mistral", "/api/tags").content)
+
+
+def test_stream_and_response_latency_have_separate_baselines():
+    limit = AIMDLimit(initial=4, max_limit=8)
+    for _ in range(4):
+        limit.observe(0.05, first_token=True)
+    grown = limit.current
+    # A whole response takes far longer than a first token without anything being congested
+    limit.observe(2.0)
+    limit.observe(2.0)
+    assert limit.current >= grown
+    limit.observe(0.2, first_token=True)
+    assert limit.current < grown
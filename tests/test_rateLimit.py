@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from proxy.keys import key_fingerprint
+from proxy.rate_limit import RateLimiter, RateLimitExceeded, api_key_from_header, estimate_tokens, reconcile_stream
+from proxy.streaming import SSE_DONE, sse_frame
+
+CONFIG = {
+    "model_list": [{"model_name": "m", "litellm_params": {"model": "m"}, "rate_limits": {"rpm": 2}}],
+    "rate_limits": {
+        "default_key": {"rpm": 100, "tpm": 1000},
+        "keys": {"small": {"tpm": 100}},
+    },
+}
+
+
+def test_model_rpm_rejects_with_retry_after():
+    limiter = RateLimiter(CONFIG)
+    limiter.acquire("a", "m", 10)
+    limiter.acquire("b", "m", 10)
+    with pytest.raises(RateLimitExceeded) as rejected:
+        limiter.acquire("c", "m", 10)
+    # One request refills every 30s at 2 rpm
+    assert 29 < rejected.value.retry_after <= 30
+    assert rejected.value.headers == {"Retry-After": "30"}
+    assert limiter.stats()["rejected"] == 1
+
+
+def test_rejection_charges_nothing():
+    limiter = RateLimiter(CONFIG)
+    limiter.acquire("small", "other", 90)
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire("small", "other", 90)
+    # The failed second call left the buckets as they were
+    limiter.acquire("small", "other", 10)
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire("small", "other", 1)
+
+
+def test_fingerprint_shares_the_keys_buckets():
+    limiter = RateLimiter(CONFIG)
+    limiter.acquire("small", "other", 90)
+    # A batch job submitted with the key is limited as the key
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire(key_fingerprint("small"), "other", 90)
+
+
+def test_reconcile_charges_actual_usage():
+    limiter = RateLimiter(CONFIG)
+    reservation = limiter.acquire("small", "other", 10)
+    limiter.reconcile(reservation, {"total_tokens": 100})
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire("small", "other", 5)
+
+    limiter = RateLimiter(CONFIG)
+    reservation = limiter.acquire("small", "other", 100)
+    limiter.reconcile(reservation, {"total_tokens": 20})
+    limiter.acquire("small", "other", 80)
+
+
+def test_reconcile_stream_reads_usage_chunk():
+    limiter = RateLimiter(CONFIG)
+    reservation = limiter.acquire("small", "other", 100)
+
+    async def frames():
+        yield sse_frame({"choices": [{"delta": {"content": "hi"}}]})
+        yield sse_frame({"choices": [], "usage": {"prompt_tokens": 5, "completion_tokens": 5, "total_tokens": 10}})
+        yield SSE_DONE
+
+    async def run():
+        return [frame async for frame in reconcile_stream(frames(), reservation)]
+
+    assert len(asyncio.run(run())) == 3
+    assert reservation.estimated_tokens == 10
+    limiter.acquire("small", "other", 90)
+
+
+def test_disabled_and_unlimited():
+    assert RateLimiter({"rate_limits": {"enabled": False}}).acquire("a", "m", 10**9) is None
+    limiter = RateLimiter({})
+    for _ in range(1000):
+        limiter.acquire("a", "m", 10**6)
+
+
+def test_helpers():
+    assert api_key_from_header("Bearer sk-123") == "sk-123"
+    assert api_key_from_header(None) == "anonymous"
+    assert estimate_tokens([{"role": "user", "content": "x" * 400}], max_tokens=50) == 154
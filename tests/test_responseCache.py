@@ -0,0 +1,65 @@
+import time
+
+from proxy.cache import CachePolicy, ResponseCache, cache_directives, cache_from_config
+from proxy.keys import canonical_key
+
+
+def test_canonical_key_ignores_order_and_delivery_fields():
+    a = {"model": "vertex_ai/gemini-1.5-pro", "temperature": 0,
+         "messages": [{"role": "user", "content": "hi"}], "stream": True}
+    b = {"messages": [{"content": "hi", "role": "user"}], "temperature": 0,
+         "model": "vertex_ai/gemini-1.5-pro", "tools": None}
+    assert canonical_key(a) == canonical_key(b)
+    assert canonical_key(a) != canonical_key({**a, "temperature": 0.1})
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = ResponseCache(max_entries=2, max_bytes=10)
+    cache.set("a", b"1234", ttl=60)
+    cache.set("b", b"1234", ttl=60)
+    assert cache.get("a") == b"1234"
+    cache.set("c", b"1234", ttl=60)
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1234"
+
+    cache.set("d", b"12345678", ttl=60)
+    assert len(cache) == 1 and cache.bytes == 8
+    assert cache.stats()["evictions"] == 3
+
+
+def test_ttl_expiry_counts_as_miss():
+    cache = ResponseCache()
+    cache.set("a", b"x", ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert cache.stats() == {"entries": 0, "bytes": 0, "hits": 0, "misses": 1,
+                             "hit_ratio": 0.0, "evictions": 0, "expirations": 1}
+
+
+def test_policy_temperature_and_grounding():
+    policy = CachePolicy(max_temperature=0.2, ttl_seconds=600, grounded_ttl_seconds=30)
+    assert policy.ttl_for(0.7, None) is None
+    assert policy.ttl_for(0, None) == 600
+    assert policy.ttl_for(0.2, [{"googleSearchRetrieval": {}}]) == 30
+    assert CachePolicy(enabled=False).ttl_for(0, None) is None
+
+
+def test_cache_from_config_model_overrides():
+    config = {
+        "response_cache": {"max_entries": 5, "ttl_seconds": 100},
+        "model_list": [
+            {"model_name": "vertex_ai/gemini-1.5-flash", "litellm_params": {}, "cache": {"max_temperature": 0.3}},
+            {"model_name": "ollama/mistral:latest", "litellm_params": {}},
+        ],
+    }
+    cache, default_policy, model_policies = cache_from_config(config)
+    assert cache.max_entries == 5
+    assert default_policy.ttl_seconds == 100
+    assert model_policies["vertex_ai/gemini-1.5-flash"].max_temperature == 0.3
+    assert model_policies["vertex_ai/gemini-1.5-flash"].ttl_seconds == 100
+    assert "ollama/mistral:latest" not in model_policies
+
+
+def test_cache_directives():
+    assert cache_directives("No-Cache, max-age=0") == {"no-cache", "max-age=0"}
+    assert cache_directives(None) == set()
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from proxy.retry import RetryPolicy, retry_after_seconds
+
+
+def test_retries_with_retry_after_until_success():
+    policy = RetryPolicy(max_attempts=3, base_delay_seconds=0.001, max_delay_seconds=0.001)
+    attempts = []
+    outcomes = []
+
+    async def call(attempt):
+        attempts.append(attempt)
+        if attempt < 3:
+            raise HTTPException(status_code=429, headers={"Retry-After": "0.01"})
+        return "ok"
+
+    result = asyncio.run(policy.run(call, lambda outcome, error, attempt, delay: outcomes.append((outcome, delay))))
+    assert result == "ok"
+    assert attempts == [1, 2, 3]
+    assert outcomes == [("retried", 0.01), ("retried", 0.01)]
+    assert policy.stats()["budget"]["spent"] == 2
+
+
+def test_client_errors_are_not_retried():
+    policy = RetryPolicy()
+    attempts = []
+
+    async def call(attempt):
+        attempts.append(attempt)
+        raise HTTPException(status_code=400)
+
+    with pytest.raises(HTTPException):
+        asyncio.run(policy.run(call))
+    assert attempts == [1]
+
+
+def test_deadline_and_long_retry_after_stop_retries():
+    policy = RetryPolicy(max_attempts=5, deadline_seconds=1.0, max_retry_after_seconds=10)
+    for retry_after, reason in (("5", "deadline"), ("60", "retry_after_too_long")):
+        error = HTTPException(status_code=503, headers={"Retry-After": retry_after})
+        assert policy.next_delay(error, 1, elapsed=0.0) == (None, reason)
+    assert retry_after_seconds(HTTPException(status_code=503, headers={"Retry-After": "soon"})) is None
+
+
+def test_budget_caps_retries_at_a_share_of_requests():
+    policy = RetryPolicy(max_attempts=2, base_delay_seconds=0, budget_ratio=0.1)
+
+    async def call(attempt):
+        raise HTTPException(status_code=503)
+
+    async def run():
+        for _ in range(100):
+            with pytest.raises(HTTPException):
+                await policy.run(call)
+
+    asyncio.run(run())
+    stats = policy.stats()
+    # 10 tokens to start with plus 0.1 per request
+    assert stats["retried"] == stats["budget"]["spent"] <= 20
+    assert stats["budget_exhausted"] == 100 - stats["retried"]
@@ -0,0 +1,41 @@
+import json
+
+import pytest
+from pydantic import ValidationError
+
+from proxy.keys import canonical_key
+from proxy.serialization import dumps, loads, normalize_completion, parse_chat_request
+
+
+def test_parses_tool_call_history_in_one_pass():
+    body = json.dumps({
+        "model": "gemini-1.5-pro",
+        "messages": [
+            {"role": "user", "content": "weather?"},
+            {"role": "assistant", "content": None,
+             "tool_calls": [{"id": "c1", "type": "function", "function": {"name": "w", "arguments": "{}"}}]},
+            {"role": "tool", "tool_call_id": "c1", "content": "sunny"},
+        ],
+        "tool_choice": {"type": "function", "function": {"name": "w"}},
+        "max_tokens": 10,
+    }).encode()
+    request = parse_chat_request(body)
+    assert request.messages[1]["tool_calls"][0]["id"] == "c1"
+    assert request.model_extra == {"max_tokens": 10}
+
+    with pytest.raises(ValidationError):
+        parse_chat_request(b'{"messages": "nope"}')
+    with pytest.raises(ValidationError):
+        parse_chat_request(b"{not json")
+
+
+def test_normalize_completion_fills_openai_defaults():
+    data = normalize_completion({"choices": [{"message": {"content": "hi"}}]}, "gemini-1.5-pro")
+    assert data["model"] == "gemini-1.5-pro" and data["object"] == "chat.completion"
+    assert data["choices"][0] == {"finish_reason": "stop", "message": {"content": "hi", "role": "assistant"}}
+
+
+def test_dumps_round_trips_and_keys_are_order_independent():
+    payload = {"b": [1, 2, {"é": None}], "a": 1.5}
+    assert loads(dumps(payload)) == payload
+    assert canonical_key({"a": 1, "b": {"x": 1, "y": 2}}) == canonical_key({"b": {"y": 2, "x": 1}, "a": 1})
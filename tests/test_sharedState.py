@@ -0,0 +1,109 @@
+import sqlite3
+import time
+
+import pytest
+
+from proxy.circuit_breaker import CircuitBreaker
+from proxy.rate_limit import RateLimiter, RateLimitExceeded
+from proxy.shared_state import BreakerSync, SharedBuckets, SharedResponseCache, SharedStore
+
+
+class FakeDeployment:
+    def __init__(self):
+        self.breaker = CircuitBreaker(min_requests=1, cooldown_seconds=30)
+
+
+def test_cache_entries_are_visible_to_every_worker(tmp_path):
+    path = str(tmp_path / "state.db")
+    first = SharedResponseCache(SharedStore(path), max_entries=2)
+    second = SharedResponseCache(SharedStore(path), max_entries=2)
+
+    first.set("a", b"alpha", ttl=60)
+    assert second.get("a") == b"alpha"
+    second.set("b", b"beta", ttl=60)
+    first.get("a")  # b is now the least recently used
+    first.set("c", b"gamma", ttl=60)
+    assert second.get("b") is None
+    assert first.stats()["entries"] == len(second) == 2
+    assert first.stats()["bytes"] == len(b"alpha") + len(b"gamma")
+
+    second.set("d", b"delta", ttl=-1)
+    assert first.get("d") is None and first.expirations == 1
+
+
+def test_rate_limits_hold_across_workers(tmp_path):
+    path = str(tmp_path / "state.db")
+    config = {"rate_limits": {"default_key": {"rpm": 2, "tpm": 1000}}}
+    workers = [RateLimiter(config, shared=SharedBuckets(SharedStore(path))) for _ in range(2)]
+
+    reservation = workers[0].acquire("sk-a", "m", 100)
+    workers[1].acquire("sk-a", "m", 100)
+    with pytest.raises(RateLimitExceeded) as rejected:
+        workers[0].acquire("sk-a", "m", 100)
+    assert rejected.value.retry_after > 0
+    assert workers[1].acquire("sk-b", "m", 100) is not None
+
+    # Real usage above the estimate is charged to the shared token bucket
+    RateLimiter.reconcile(reservation, {"total_tokens": 900})
+    with pytest.raises(RateLimitExceeded):
+        workers[1].acquire("sk-a", "m", 200)
+    assert workers[0].stats()["buckets"] == 4
+
+
+def test_breaker_openings_are_shared(tmp_path):
+    path = str(tmp_path / "state.db")
+    first, second = {"d#0": FakeDeployment()}, {"d#0": FakeDeployment()}
+    sync_first = BreakerSync(SharedStore(path), first)
+    sync_second = BreakerSync(SharedStore(path), second)
+    sync_first.worker, sync_second.worker = 1, 2
+
+    first["d#0"].breaker.record_failure()
+    assert first["d#0"].breaker.state == "open"
+    sync_first.sync()
+    sync_second.sync()
+    assert second["d#0"].breaker.state == "open"
+    assert 29 < second["d#0"].breaker.retry_after() <= 30
+    assert not second["d#0"].breaker.allow()
+
+    # The adopted opening is not published back, and nothing is adopted twice
+    sync_second.sync()
+    sync_first.sync()
+    assert sync_first.adopted == 0 and sync_second.adopted == 1
+
+
+def test_breaker_cooldown_elapsed_is_not_adopted(tmp_path):
+    path = str(tmp_path / "state.db")
+    first, second = {"d#0": FakeDeployment()}, {"d#0": FakeDeployment()}
+    sync_first = BreakerSync(SharedStore(path), first)
+    sync_second = BreakerSync(SharedStore(path), second)
+    sync_first.worker, sync_second.worker = 1, 2
+
+    first["d#0"].breaker.record_failure()
+    first["d#0"].breaker.opened_at = time.monotonic() - 60
+    sync_first.sync()
+    sync_second.sync()
+    assert second["d#0"].breaker.state == "closed"
+
+
+def test_locked_database_fails_open_without_stalling(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = SharedStore(path, busy_timeout=0.01)
+    cache, buckets = SharedResponseCache(store), SharedBuckets(store)
+    cache.set("a", b"alpha", ttl=60)
+    assert buckets.take([("key:k:tpm", 100, 10)]) == 0.0
+
+    # Another worker holds the write lock
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    started = time.perf_counter()
+    assert cache.get("a") == b"alpha"  # readers aren't blocked, and hits don't write
+    cache.set("b", b"beta", ttl=60)
+    assert buckets.take([("key:k:tpm", 100, 95)]) == 0.0
+    buckets.charge(["key:k:tpm"], 50)
+    assert time.perf_counter() - started < 0.5
+    assert store.errors == 3
+    other.execute("ROLLBACK")
+
+    # The usage correction is written with the next take, so the bucket is now short
+    assert cache.get("b") is None
+    assert buckets.take([("key:k:tpm", 100, 50)]) > 0
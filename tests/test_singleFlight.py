@@ -0,0 +1,151 @@
+import asyncio
+import time
+
+import pytest
+
+from proxy.cancellation import DeadlineExceeded, current_deadline, remaining, within_deadline, without_deadline
+from proxy.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_result():
+    calls = 0
+
+    async def upstream():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"answer": 42}
+
+    async def run():
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.do("k", upstream) for _ in range(10)))
+        return flight, results
+
+    flight, results = asyncio.run(run())
+    assert calls == 1
+    assert all(r == {"answer": 42} for r in results)
+    assert flight.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 9, "overflow": 0}
+
+
+def test_errors_reach_every_waiter():
+    async def upstream():
+        await asyncio.sleep(0.01)
+        raise ValueError("quota exceeded")
+
+    async def run():
+        flight = SingleFlight()
+        return await asyncio.gather(*(flight.do("k", upstream) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, ValueError) and str(r) == "quota exceeded" for r in results)
+
+
+def test_waiter_limit_starts_extra_calls():
+    calls = 0
+
+    async def upstream():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    async def run():
+        flight = SingleFlight(max_waiters=2)
+        await asyncio.gather(*(flight.do("k", upstream) for _ in range(4)))
+        return flight
+
+    flight = asyncio.run(run())
+    assert calls == 3
+    assert flight.overflow == 2
+
+
+def test_cancelled_waiter_does_not_cancel_others():
+    async def upstream():
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async def run():
+        flight = SingleFlight()
+        first = asyncio.create_task(flight.do("k", upstream))
+        second = asyncio.create_task(flight.do("k", upstream))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == "ok"
+
+
+def test_stream_chunks_fan_out_to_late_joiners():
+    opened = 0
+
+    async def chunks():
+        for i in range(3):
+            await asyncio.sleep(0.01)
+            yield i
+
+    async def upstream():
+        nonlocal opened
+        opened += 1
+        return chunks()
+
+    async def consume(flight, delay):
+        await asyncio.sleep(delay)
+        return [chunk async for chunk in await flight.stream("k", upstream)]
+
+    async def run():
+        flight = SingleFlight()
+        return await asyncio.gather(consume(flight, 0), consume(flight, 0.015))
+
+    assert asyncio.run(run()) == [[0, 1, 2], [0, 1, 2]]
+    assert opened == 1
+
+
+def test_stream_errors_reach_every_subscriber():
+    async def chunks():
+        yield "first"
+        await asyncio.sleep(0.01)
+        raise ConnectionError("upstream reset")
+
+    async def upstream():
+        return chunks()
+
+    async def consume(flight):
+        received = []
+        with pytest.raises(ConnectionError):
+            async for chunk in await flight.stream("k", upstream):
+                received.append(chunk)
+        return received
+
+    async def run():
+        flight = SingleFlight()
+        return await asyncio.gather(consume(flight), consume(flight))
+
+    assert asyncio.run(run()) == [["first"], ["first"]]
+
+
+def test_waiters_keep_their_own_deadlines():
+    seen = []
+
+    async def upstream():
+        seen.append(remaining())
+        await asyncio.sleep(0.1)
+        return "answer"
+
+    async def caller(flight, seconds):
+        current_deadline.set(time.monotonic() + seconds if seconds else None)
+        return await within_deadline(flight.do("k", lambda: without_deadline(upstream())))
+
+    async def run():
+        flight = SingleFlight()
+        leader = asyncio.ensure_future(caller(flight, 0.02))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(caller(flight, None))
+        return await asyncio.gather(leader, follower, return_exceptions=True)
+
+    leader, follower = asyncio.run(run())
+    # The leader's deadline neither reaches the shared call nor cuts the follower short
+    assert seen == [None]
+    assert isinstance(leader, DeadlineExceeded)
+    assert follower == "answer"
@@ -0,0 +1,79 @@
+import asyncio
+import io
+import json
+
+from proxy.log import RequestIdMiddleware, StructuredLogger, current_request_id
+
+
+def records(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_writes_in_background_with_request_id():
+    stream = io.StringIO()
+    logger = StructuredLogger(stream, flush_interval=0.01)
+
+    async def run():
+        await logger.start()
+        current_request_id.set("req-1")
+        logger.info("hello", authorization="Bearer sk-secret", note="x" * 20)
+        # Queued, not yet written by the request
+        assert stream.getvalue() == ""
+        await asyncio.sleep(0.05)
+        logger.error("late")
+        await logger.close()
+
+    logger.configure(max_field_chars=5, flush_interval=0.01)
+    asyncio.run(run())
+    first, second = records(stream)
+    assert first["event"] == "hello" and first["request_id"] == "req-1"
+    assert first["authorization"] == "[redacted]"
+    assert first["note"] == "xxxxx...[15 chars truncated]"
+    assert second["event"] == "late"
+
+
+def test_levels_sampling_and_drops():
+    stream = io.StringIO()
+    logger = StructuredLogger(stream, level="info", sample_rates={"warning": 0.0}, max_queue=2)
+    logger.debug("hidden")
+    logger.warning("sampled away")
+    logger.info("direct")  # no writer running: written immediately
+    assert [r["event"] for r in records(stream)] == ["direct"]
+
+    async def run():
+        await logger.start()
+        for _ in range(5):
+            logger.info("burst")
+        stats = logger.stats()
+        await logger.close()
+        return stats
+
+    assert asyncio.run(run()) == {"queue_depth": 2, "dropped": 3}
+
+
+def test_payload_modes():
+    messages = [{"role": "user", "content": "a" * 10}]
+    assert StructuredLogger().payload(messages) == [{"role": "user", "chars": 10}]
+    assert StructuredLogger(payload_mode="truncate", max_field_chars=4).payload(messages) == \
+        [{"role": "user", "content": "aaaa...[6 chars truncated]"}]
+    assert StructuredLogger(payload_mode="full").payload(messages) == messages
+
+
+def test_middleware_sets_and_returns_request_id():
+    seen = []
+    sent = []
+
+    async def app(scope, receive, send):
+        seen.append(current_request_id.get())
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+
+    async def send(message):
+        sent.append(message)
+
+    async def run(headers):
+        await RequestIdMiddleware(app)({"type": "http", "headers": headers}, None, send)
+
+    asyncio.run(run([(b"x-request-id", b"abc")]))
+    asyncio.run(run([]))
+    assert seen[0] == "abc" and len(seen[1]) == 32
+    assert (b"x-request-id", b"abc") in sent[0]["headers"]
@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from proxy.token_manager import TokenManager
+
+
+class FakeCredentials:
+    """Mimics google.auth credentials: refresh() blocks and sets token/expiry."""
+
+    def __init__(self, lifetime: float, refresh_delay: float = 0.0, fail: bool = False):
+        self.lifetime = lifetime
+        self.refresh_delay = refresh_delay
+        self.fail = fail
+        self.token = None
+        self.expiry = None
+        self.refresh_calls = 0
+        self.threads = set()
+
+    def refresh(self, request):
+        self.threads.add(threading.get_ident())
+        time.sleep(self.refresh_delay)
+        if self.fail:
+            raise RuntimeError("metadata server unavailable")
+        self.refresh_calls += 1
+        self.token = f"token-{self.refresh_calls}"
+        self.expiry = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(seconds=self.lifetime)
+
+
+def test_concurrent_callers_share_one_slow_refresh():
+    credentials = FakeCredentials(lifetime=3600, refresh_delay=0.05)
+
+    async def run():
+        manager = TokenManager(credentials, request=None)
+        tokens = await asyncio.gather(*(manager.get_token() for _ in range(20)))
+        return manager, tokens
+
+    manager, tokens = asyncio.run(run())
+    assert credentials.refresh_calls == 1
+    assert set(tokens) == {"token-1"}
+    assert threading.get_ident() not in credentials.threads
+    assert manager.stats()["refreshes"] == 1
+    assert manager.stats()["last_refresh_seconds"] >= 0.05
+
+
+def test_hot_path_serves_cached_token_without_refresh():
+    credentials = FakeCredentials(lifetime=3600)
+
+    async def run():
+        manager = TokenManager(credentials, request=None)
+        await manager.start()
+        for _ in range(100):
+            assert await manager.get_token() == "token-1"
+        await manager.close()
+
+    asyncio.run(run())
+    assert credentials.refresh_calls == 1
+
+
+def test_background_refresh_runs_ahead_of_expiry():
+    # Tokens live 0.3s and are refreshed 0.2s early, so the loop renews roughly every 0.1s
+    credentials = FakeCredentials(lifetime=0.3)
+
+    async def run():
+        manager = TokenManager(credentials, request=None, refresh_skew=0.2)
+        await manager.start()
+        await asyncio.sleep(0.35)
+        token = await manager.get_token()
+        await manager.close()
+        return token
+
+    token = asyncio.run(run())
+    assert credentials.refresh_calls >= 3
+    assert token == f"token-{credentials.refresh_calls}"
+
+
+def test_refresh_failures_are_counted_and_raised():
+    credentials = FakeCredentials(lifetime=3600, fail=True)
+
+    refreshes = []
+
+    async def run():
+        manager = TokenManager(credentials, request=None,
+                               on_refresh=lambda seconds, error: refreshes.append((seconds, error)))
+        with pytest.raises(RuntimeError):
+            await manager.get_token()
+        credentials.fail = False
+        await manager.get_token()
+        return manager
+
+    manager = asyncio.run(run())
+    stats = manager.stats()
+    assert stats["refresh_failures"] == 1 and stats["refreshes"] == 1
+    assert stats["last_error"] is None
+    assert [str(error) if error else None for _, error in refreshes] == ["metadata server unavailable", None]
+    assert all(seconds >= 0 for seconds, _ in refreshes)
+
+
+def test_credentials_are_discovered_on_first_refresh():
+    credentials = FakeCredentials(lifetime=3600)
+    discovered = []
+
+    def discover():
+        discovered.append(threading.get_ident())
+        return credentials, None
+
+    async def run():
+        manager = TokenManager(discover=discover)
+        await manager.start()
+        assert not discovered and not manager.ready
+        tokens = await asyncio.gather(*(manager.get_token() for _ in range(5)))
+        ready = manager.ready
+        await manager.close()
+        return tokens, ready
+
+    tokens, ready = asyncio.run(run())
+    assert set(tokens) == {"token-1"} and ready
+    assert len(discovered) == 1 and threading.get_ident() not in discovered
@@ -0,0 +1,73 @@
+import asyncio
+
+from proxy.tracing import TraceExporter, current_trace, exporter_from_config
+
+
+class FakeLangfuse:
+    def __init__(self):
+        self.traces = []
+        self.generations = []
+        self.flushed = False
+
+    def trace(self, **event):
+        self.traces.append(event)
+
+    def generation(self, **event):
+        self.generations.append(event)
+
+    def flush(self):
+        self.flushed = True
+
+
+def test_exports_in_background_and_flushes_on_close():
+    langfuse = FakeLangfuse()
+    exporter = TraceExporter(langfuse, flush_interval=0.01, max_payload_chars=5)
+
+    async def run():
+        await exporter.start()
+        trace = exporter.start_trace("proxy", "m", "key", input=[{"role": "user", "content": "hello world"}])
+        current_trace.set(trace)
+        exporter.generation(name="gen", output="abcdefghij", usage={"total_tokens": 3})
+        exporter.end_trace(trace, output="ok", metadata={"cache": "hit"})
+        # Nothing is sent to Langfuse from the request itself
+        assert langfuse.traces == [] and langfuse.generations == []
+        await asyncio.sleep(0.05)
+        assert len(langfuse.traces) == 1
+        await exporter.close()
+        return trace
+
+    trace = asyncio.run(run())
+    assert langfuse.flushed
+    assert langfuse.traces[0]["input"] == [{"role": "user", "content": "hello...[6 chars truncated]"}]
+    assert langfuse.traces[0]["metadata"] == {"cache": "hit"}
+    generation = langfuse.generations[0]
+    assert generation["trace_id"] == trace.id and generation["output"] == "abcde...[5 chars truncated]"
+    assert exporter.stats()["exported"] == 2
+
+
+def test_full_queue_drops_instead_of_blocking():
+    exporter = TraceExporter(FakeLangfuse(), max_queue=2)
+    trace = exporter.start_trace("proxy", "m", None)
+    for _ in range(5):
+        exporter.generation(trace, output="x")
+    stats = exporter.stats()
+    assert stats["queue_depth"] == 2 and stats["dropped"] == 3
+
+
+def test_sampling_and_hashing():
+    config = {
+        "model_list": [{"model_name": "quiet", "litellm_params": {"model": "quiet"}, "tracing": {"sample_rate": 0}}],
+        "tracing": {"payload_mode": "hash", "keys": {"batch-key": {"sample_rate": 0}}},
+    }
+    exporter = exporter_from_config(FakeLangfuse(), config)
+    assert exporter.start_trace("proxy", "quiet", "k") is None
+    assert exporter.start_trace("proxy", "loud", "batch-key") is None
+    trace = exporter.start_trace("proxy", "loud", "k", input=[{"role": "user", "content": "secret"}])
+    assert trace.input[0]["content"].startswith("sha256:") and "secret" not in trace.input[0]["content"]
+    assert exporter.stats()["sampled_out"] == 2
+
+    disabled = exporter_from_config(FakeLangfuse(), {"tracing": {"enabled": False}})
+    assert disabled.start_trace("proxy", "loud", "k") is None
+    # Without a current trace, generations are not recorded
+    disabled.generation(output="x")
+    assert disabled.stats()["queued"] == 0
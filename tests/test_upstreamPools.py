@@ -0,0 +1,42 @@
+import asyncio
+
+from proxy.http_client import UpstreamHTTPClient, deployment_origin
+
+
+def test_deployment_origins():
+    assert deployment_origin("vertex_ai/gemini-1.5-pro", region="us-east4") == "https://us-east4-aiplatform.googleapis.com"
+    assert deployment_origin("ollama/mistral:latest", "http://gpu-box:11434/api") == "http://gpu-box:11434"
+    assert deployment_origin("openai/gpt-4o") is None
+
+
+def test_prewarm_opens_idle_connections_and_records_waits():
+    async def run():
+        connections = []
+
+        async def handle(reader, writer):
+            connections.append(writer)
+            while await reader.readuntil(b"\r\n\r\n"):
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n")
+                await writer.drain()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        origin = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+        waits = []
+        client = UpstreamHTTPClient(origins=[origin], prewarm_connections=3)
+        client.on_wait = lambda upstream, seconds: waits.append(upstream)
+        await client.start()
+        try:
+            await client._task
+            pool = client.stats()[origin]
+            # A request reuses a warm connection instead of opening a fourth
+            await client.client.get(origin + "/v1/models")
+            return len(connections), pool, client.stats()[origin], waits
+        finally:
+            await client.close()
+            server.close()
+
+    opened, warm, after, waits = asyncio.run(run())
+    assert opened == 3
+    assert warm["idle"] == 3 and warm["active"] == 0
+    assert after["requests"] == 4 and after["idle"] == 3
+    assert len(waits) == 4
@@ -0,0 +1,46 @@
+import asyncio
+import threading
+import time
+
+from proxy.warmup import Warmup
+
+
+def test_requests_wait_for_warmup_while_the_loop_keeps_running():
+    threads = []
+
+    def slow_import():
+        threads.append(threading.get_ident())
+        time.sleep(0.1)
+
+    async def attach():
+        threads.append(threading.get_ident())
+
+    async def run():
+        warmup = Warmup([("import", slow_import), ("attach", attach)])
+        await warmup.start()
+        ticks = 0
+        waiter = asyncio.create_task(warmup.wait())
+        while not waiter.done():
+            ticks += 1
+            await asyncio.sleep(0.01)
+        return warmup, ticks
+
+    warmup, ticks = asyncio.run(run())
+    assert warmup.ready and ticks >= 5
+    assert threads[0] != threading.get_ident() and threads[1] == threading.get_ident()
+    assert set(warmup.stats()["step_seconds"]) == {"import", "attach"}
+
+
+def test_failed_step_leaves_warmup_not_ready():
+    def broken():
+        raise ImportError("No module named 'litellm'")
+
+    async def run():
+        warmup = Warmup([("litellm", broken), ("after", lambda: None)])
+        await warmup.wait()
+        return warmup
+
+    warmup = asyncio.run(run())
+    assert warmup.done.is_set() and not warmup.ready
+    assert warmup.stats()["errors"] == {"litellm": "No module named 'litellm'"}
+    assert "after" in warmup.durations